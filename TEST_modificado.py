@@ -11,15 +11,22 @@ import tkinter as tk
 from tkinter import Scale, filedialog, ttk
 from PIL import Image, ImageTk
 import cv2
+import cv2.aruco as aruco
+from captura import CameraCapture
+from reproduccion import VideoReplay
+from planificador import FPS_VISUALIZACION, FrameScheduler
+from detector_aruco import detect_markers
+from conteo import MIN_AREA_MANCHA, UMBRAL_ALTO, UMBRAL_BAJO, blob_mask, draw_blobs
+from grilla import ROI_MARGEN, crop, draw_grid_lines, roi_bounds
+from rectificacion import MARCADORES_ESQUINA
+from matriz_canvas import StatusMatrix
+from estacion_conteo import (BG_COLOR, BUTTON_COLOR, FRAME_COLOR, TEXT_COLOR, CountingStation,
+                             build_processing_options, build_viewers, connect_status_matrix)
 import numpy as np
+import time
 
 # --- CONSTANTES Y VARIABLES GLOBALES ---
-# Define los colores de la interfaz, parámetros de detección y variables
-BG_COLOR = "#2E2E2E"
-TEXT_COLOR = "#FFFFFF"
-BUTTON_COLOR = "#424242"
-FRAME_COLOR = "#212121"
-MIN_AREA_MANCHA = 200
+# Los colores de la interfaz y lo que comparte con la otra interfaz de conteo están en estacion_conteo.py.
 
 capture = None
 is_camera_running = False
@@ -31,8 +38,13 @@ grid_width_var = None
 grid_height_var = None
 rows_var = None
 cols_var = None
-status_grid_frame = None
-status_labels = {}  # Aseguramos que esta variable global esté inicializada
+roi_var = None
+roi_margin_var = None
+status_matrix = None
+estacion = CountingStation()  # Tiempos, métricas, caché del conteo, ocupación, rectificación y registro
+metricas_estacion, timer, pipeline = estacion.metrics, estacion.timer, estacion.pipeline
+occupancy, deteccion, rectifier, registro = estacion.occupancy, estacion.detection, estacion.rectifier, estacion.recorder
+ultima_deteccion = None  # (roi, umbralizada, etiquetas, manchas) de la última detección
 
 # =================================================================================
 # === FUNCIONES DE LÓGICA Y PROCESAMIENTO ===
@@ -45,30 +57,35 @@ def control_camara(iniciar=True):
     if iniciar:
         if is_camera_running: return
         for i in [1]:
-            capture = cv2.VideoCapture(i)
-            if capture.isOpened(): break
-        if not capture or not capture.isOpened():
+            capture = CameraCapture(i, flip=True)
+            if capture.start(): break
+        if not capture or not capture.is_running():
             print("ADVERTENCIA: No se pudo acceder a la cámara.")
             return
         is_camera_running = True
-        btn_start.config(state="disabled"); btn_stop.config(state="normal"); btn_load.config(state="disabled")
-        update_frame()
+        btn_start.config(state="disabled"); btn_stop.config(state="normal"); btn_load.config(state="disabled"); btn_video.config(state="disabled")
+        video_scheduler.start()
     else:
         is_camera_running = False
-        if capture: capture.release()
-        btn_start.config(state="normal"); btn_stop.config(state="disabled"); btn_load.config(state="normal")
+        video_scheduler.stop()
+        if capture: capture.stop()
+        btn_start.config(state="normal"); btn_stop.config(state="disabled"); btn_load.config(state="normal"); btn_video.config(state="normal")
 
 # --- Bucle de Video en Tiempo Real ---
-# Función recursiva que se ejecuta continuamente para leer frames de la cámara
-# y mantener la imagen de video actualizada en la interfaz.
+# Función que video_scheduler ejecuta a FPS_VISUALIZACION vueltas por segundo para leer
+# frames de la cámara y mantener la imagen de video actualizada en la interfaz. El
+# planificador descuenta el tiempo de proceso y, si no alcanza, salta ciclos.
 def update_frame():
     global source_image
     if is_camera_running:
-        ret, frame = capture.read()
-        if ret:
-            source_image = cv2.flip(frame, 1)
-            process_frame(source_image)
-        ventana.after(20, update_frame)
+        if not capture.is_running(): control_camara(iniciar=False); return # Terminó el video reproducido.
+        # El hilo de captura entrega sólo el frame más nuevo (ya volteado); si no hay
+        # uno nuevo desde la última vuelta, no se reprocesa el anterior.
+        frame, timestamp = capture.read()
+        if frame is not None:
+            timer.record("captura", (time.time() - timestamp) * 1000.0) # Antigüedad del frame al procesarlo
+            source_image = frame
+            process_frame(source_image, detectar=deteccion.due(), inmediato=False)
 
 # --- Carga de Imagen Estática ---
 # Abre un explorador de archivos para que el usuario seleccione una imagen del disco
@@ -80,43 +97,74 @@ def cargar_imagen():
         source_image = cv2.imread(path_image)
         if source_image is not None: process_frame(source_image)
 
+# --- Reproducción de Video Grabado ---
+# Usa un archivo de video en lugar de la cámara, a la velocidad elegida. Los frames que
+# no alcanzan a mostrarse se saltan sin decodificarlos (ver reproduccion.py).
+VELOCIDADES_VIDEO = {"1x": 1.0, "2x": 2.0, "4x": 4.0, "8x": 8.0, "Máx": None}
+
+def cargar_video():
+    global capture, is_camera_running
+    path_video = filedialog.askopenfilename(filetypes=[("Archivos de video", "*.mp4 *.avi *.mkv *.mov")])
+    if not path_video: return
+    if is_camera_running: control_camara(iniciar=False)
+    capture = VideoReplay(path_video, speed=VELOCIDADES_VIDEO[velocidad_var.get()])
+    if not capture.start():
+        print("ADVERTENCIA: No se pudo abrir el video.")
+        return
+    is_camera_running = True
+    btn_start.config(state="disabled"); btn_stop.config(state="normal"); btn_load.config(state="disabled"); btn_video.config(state="disabled")
+    video_scheduler.start()
+
 # --- Procesamiento de Imagen ---
 # Núcleo del programa. Aplica una secuencia de filtros de OpenCV (escala de grises,
-# desenfoque, umbralización) para detectar los contornos de los objetos, los filtra
-# por área para eliminar ruido y finalmente dibuja los resultados sobre las imágenes.
-def process_frame(frame):
-    gray = cv2.cvtColor(frame, cv2.COLOR_BGR2GRAY)
-    blurred = cv2.GaussianBlur(gray, (7, 7), 0)
-    thresholded = cv2.inRange(blurred, slider_umbral_up.get(), slider_umbral_down.get())
-    contours, _ = cv2.findContours(thresholded, cv2.RETR_EXTERNAL, cv2.CHAIN_APPROX_SIMPLE)
-    manchas_reales = [c for c in contours if cv2.contourArea(c) > MIN_AREA_MANCHA]
-    lbl_conteo.config(text=f"MANCHAS ENCONTRADAS: {len(manchas_reales)}")
-    img_entrada_con_resultados = frame.copy()
-    img_umbral_con_resultados = cv2.cvtColor(thresholded, cv2.COLOR_GRAY2RGB)
-
-    # Lógica de la grilla
-    matriz_estado = check_grid_status(img_entrada_con_resultados, manchas_reales)
-    update_status_grid(matriz_estado)
-    draw_grid_on_frame(img_entrada_con_resultados)
-
-    for i, c in enumerate(manchas_reales):
-        cv2.drawContours(img_umbral_con_resultados, [c], -1, (0, 255, 0), 2)
-        x, y, w, h = cv2.boundingRect(c)
-        cv2.rectangle(img_entrada_con_resultados, (x, y), (x + w, y + h), (0, 255, 0), 2)
-        M = cv2.moments(c)
-        cX = int(M["m10"] / M["m00"]) if M["m00"] != 0 else x
-        cY = int(M["m01"] / M["m00"]) if M["m00"] != 0 else y
-        cv2.putText(img_entrada_con_resultados, str(i + 1), (cX - 10, cY + 10), cv2.FONT_HERSHEY_TRIPLEX, 1, (0, 0, 255), 2)
-        cv2.putText(img_umbral_con_resultados, str(i + 1), (cX - 10, cY + 10), cv2.FONT_HERSHEY_TRIPLEX, 1, (0, 0, 255), 2)
-    display_image(img_entrada_con_resultados, lbl_original)
-    display_image(img_umbral_con_resultados, lbl_umbralizada)
+# desenfoque, umbralización) para detectar los objetos, los filtra por área para
+# eliminar ruido y finalmente dibuja los resultados sobre las imágenes. Todo lo que
+# viene después de la umbralización lee la misma tabla de manchas (área, bbox, centroide).
+# Con detectar=False se dibuja la última detección sobre el frame nuevo (ver RateGate).
+# Sólo el stream de la cámara o del video pasa inmediato=False: una imagen fija o un
+# parámetro cambiado a mano se procesan una sola vez, así que la matriz de estado se
+# actualiza sin el antirrebote de varios frames (si no, seguiría mostrando la imagen anterior).
+def process_frame(frame, detectar=True, inmediato=True):
+    global ultima_deteccion
+    if rectificar_var.get() and rectifier.ready:
+        with timer.stage("rectificacion"):
+            frame = rectifier.rectify(frame) # Todo lo que sigue trabaja sobre la imagen rectificada, más chica
+    if detectar or ultima_deteccion is None or ultima_deteccion[1].shape[:2] != crop(frame, ultima_deteccion[0]).shape[:2]:
+        roi = get_roi(frame)
+        thresholded, labels, manchas_reales = pipeline.blobs(frame, slider_umbral_up.get(), slider_umbral_down.get(), MIN_AREA_MANCHA, roi)
+        lbl_conteo.config(text=f"MANCHAS ENCONTRADAS: {len(manchas_reales)}")
+        metricas_estacion.set("vision_blobs", len(manchas_reales))
+
+        # Lógica de la grilla
+        matriz_estado = check_grid_status(frame, roi)
+        registro.record(matriz_estado) # No hace nada si el registro está desactivado
+        with timer.stage("matriz"):
+            occupancy.update(matriz_estado, immediate=inmediato) # Los suscriptores (matriz, relleno) sólo reciben los cambios reales
+        ocupadas = int(np.count_nonzero(occupancy.state))
+        metricas_estacion.set("vision_cells", ocupadas, state="occupied"); metricas_estacion.set("vision_cells", occupancy.state.size - ocupadas, state="empty")
+        ultima_deteccion = (roi, thresholded, labels, manchas_reales)
+    else:
+        roi, thresholded, labels, manchas_reales = ultima_deteccion
+
+    with timer.stage("dibujo"):
+        img_entrada_con_resultados = frame.copy()
+        # En modo ROI la imagen umbralizada sólo cubre la región procesada; se ubica en su
+        # lugar dentro de una imagen negra del tamaño del frame.
+        img_umbral_con_resultados = np.zeros(frame.shape[:2] + (3,), dtype=np.uint8)
+        region_umbral = crop(img_umbral_con_resultados, roi)
+        cv2.cvtColor(thresholded, cv2.COLOR_GRAY2RGB, dst=region_umbral)
+        draw_grid_on_frame(img_entrada_con_resultados)
+        if roi is not None: cv2.rectangle(img_entrada_con_resultados, roi[:2], roi[2:], (128, 128, 128), 1)
+        region_umbral[blob_mask(labels, manchas_reales)] = (0, 255, 0)
+        draw_blobs(img_entrada_con_resultados, img_umbral_con_resultados, manchas_reales)
+        timer.draw_overlay(img_entrada_con_resultados)
+    with timer.stage("visualizacion"):
+        visor_imagenes.show(img_entrada_con_resultados, img_umbral_con_resultados)
+    timer.tick()
 
 # --- Funciones de la grilla
 def setup_status_grid():
-    global status_labels
-    if status_grid_frame is None: return
-    for widget in status_grid_frame.winfo_children(): widget.destroy()
-    status_labels = {}
+    if status_matrix is None: return
     try:
         rows = int(rows_var.get())
         cols = int(cols_var.get())
@@ -126,16 +174,34 @@ def setup_status_grid():
         rows, cols = 3, 2
         rows_var.set(rows)
         cols_var.set(cols)
-    
-    for r in range(rows):
-        status_grid_frame.rowconfigure(r, weight=1)
-        for c in range(cols):
-            status_grid_frame.columnconfigure(c, weight=1)
-            lbl = tk.Label(status_grid_frame, text="Vacío", bg=FRAME_COLOR, fg="white", relief='sunken', bd=1, wraplength=120)
-            lbl.grid(row=r, column=c, padx=2, pady=2, sticky="nsew")
-            status_labels[(r, c)] = lbl
-
-def check_grid_status(frame, contours):
+    status_matrix.set_geometry(rows, cols) # Sólo reconstruye las celdas si cambió la geometría
+    occupancy.reset() # El próximo frame fija el estado de todas las celdas (y redibuja la matriz)
+
+# --- Rectificación de la estantería ---
+# Fija el cuadrilátero con los cuatro marcadores de referencia visibles en la imagen
+# cruda y ajusta la grilla para que cubra toda la imagen rectificada.
+def fijar_esquinas():
+    if source_image is None: return
+    params = aruco.DetectorParameters()
+    params.cornerRefinementMethod = aruco.CORNER_REFINE_SUBPIX
+    corners, ids = detect_markers(source_image, aruco.getPredefinedDictionary(aruco.DICT_5X5_100), params)
+    if not rectifier.set_quad_from_markers(corners, ids):
+        print(f"ADVERTENCIA: No se encontraron los marcadores de esquina {MARCADORES_ESQUINA}.")
+        return
+    ancho, alto = rectifier.size
+    x_offset_var.set(0); y_offset_var.set(0); grid_width_var.set(ancho); grid_height_var.set(alto)
+    rectificar_var.set(True)
+    process_frame(source_image)
+
+# --- Región de interés ---
+# Con el modo ROI activo, las etapas costosas sólo procesan el rectángulo de la
+# grilla más un margen; las coordenadas de las manchas vuelven al frame completo.
+def get_roi(frame):
+    if roi_var is None or not roi_var.get(): return None
+    return roi_bounds(frame.shape, x_offset_var.get(), y_offset_var.get(),
+                      grid_width_var.get(), grid_height_var.get(), roi_margin_var.get())
+
+def check_grid_status(frame, roi=None):
     global matriz_estado
     try:
         rows = int(rows_var.get())
@@ -144,59 +210,12 @@ def check_grid_status(frame, contours):
     except (tk.TclError, ValueError):
         rows, cols = 3, 2 # Usar valores predeterminados si hay error
     
-    matriz_estado = np.zeros((rows, cols), dtype=int)
-    
     x0, y0 = x_offset_var.get(), y_offset_var.get()
     grid_w, grid_h = grid_width_var.get(), grid_height_var.get()
-
-    if cols == 0 or rows == 0: # Evitar división por cero
-        return matriz_estado
-
-    cell_w, cell_h = grid_w / cols, grid_h / rows
-
-    for c in contours:
-        M = cv2.moments(c)
-        if M["m00"] != 0:
-            cX = int(M["m10"] / M["m00"])
-            cY = int(M["m01"] / M["m00"])
-
-            # Check if centroid is within the grid area
-            if x0 <= cX < x0 + grid_w and y0 <= cY < y0 + grid_h:
-                c_idx = int((cX - x0) / cell_w)
-                r_idx = int((cY - y0) / cell_h)
-
-                if 0 <= r_idx < rows and 0 <= c_idx < cols: # Asegurarse de que los índices estén dentro de los límites
-                    matriz_estado[r_idx, c_idx] = 1
-
+    matriz_estado = pipeline.occupancy(frame, slider_umbral_up.get(), slider_umbral_down.get(), MIN_AREA_MANCHA,
+                                       rows, cols, x0, y0, grid_w, grid_h, roi)
     return matriz_estado
 
-def update_status_grid(matriz_estado):
-    global status_labels
-    
-    current_rows, current_cols = 0, 0
-    if status_grid_frame:
-        try:
-            current_rows = status_grid_frame.grid_size()[0]
-            current_cols = status_grid_frame.grid_size()[1]
-        except Exception:
-            pass # Si el grid no tiene tamaño aún, esto es normal
-
-    new_rows, new_cols = matriz_estado.shape if matriz_estado.ndim == 2 else (0, 0)
-
-    # Si las dimensiones de la matriz de estado son diferentes a las del grid actual, reconstruir el grid
-    if new_rows != current_rows or new_cols != current_cols:
-        setup_status_grid()
-
-    for r in range(new_rows):
-        for c in range(new_cols):
-            text = "Ocupado" if matriz_estado[r, c] == 1 else "Vacío"
-            bg_color = "#4CAF50" if matriz_estado[r, c] == 1 else FRAME_COLOR # Verde para ocupado, gris oscuro para vacío
-            if (r, c) in status_labels:
-                status_labels[(r, c)].config(text=text, bg=bg_color)
-            else:
-                # Esto no debería ocurrir si setup_status_grid() se llama correctamente
-                print(f"Advertencia: Label para ({r}, {c}) no encontrado.")
-
 def draw_grid_on_frame(frame):
     try:
         rows = int(rows_var.get())
@@ -207,45 +226,24 @@ def draw_grid_on_frame(frame):
 
     x0, y0 = x_offset_var.get(), y_offset_var.get()
     grid_w, grid_h = grid_width_var.get(), grid_height_var.get()
-
-    cell_w, cell_h = grid_w / cols, grid_h / rows
-
-    # Dibujar líneas horizontales
-    for r in range(rows + 1):
-        y = int(y0 + r * cell_h)
-        cv2.line(frame, (x0, y), (x0 + grid_w, y), (0, 255, 255), 1) # Color cian para la grilla
-
-    # Dibujar líneas verticales
-    for c in range(cols + 1):
-        x = int(x0 + c * cell_w)
-        cv2.line(frame, (x, y0), (x, y0 + grid_h), (0, 255, 255), 1) # Color cian para la grilla
-
-# --- Visualización de Imagen en GUI ---
-# Convierte una imagen de formato OpenCV a un formato compatible con la librería
-# Tkinter (a través de Pillow) y la muestra en una etiqueta de la interfaz.
-def display_image(img_cv, label):
-    h, w = img_cv.shape[:2]
-    new_width = 500
-    ratio = new_width / float(w)
-    dim = (new_width, int(h * ratio))
-    img_resized = cv2.resize(img_cv, dim, interpolation=cv2.INTER_AREA)
-    img_rgb = cv2.cvtColor(img_resized, cv2.COLOR_BGR2RGB if len(img_resized.shape) == 3 else cv2.COLOR_GRAY2RGB)
-    img_pil = Image.fromarray(img_rgb)
-    img_tk = ImageTk.PhotoImage(image=img_pil)
-    label.configure(image=img_tk)
-    label.image = img_tk
+    draw_grid_lines(frame, rows, cols, x0, y0, grid_w, grid_h) # Color cian para la grilla
 
 # --- Cierre Seguro de la Aplicación ---
 # Se asegura de que la cámara se libere correctamente.
 def on_closing():
     control_camara(iniciar=False)
+    estacion.close() # Tiempos, registro y endpoint de métricas
+    dispatcher.stop()
     ventana.destroy()
 
 # --- Relleno de espacios vacios en la webera ---
-import serial
-import time
+from despacho import COMPLETADO, ERROR, POSICIONES_COB, SIN_RESPUESTA, FillDispatcher
 
-SerialPort1 = serial.Serial(
+# El puerto se abre con el primer rellenado, desde el hilo del despachador: sin el controlador
+# conectado la ventana igual arranca, y el trabajo queda con el error del puerto.
+def abrir_puerto_serie():
+    import serial
+    return serial.Serial(
         port='COM4',
         baudrate=9600,
         bytesize=serial.EIGHTBITS,
@@ -253,42 +251,98 @@ SerialPort1 = serial.Serial(
         stopbits=serial.STOPBITS_ONE,
         timeout=1)
 
+# Texto con que el programa del controlador confirma el fin de un relleno y, si lo informa, una
+# falla. Deben coincidir con lo que escribe el programa cobNN del robot: una respuesta distinta
+# deja el trabajo "sin respuesta" al vencer TIEMPO_RELLENO, y ésos nunca se reintentan solos.
+ACUSE_LISTO = b"Done"
+ACUSE_ERROR = None
+TIEMPO_RELLENO = 60.0
+
+dispatcher = FillDispatcher(open_port=abrir_puerto_serie, ready_token=ACUSE_LISTO, error_token=ACUSE_ERROR, timeout=TIEMPO_RELLENO)
+dispatcher.start()
+
 # --- Relleno Automático ---
+# El relleno reacciona a los eventos de ocupación: una celda entra a la lista cuando se
+# confirma vacía y sale cuando se confirma ocupada, sin releer la matriz completa. Al
+# fijarse el estado (primer frame o nueva geometría) la lista se rehace con las vacías.
 is_filling = False  # Flag global
+vacios_pendientes = set()  # Celdas vacías que aún no tienen un trabajo de relleno
+# Un relleno con falla confirmada (ERROR: el puerto no abrió o el controlador informó el error)
+# se reintenta a los 1, 2 y 4 s; después se deja la celda y el motivo queda en lbl_despacho.
+# Uno SIN_RESPUESTA no se reintenta: el robot pudo haberlo hecho igual.
+MAX_REINTENTOS = 3
+reintentos = {}  # celda -> (intentos fallidos, instante del próximo intento o None)
+ultimo_visto = None  # id del último trabajo terminado ya contabilizado
+aviso_relleno = ""  # Por qué se dejó de reintentar (se muestra en lbl_despacho)
+
+def on_cambio_ocupacion(events):
+    for event in events:
+        if event.new == 0: vacios_pendientes.add(event.cell)
+        else: vacios_pendientes.discard(event.cell)
+
+def on_estado_fijado(state):
+    vacios_pendientes.clear()
+    vacios_pendientes.update(occupancy.cells_in(0))
+
+occupancy.subscribe(on_cambio_ocupacion)
+occupancy.subscribe_reset(on_estado_fijado)
 
 def start_rellenar_vacios():
-    global is_filling
+    global is_filling, aviso_relleno
     is_filling = True
+    reintentos.clear(); aviso_relleno = ""  # El operador vuelve a pedir el relleno: intentos nuevos
+    vacios_pendientes.clear()
+    vacios_pendientes.update(occupancy.cells_in(0))
     loop_rellenar_vacios()
 
 def stop_rellenar_vacios():
     global is_filling
     is_filling = False
+    dispatcher.cancel_all()
 
 def loop_rellenar_vacios():
-    global is_filling
+    global is_filling, ultimo_visto, aviso_relleno
     if not is_filling:
         return
 
-    if 'matriz_estado' in globals():
-        rows, cols = matriz_estado.shape
-        matriz_pos = [[lambda: SerialPort1.write(b"run cob05\r"),
-                       lambda: SerialPort1.write(b"run cob06\r")],
-                      [lambda: SerialPort1.write(b"run cob03\r"),
-                       lambda: SerialPort1.write(b"run cob04\r")],
-                      [lambda: SerialPort1.write(b"run cob01\r"),
-                       lambda: SerialPort1.write(b"run cob02\r")]]
+    # Mientras el robot no confirme el trabajo anterior, sólo se vuelve a consultar.
+    if dispatcher.is_busy():
+        ventana.after(200, loop_rellenar_vacios)
+        return
 
-        for i in range(rows):
-            for j in range(cols):
-                if matriz_estado[i][j] == 0:  # Si está vacío
-                    matriz_pos[i][j]()  # Ejecuta el comando
-                    print(f"Rellenando posición ({i},{j})")
-                    ventana.after(15000, loop_rellenar_vacios)
-                    return
+    # Un relleno que falló se reintenta con espera creciente, y sólo si la celda sigue vacía.
+    ultimo = next((j for j in reversed(dispatcher.jobs()) if j.finished), None)
+    if ultimo is not None and ultimo.id != ultimo_visto:
+        ultimo_visto = ultimo.id
+        if ultimo.state == COMPLETADO:
+            reintentos.pop(ultimo.cell, None)
+        elif ultimo.state == SIN_RESPUESTA:
+            reintentos[ultimo.cell] = (MAX_REINTENTOS + 1, None)
+            aviso_relleno = f"Celda {ultimo.cell}: {ultimo.error}. Revise el robot antes de volver a rellenar."
+        elif ultimo.state == ERROR:
+            fallos = reintentos.get(ultimo.cell, (0, None))[0] + 1
+            if fallos > MAX_REINTENTOS:
+                reintentos[ultimo.cell] = (fallos, None)
+                aviso_relleno = f"Celda {ultimo.cell} sin rellenar tras {fallos} intentos: {ultimo.error}"
+            else:
+                reintentos[ultimo.cell] = (fallos, time.time() + 2 ** (fallos - 1))
+    vacias = occupancy.cells_in(0)
+    for celda, (fallos, plazo) in list(reintentos.items()):
+        if plazo is not None and time.time() >= plazo:
+            reintentos[celda] = (fallos, None)
+            if celda in vacias: vacios_pendientes.add(celda)
+
+    validos = sorted((i, j) for i, j in vacios_pendientes if i < len(POSICIONES_COB) and j < len(POSICIONES_COB[i]))
+    if validos:
+        i, j = validos[0]
+        vacios_pendientes.discard((i, j))  # Vuelve a la lista sólo si la celda se vacía de nuevo
+        dispatcher.submit((i, j))  # Encola el comando; lbl_despacho muestra el que se ejecuta
+        ventana.after(200, loop_rellenar_vacios)
+        return
 
-    # Si no hay vacíos, revisar cada 2 segundos
-    ventana.after(2000, loop_rellenar_vacios)
+    # Si no hay vacíos, revisar cada 2 segundos (o antes si hay un reintento en espera)
+    esperando = any(plazo is not None for _, plazo in reintentos.values())
+    ventana.after(200 if esperando else 2000, loop_rellenar_vacios)
 
 
 # instrucciones = [
@@ -309,19 +363,31 @@ def loop_rellenar_vacios():
 
 
 def rellenar_vacios(vacios):
-    
-    matriz_pos = [[lambda:SerialPort1.write(b"run cob05" + b"\r"),lambda:SerialPort1.write(b"run cob06" + b"\r")],
-            [lambda:SerialPort1.write(b"run cob03" + b"\r"),lambda:SerialPort1.write(b"run cob04" + b"\r")],
-            [lambda:SerialPort1.write(b"run cob01" + b"\r"),lambda:SerialPort1.write(b"run cob02" + b"\r")]]
-
+    # Encola un trabajo por cada celda vacía. El despachador los envía de a uno desde
+    # su propio hilo y espera el acuse del controlador, sin bloquear la interfaz.
+    if vacios is None: return # Aún no se procesa ningún frame.
     rows, cols = vacios.shape
 
-    for i in range(rows):
-        for j in range(cols):
+    for i in range(min(rows, len(POSICIONES_COB))):
+        for j in range(min(cols, len(POSICIONES_COB[i]))):
             if vacios[i][j] == 0:
-                matriz_pos[i][j]()  # Ejecuta el comando
-                time.sleep(15)
+                dispatcher.submit((i, j))
     return
+
+# --- Estado del robot en la GUI ---
+# Se consulta periódicamente el estado del despachador (la GUI nunca espera al robot).
+def update_estado_despacho():
+    job = dispatcher.current
+    pendientes = dispatcher.pending_count()
+    if job is not None:
+        texto = f"Robot: {job.command.decode().strip()} ({pendientes} en cola)"
+    else:
+        ultimo = next((j for j in reversed(dispatcher.jobs()) if j.finished), None)
+        texto = "Robot: en espera" if ultimo is None else f"Robot: en espera (último: {ultimo.state})"
+        if ultimo is not None and ultimo.state in (ERROR, SIN_RESPUESTA) and ultimo.error: texto += f" - {ultimo.error}"
+    if aviso_relleno: texto += f"\n{aviso_relleno}"
+    lbl_despacho.config(text=texto)
+    ventana.after(250, update_estado_despacho)
 # =================================================================================
 # === CONSTRUCCIÓN DE LA INTERFAZ GRÁFICA (GUI) ===
 # =================================================================================
@@ -329,6 +395,7 @@ def rellenar_vacios(vacios):
 # --- Ventana Principal ---
 # Creación y configuración de la ventana raíz de la aplicación.
 ventana = tk.Tk()
+video_scheduler = FrameScheduler(ventana, update_frame, FPS_VISUALIZACION)
 ventana.title("Contabilizador de Manchas en Tiempo Real")
 ventana.config(bg=BG_COLOR)
 ventana.protocol("WM_DELETE_WINDOW", on_closing)
@@ -338,15 +405,9 @@ ventana.protocol("WM_DELETE_WINDOW", on_closing)
 frame_imagenes = tk.Frame(ventana, bg=BG_COLOR)
 frame_imagenes.pack(pady=10, padx=10, fill='x', expand=True)
 
-lbl_original = tk.Label(bg="black")
-lbl_umbralizada = tk.Label(bg="black")
-visores = [("1. Imagen Real", lbl_original), ("2. Imagen Umbralizada", lbl_umbralizada)]
-
-for titulo, visor_label in visores:
-    frame = tk.Frame(frame_imagenes, bg=FRAME_COLOR, bd=1, relief='sunken')
-    frame.pack(side='left', padx=10, fill='x', expand=True)
-    tk.Label(frame, text=titulo, font=("Times New Roman", 12, "bold"), bg=FRAME_COLOR, fg=TEXT_COLOR).pack(pady=(5,0))
-    visor_label.pack(in_=frame, padx=5, pady=5)
+# Ambas imágenes se componen lado a lado en un único PhotoImage de 2 x 500 px que se
+# actualiza en su lugar en cada frame (ver visor.py).
+visor_imagenes = build_viewers(frame_imagenes, ["1. Imagen Real", "2. Imagen Umbralizada"])
 
 # --- Panel de Controles Inferior ---
 # Estructura de tres columnas para organizar los botones, el slider y los créditos.
@@ -362,6 +423,12 @@ btn_stop = tk.Button(col1, text="Detener Detección", command=lambda: control_ca
 btn_stop.pack(pady=5)
 btn_load = tk.Button(col1, text="Cargar Imagen", command=cargar_imagen, font=("Times New Roman", 12), width=18, bg=BUTTON_COLOR, fg=TEXT_COLOR, relief='flat', activebackground='#555555', activeforeground=TEXT_COLOR)
 btn_load.pack(pady=5)
+frame_video = tk.Frame(col1, bg=BG_COLOR)
+frame_video.pack(pady=5)
+btn_video = tk.Button(frame_video, text="Cargar Video", command=cargar_video, font=("Times New Roman", 12), width=12, bg=BUTTON_COLOR, fg=TEXT_COLOR, relief='flat', activebackground='#555555', activeforeground=TEXT_COLOR)
+btn_video.pack(side='left')
+velocidad_var = tk.StringVar(value="1x")
+ttk.Combobox(frame_video, textvariable=velocidad_var, values=list(VELOCIDADES_VIDEO), width=4, state="readonly").pack(side='left', padx=(5, 0))
 btn_fill_start = tk.Button(col1, text="Iniciar Rellenado",
                            command=start_rellenar_vacios,
                            font=("Times New Roman", 12), width=18,
@@ -378,6 +445,9 @@ btn_fill_stop = tk.Button(col1, text="Detener Rellenado",
                           activeforeground=TEXT_COLOR)
 btn_fill_stop.pack(pady=5)
 
+lbl_despacho = tk.Label(col1, text="Robot: en espera", font=("Times New Roman", 10), bg=BG_COLOR, fg=TEXT_COLOR)
+lbl_despacho.pack(pady=5)
+
 # Columna 2: Contador y Slider de Ajuste
 col2 = tk.Frame(frame_controles_inferior, bg=BG_COLOR)
 col2.pack(side='left', fill='both', expand=True)
@@ -386,12 +456,12 @@ lbl_conteo.pack(pady=(5, 10))
 tk.Label(col2, text="Ajuste de Umbral:", font=("Times New Roman", 12), bg=BG_COLOR, fg=TEXT_COLOR).pack(pady=(5,0))
 slider_umbral_up = Scale(col2, from_=0, to=255, orient='horizontal', length=250, bg=BG_COLOR, fg=TEXT_COLOR, troughcolor='#757575', highlightthickness=0, activebackground=BUTTON_COLOR, 
                     command=lambda e: process_frame(source_image) if source_image is not None else None)
-slider_umbral_up.set(180)
+slider_umbral_up.set(UMBRAL_BAJO)
 slider_umbral_up.pack(pady=(0, 5))
 
 slider_umbral_down = Scale(col2, from_=0, to=255, orient='horizontal', length=250, bg=BG_COLOR, fg=TEXT_COLOR, troughcolor='#757575', highlightthickness=0, activebackground=BUTTON_COLOR, 
                     command=lambda e: process_frame(source_image) if source_image is not None else None)
-slider_umbral_down.set(230)
+slider_umbral_down.set(UMBRAL_ALTO)
 slider_umbral_down.pack(pady=(0, 5))
 
 # Columna 3: Créditos e Información
@@ -432,6 +502,11 @@ x_offset_var = create_slider(grid_controls_frame, "Offset X", 0, 1000, 40)
 y_offset_var = create_slider(grid_controls_frame, "Offset Y", 0, 1000, 10)
 grid_width_var = create_slider(grid_controls_frame, "Ancho Rejilla", 100, 1500, 400)
 grid_height_var = create_slider(grid_controls_frame, "Alto Rejilla", 100, 1000, 300)
+roi_margin_var = create_slider(grid_controls_frame, "Margen ROI", 0, 200, ROI_MARGEN)
+
+# Medir tiempos, registrar ocupación, procesar sólo la rejilla (ROI) y rectificar la estantería
+opciones = build_processing_options(grid_controls_frame, estacion, lambda: process_frame(source_image) if source_image is not None else None, fijar_esquinas)
+roi_var, rectificar_var = opciones.roi, opciones.rectificar
 
 dims_frame = tk.Frame(grid_controls_frame, bg=FRAME_COLOR, bd=1, relief='sunken')
 dims_frame.pack(pady=10)
@@ -455,9 +530,14 @@ entry_cols.pack(side="left", padx=10, pady=5)
 entry_cols.bind('<Return>', on_dimension_change) # Bind para que al presionar Enter se actualice
 
 # Matriz de estado
-status_grid_frame = tk.Frame(frame_grilla, bg=FRAME_COLOR, bd=2, relief='sunken')
-status_grid_frame.pack(side='right', fill="both", expand=True, padx=20)
+status_matrix = StatusMatrix(frame_grilla, empty_color=FRAME_COLOR, bd=2, relief='sunken')
+status_matrix.pack(side='right', fill="both", expand=True, padx=20)
+connect_status_matrix(status_matrix, occupancy) # Se actualiza sólo con los cambios confirmados de ocupación
 setup_status_grid() # Inicializa la grilla al arrancar
+update_estado_despacho()
+
+# --- Endpoint de métricas ---
+estacion.start_metrics(ventana, lambda: capture, video_scheduler, dispatcher)
 
 # --- INICIO DE LA APLICACIÓN ---
 ventana.mainloop()
@@ -11,6 +11,10 @@ import tkinter as tk
 from tkinter import Scale, filedialog
 from PIL import Image, ImageTk
 import cv2
+from captura import CameraCapture
+from visor import FrameViewer
+from planificador import FPS_VISUALIZACION, FrameScheduler
+from conteo import CountingPipeline
 
 # --- CONSTANTES Y VARIABLES GLOBALES ---
 # Define los colores de la interfaz, parámetros de detección y variables
@@ -23,6 +27,7 @@ MIN_AREA_MANCHA = 200
 capture = None
 is_camera_running = False
 source_image = None
+pipeline = CountingPipeline()  # Conserva la escala de grises y el desenfoque mientras la imagen no cambie
 
 # =================================================================================
 # === FUNCIONES DE LÓGICA Y PROCESAMIENTO ===
@@ -35,30 +40,33 @@ def control_camara(iniciar=True):
     if iniciar:
         if is_camera_running: return
         for i in [0,1]:
-            capture = cv2.VideoCapture(i)
-            if capture.isOpened(): break
-        if not capture or not capture.isOpened():
+            capture = CameraCapture(i, flip=True)
+            if capture.start(): break
+        if not capture or not capture.is_running():
             print("ADVERTENCIA: No se pudo acceder a la cámara.")
             return
         is_camera_running = True
         btn_start.config(state="disabled"); btn_stop.config(state="normal"); btn_load.config(state="disabled")
-        update_frame()
+        video_scheduler.start()
     else:
         is_camera_running = False
-        if capture: capture.release()
+        video_scheduler.stop()
+        if capture: capture.stop()
         btn_start.config(state="normal"); btn_stop.config(state="disabled"); btn_load.config(state="normal")
 
 # --- Bucle de Video en Tiempo Real ---
-# Función recursiva que se ejecuta continuamente para leer frames de la cámara
-# y mantener la imagen de video actualizada en la interfaz.
+# Función que video_scheduler ejecuta a FPS_VISUALIZACION vueltas por segundo para leer
+# frames de la cámara y mantener la imagen de video actualizada en la interfaz. El
+# planificador descuenta el tiempo de proceso y, si no alcanza, salta ciclos.
 def update_frame():
     global source_image
     if is_camera_running:
-        ret, frame = capture.read()
-        if ret:
-            source_image = cv2.flip(frame, 1)
+        # El hilo de captura entrega sólo el frame más nuevo (ya volteado); si no hay
+        # uno nuevo desde la última vuelta, no se reprocesa el anterior.
+        frame, _ = capture.read()
+        if frame is not None:
+            source_image = frame
             process_frame(source_image)
-        ventana.after(20, update_frame)
 
 # --- Carga de Imagen Estática ---
 # Abre un explorador de archivos para que el usuario seleccione una imagen del disco
@@ -75,8 +83,7 @@ def cargar_imagen():
 # desenfoque, umbralización) para detectar los contornos de los objetos, los filtra
 # por área para eliminar ruido y finalmente dibuja los resultados sobre las imágenes.
 def process_frame(frame):
-    gray = cv2.cvtColor(frame, cv2.COLOR_BGR2GRAY)
-    blurred = cv2.GaussianBlur(gray, (7, 7), 0)
+    blurred = pipeline.blurred(frame)
     _, thresholded = cv2.threshold(blurred, slider_umbral.get(), 255, cv2.THRESH_BINARY_INV)
     contours, _ = cv2.findContours(thresholded, cv2.RETR_EXTERNAL, cv2.CHAIN_APPROX_SIMPLE)
     manchas_reales = [c for c in contours if cv2.contourArea(c) > MIN_AREA_MANCHA]
@@ -92,23 +99,7 @@ def process_frame(frame):
         cY = int(M["m01"] / M["m00"]) if M["m00"] != 0 else y
         cv2.putText(img_entrada_con_resultados, str(i + 1), (cX - 10, cY + 10), cv2.FONT_HERSHEY_TRIPLEX, 1, (0, 0, 255), 2)
         cv2.putText(img_umbral_con_resultados, str(i + 1), (cX - 10, cY + 10), cv2.FONT_HERSHEY_TRIPLEX, 1, (0, 0, 255), 2)
-    display_image(img_entrada_con_resultados, lbl_original)
-    display_image(img_umbral_con_resultados, lbl_umbralizada)
-
-# --- Visualización de Imagen en GUI ---
-# Convierte una imagen de formato OpenCV a un formato compatible con la librería
-# Tkinter (a través de Pillow) y la muestra en una etiqueta de la interfaz.
-def display_image(img_cv, label):
-    h, w = img_cv.shape[:2]
-    new_width = 500
-    ratio = new_width / float(w)
-    dim = (new_width, int(h * ratio))
-    img_resized = cv2.resize(img_cv, dim, interpolation=cv2.INTER_AREA)
-    img_rgb = cv2.cvtColor(img_resized, cv2.COLOR_BGR2RGB if len(img_resized.shape) == 3 else cv2.COLOR_GRAY2RGB)
-    img_pil = Image.fromarray(img_rgb)
-    img_tk = ImageTk.PhotoImage(image=img_pil)
-    label.configure(image=img_tk)
-    label.image = img_tk
+    visor_imagenes.show(img_entrada_con_resultados, img_umbral_con_resultados)
 
 # --- Cierre Seguro de la Aplicación ---
 # Se asegura de que la cámara se libere correctamente.
@@ -123,6 +114,7 @@ def on_closing():
 # --- Ventana Principal ---
 # Creación y configuración de la ventana raíz de la aplicación.
 ventana = tk.Tk()
+video_scheduler = FrameScheduler(ventana, update_frame, FPS_VISUALIZACION)
 ventana.title("Contabilizador de Manchas en Tiempo Real")
 ventana.config(bg=BG_COLOR)
 ventana.protocol("WM_DELETE_WINDOW", on_closing)
@@ -132,15 +124,18 @@ ventana.protocol("WM_DELETE_WINDOW", on_closing)
 frame_imagenes = tk.Frame(ventana, bg=BG_COLOR)
 frame_imagenes.pack(pady=10, padx=10, fill='x', expand=True)
 
-lbl_original = tk.Label(bg="black")
-lbl_umbralizada = tk.Label(bg="black")
-visores = [("1. Imagen Real", lbl_original), ("2. Imagen Umbralizada", lbl_umbralizada)]
-
-for titulo, visor_label in visores:
-    frame = tk.Frame(frame_imagenes, bg=FRAME_COLOR, bd=1, relief='sunken')
-    frame.pack(side='left', padx=10, fill='x', expand=True)
-    tk.Label(frame, text=titulo, font=("Times New Roman", 12, "bold"), bg=FRAME_COLOR, fg=TEXT_COLOR).pack(pady=(5,0))
-    visor_label.pack(in_=frame, padx=5, pady=5)
+# Ambas imágenes se componen lado a lado en un único PhotoImage de 2 x 500 px que se
+# actualiza en su lugar en cada frame (ver visor.py).
+frame_visores = tk.Frame(frame_imagenes, bg=FRAME_COLOR, bd=1, relief='sunken')
+frame_visores.pack(padx=10)
+visores = ["1. Imagen Real", "2. Imagen Umbralizada"]
+
+for i, titulo in enumerate(visores):
+    frame_visores.columnconfigure(i, weight=1, uniform="visores")
+    tk.Label(frame_visores, text=titulo, font=("Times New Roman", 12, "bold"), bg=FRAME_COLOR, fg=TEXT_COLOR).grid(row=0, column=i, pady=(5,0))
+lbl_visores = tk.Label(frame_visores, bg=FRAME_COLOR)
+lbl_visores.grid(row=1, column=0, columnspan=len(visores), padx=5, pady=5)
+visor_imagenes = FrameViewer(lbl_visores, panel_width=500, panels=len(visores), gap=10, bg=(33, 33, 33))
 
 # --- Panel de Controles Inferior ---
 # Estructura de tres columnas para organizar los botones, el slider y los créditos.
@@ -15,17 +15,35 @@
 # 3. Almacén: Utiliza la cámara para detectar los marcadores en una zona de almacenamiento
 #    determinada. Identifica las piezas según la base de datos y muestra el estado
 #    del inventario en tiempo real sobre una rejilla de detección configurable.
+# 4. Varias estanterías: monitorea varias estanterías, cada una con su cámara y
+#    su propio proceso de detección, y muestra el inventario agregado.
+#
+# Con --servidor host:puerto la aplicación no abre la cámara: muestra los frames
+# y detecciones de un servidor_vision.py que corre en otro proceso o equipo.
 #
 # =================================================================================
 
+import argparse
+import json
+import time
 import tkinter as tk
 from tkinter import ttk, filedialog, messagebox
 import cv2
 import cv2.aruco as aruco
 import numpy as np
 from PIL import Image, ImageTk
-import json
-import os
+from visor import FrameViewer
+from detector_aruco import ESCALAS_DETECCION, ESCANEO_COMPLETO_CADA, marker_cells
+from grilla import ROI_MARGEN, draw_cells, roi_bounds
+from matriz_canvas import StatusMatrix
+from metricas import StageTimer
+from exportador_metricas import MetricsServer, StationMetrics, capture_collector, timing_collector
+from servicio_vision import VisionService
+from base_piezas import PieceStore
+from estanterias import SHELVES_FILE, ShelfMonitor, load_shelves
+from ocupacion import OccupancyTracker
+from rectificacion import CALIBRACION_FILE, MARCADORES_ESQUINA, Rectifier
+from registro_ocupacion import REGISTRO_DIR, OccupancyRecorder
 
 # =================================================================================
 # === SECCIÓN 1: PARÁMETROS GLOBALES Y FUNCIONES ===
@@ -44,52 +62,59 @@ FONT_NORMAL = ("Segoe UI", 10)
 FONT_BOLD = ("Segoe UI", 11, "bold")
 FONT_LARGE_BOLD = ("Segoe UI", 22, "bold")
 
-# --- Archivo de la base de datos ---
-DB_FILE = "piece_database.json"
-
-def display_image_on_label(parent_widget, img, label):
-   
-    # Si el widget aún no se ha dibujado, su tamaño será 1. Se reintenta tras 20ms.
-    if not label.winfo_exists() or label.winfo_width() <= 1:
-        parent_widget.after(20, lambda: display_image_on_label(parent_widget, img, label))
-        return
-    
-    h, w = img.shape[:2]
-    # Calcula el ratio para redimensionar la imagen sin distorsionarla, ajustándose al Label.
-    ratio = min(label.winfo_width() / w, label.winfo_height() / h)
-    resized = cv2.resize(img, (int(w * ratio), int(h * ratio)), interpolation=cv2.INTER_AREA)
-    
-    # Convierte la imagen de BGR (OpenCV) a RGB y luego a un formato que Tkinter pueda usar.
-    img_rgb = cv2.cvtColor(resized, cv2.COLOR_BGR2RGB)
-    img_pil = Image.fromarray(img_rgb)
-    img_tk = ImageTk.PhotoImage(image=img_pil)
-    
-    # Actualiza el widget Label con la nueva imagen.
-    label.imgtk = img_tk  # Guarda una referencia para evitar que el recolector de basura la elimine.
-    label.configure(image=img_tk)
+# --- Archivo de la base de datos (SQLite; el JSON antiguo se importa la primera vez) ---
+DB_FILE = "piece_database.db"
+LEGACY_DB_FILE = "piece_database.json"
+# --- Velocidades de reproducción de videos grabados (None: lo más rápido posible) ---
+VELOCIDADES_VIDEO = {"1x": 1.0, "2x": 2.0, "4x": 4.0, "8x": 8.0, "Máx": None}
+# --- Archivo donde se vuelcan periódicamente los tiempos por etapa (F2 activa la medición) ---
+TIEMPOS_CSV = "tiempos_etapas.csv"
 
-def load_piece_database():
-    """Carga la base de datos de piezas desde el archivo JSON."""
-    if not os.path.exists(DB_FILE):
-        return []
-    try:
-        with open(DB_FILE, 'r') as f:
-            return json.load(f)
-    except (json.JSONDecodeError, IOError):
-        return []
+# --- Estilo de una pieza detectada en la matriz de estado y en el rectángulo sobre el video ---
+def piece_cell_style(pieces, found_id):
+    """(texto, color de la celda, color BGR del rectángulo) para un ID detectado, según la base de piezas."""
+    if piece := pieces.get(found_id): return f"{piece['model']}\n ({piece['type']})\nID: {found_id}", SUCCESS_COLOR, (0, 255, 0)
+    return f"ID: {found_id}\n(No asociado)", HIGHLIGHT_COLOR, (0, 191, 255)
 
 # =================================================================================
 # === SECCIÓN 2: BASE PRINCIPAL DE LA APLICACIÓN (APP) ===
 # =================================================================================
 # Gestiona la ventana principal y la transición entre las diferentes "pantallas" o etapas.
 class App(tk.Tk):
-    def __init__(self):
+    def __init__(self, servidor=None):
         super().__init__()
         self.title("Sistema de Gestión de Inventario por Visión (ArUco) - Cristóbal Parra A. (2025)")
         self.config(bg=BG_COLOR)
         self.state('zoomed') # Inicia la ventana maximizada.
         self.protocol("WM_DELETE_WINDOW", self.on_close)
 
+        # --- Medición de tiempos por etapa ---
+        # Compartida por todas las pantallas; F2 activa o desactiva su resumen sobre el video. Las
+        # mediciones, sólo con la medición activa, alimentan también los histogramas de /metrics (ver exportador_metricas.py).
+        self.metrics = StationMetrics()
+        self.timer = StageTimer(csv_path=TIEMPOS_CSV, metrics=self.metrics)
+        self.bind("<F2>", lambda e: self.timer.set_enabled(not self.timer.enabled))
+
+        # --- Cámara y detector ArUco compartidos ---
+        # La cámara se abre con la primera pantalla que la usa y queda abierta hasta cerrar la
+        # aplicación; las pantallas sólo se suscriben y desuscriben al mostrarse u ocultarse.
+        # Con un servidor de visión, la captura y la detección corren allá y aquí sólo se muestran.
+        if servidor:
+            from servidor_vision import RemoteVisionService # Sólo entonces se carga asyncio.
+            self.vision = RemoteVisionService(self, servidor, timer=self.timer, metrics=self.metrics)
+        else: self.vision = VisionService(self, index=0, flip=False, timer=self.timer, metrics=self.metrics)
+        self.metrics.add_collector(capture_collector(lambda: self.vision.cap, self.vision.scheduler))
+        self.metrics.add_collector(timing_collector(self.timer))
+        self.metrics_server = MetricsServer(self.metrics); self.after_idle(self.metrics_server.start) # Con la ventana ya visible.
+
+        # --- Base de datos de piezas ---
+        # Se carga una vez; las pantallas se suscriben a sus cambios en vez de releerla.
+        self.pieces = PieceStore(DB_FILE, legacy_json=LEGACY_DB_FILE)
+
+        # --- Registro de ocupación ---
+        # ID observado por celda en cada detección del almacén, en archivos binarios (ver registro_ocupacion.py).
+        self.recorder = OccupancyRecorder(REGISTRO_DIR, prefix="almacen", empty=-1)
+
         # --- Configuración de Estilos para Widgets ttk ---
         # Centraliza la apariencia de los widgets para un look consistente en toda la app.
         style = ttk.Style(self)
@@ -105,36 +130,38 @@ class App(tk.Tk):
 
         # --- Contenedor de Vistas ---
         # Un único contenedor que alojará los frames de cada etapa.
-        container = tk.Frame(self, bg=BG_COLOR)
-        container.pack(side="top", fill="both", expand=True)
-        container.grid_rowconfigure(0, weight=1)
-        container.grid_columnconfigure(0, weight=1)
+        self.container = tk.Frame(self, bg=BG_COLOR)
+        self.container.pack(side="top", fill="both", expand=True)
+        self.container.grid_rowconfigure(0, weight=1)
+        self.container.grid_columnconfigure(0, weight=1)
 
         # --- Inicialización de los Frames (Etapas) ---
+        # Cada etapa se construye la primera vez que se muestra: al iniciar sólo se arma la
+        # bienvenida, y la ventana queda usable sin esperar a las demás.
         self.frames = {}
-        for F in (WelcomeScreen, ClassificationScreen, WarehouseScreen):
-            frame = F(container, self)
-            self.frames.setdefault(F, frame).grid(row=0, column=0, sticky="nsew")
-        
         self.show_frame(WelcomeScreen) # Muestra la pantalla de bienvenida al iniciar.
 
     def show_frame(self, cont):
         """Muestra un frame (vista/etapa) específico y oculta los demás."""
+        # Antes de mostrar un nuevo frame, se oculta el anterior (deja de recibir frames de la cámara).
+        for f in self.frames.values():
+            if f.winfo_ismapped() and hasattr(f, 'on_hide'): f.on_hide()
+        # Construye el frame solicitado si es la primera vez, y lo muestra.
         frame = self.frames.get(cont)
-        if frame:
-            # Antes de mostrar un nuevo frame, se oculta el anterior para liberar recursos (ej. la cámara).
-            for f in self.frames.values():
-                if f.winfo_ismapped() and hasattr(f, 'on_hide'): f.on_hide()
-            # Muestra el frame solicitado.
-            frame.tkraise()
-            # Activa los recursos del nuevo frame (ej. la cámara).
-            if hasattr(frame, 'on_show'): frame.on_show()
+        if frame is None:
+            frame = self.frames[cont] = cont(self.container, self)
+            frame.grid(row=0, column=0, sticky="nsew")
+        frame.tkraise()
+        # Suscribe el nuevo frame a la cámara compartida, que ya está transmitiendo.
+        if hasattr(frame, 'on_show'): frame.on_show()
 
     def on_close(self):
         """Manejador para el cierre de la ventana principal."""
-        # Se asegura de liberar todas las cámaras antes de cerrar la aplicación.
+        # Se asegura de liberar las cámaras (y los procesos de las estanterías) antes de cerrar la aplicación.
         for frame in self.frames.values():
-            if hasattr(frame, 'release_camera'): frame.release_camera()
+            if frame.winfo_ismapped() and hasattr(frame, 'on_hide'): frame.on_hide()
+        self.vision.stop(); self.pieces.close(); self.recorder.stop(); self.metrics_server.stop()
+        if self.timer.enabled: self.timer.dump_csv()
         self.destroy()
 
 # =================================================================================
@@ -181,12 +208,7 @@ class ClassificationScreen(tk.Frame):
     """Pantalla para clasificar piezas, asociando un ID de ArUco a un modelo y tipo."""
     def __init__(self, parent, controller):
         super().__init__(parent, bg=BG_COLOR)
-        self.controller = controller; self.cap = None; self.is_camera_active = False; self.flip_camera = False
-        
-        # --- Configuración del detector ArUco ---
-        self.aruco_dict = aruco.getPredefinedDictionary(aruco.DICT_5X5_100)
-        self.aruco_params = aruco.DetectorParameters()
-        self.aruco_params.cornerRefinementMethod = aruco.CORNER_REFINE_SUBPIX
+        self.controller = controller # La cámara y el detector ArUco los provee controller.vision.
         
         self.highlighted_id = None # Para el resaltado visual al guardar.
 
@@ -196,6 +218,7 @@ class ClassificationScreen(tk.Frame):
         
         camera_frame = tk.Frame(main_frame, bg=FRAME_COLOR, bd=2, relief='sunken'); camera_frame.grid(row=0, column=0, sticky="nsew", padx=(0, 10))
         self.camera_label = tk.Label(camera_frame, bg="black"); self.camera_label.pack(fill="both", expand=True, padx=5, pady=5)
+        self.viewer = FrameViewer(self.camera_label) # Se ajusta al Label; sin frames hasta que el Label tenga tamaño.
         
         controls_frame = tk.Frame(main_frame, bg=FRAME_COLOR, bd=2, relief='sunken', padx=15, pady=10); controls_frame.grid(row=0, column=1, sticky="nsew"); controls_frame.columnconfigure(0, weight=1)
         
@@ -215,30 +238,23 @@ class ClassificationScreen(tk.Frame):
         self.status_label = tk.Label(controls_frame, text="", bg=FRAME_COLOR, fg=HIGHLIGHT_COLOR, font=FONT_NORMAL); self.status_label.grid(row=7, column=0, sticky="ew", pady=5)
         
         tk.Label(controls_frame, text="Clasificaciones Guardadas", font=FONT_BOLD, bg=FRAME_COLOR, fg=TEXT_COLOR).grid(row=8, column=0, pady=(15, 5))
+        # Cada fila usa el aruco_id como iid, así los cambios de la base se aplican fila por fila.
         self.db_tree = ttk.Treeview(controls_frame, columns=("ID", "Modelo", "Tipo"), show="headings"); self.db_tree.heading("ID", text="ID"); self.db_tree.column("ID", width=50, anchor='center', stretch=False); self.db_tree.heading("Modelo", text="Modelo"); self.db_tree.column("Modelo", width=120, anchor='center', stretch=True); self.db_tree.heading("Tipo", text="Tipo"); self.db_tree.column("Tipo", width=100, anchor='center', stretch=False); self.db_tree.grid(row=9, column=0, sticky="nsew", pady=5, padx=0); controls_frame.grid_rowconfigure(9, weight=1)
         
         delete_button = tk.Button(controls_frame, text="Eliminar Selección", command=self.delete_selected_associations, bg="#dc3545", fg="white", font=FONT_BOLD, relief='flat', padx=10, pady=5); delete_button.grid(row=10, column=0, sticky="ew", pady=(10,5))
         warehouse_button = tk.Button(controls_frame, text="Ir al Almacén >>", command=lambda: controller.show_frame(WarehouseScreen), bg=INFO_COLOR, fg="white", font=FONT_BOLD, relief='flat', padx=10, pady=5); warehouse_button.grid(row=11, column=0, sticky="ew", pady=5)
+        
+        for entry in controller.pieces.all(): self.db_tree.insert("", "end", iid=entry['aruco_id'], values=(entry['aruco_id'], entry['model'], entry['type']))
+        controller.pieces.subscribe(self.on_pieces_changed)
 
-    def on_show(self): self.update_db_view(); self.activate_camera()
-    def on_hide(self): self.release_camera()
-    
-    def activate_camera(self):
-        if self.is_camera_active: return
-        self.cap = cv2.VideoCapture(0)
-        if self.cap.isOpened(): self.is_camera_active = True; self.update_loop()
-    
-    def release_camera(self): self.is_camera_active = False; self.cap.release() if self.cap else None
+    def on_show(self): self.controller.vision.subscribe(self.on_frame)
+    def on_hide(self): self.controller.vision.unsubscribe(self.on_frame)
     
-    def update_loop(self):
-        if not self.is_camera_active or not self.cap or not self.cap.isOpened(): return
-        ret, frame = self.cap.read()
-        if ret:
-            if self.flip_camera: frame = cv2.flip(frame, 1)
-            gray = cv2.cvtColor(frame, cv2.COLOR_BGR2GRAY)
-            corners, ids, _ = aruco.detectMarkers(gray, self.aruco_dict, parameters=self.aruco_params)
-            
-            detected_ids_list = []
+    def on_frame(self, frame, corners, ids, roi, detected):
+        """Recibe cada frame de la cámara compartida con los marcadores ya detectados."""
+        timer = self.controller.timer
+        detected_ids_list = []
+        with timer.stage("dibujo"):
             if ids is not None:
                 ids_flat = ids.flatten()
                 for i, corner in enumerate(corners):
@@ -246,41 +262,40 @@ class ClassificationScreen(tk.Frame):
                     if current_id_str == self.highlighted_id: color = (23, 193, 255)
                     aruco.drawDetectedMarkers(frame, [corner], np.array([[ids_flat[i]]]), borderColor=color)
                 detected_ids_list = sorted([str(id_val) for id_val in ids_flat])
-            
-            if set(detected_ids_list) != set(self.detected_ids_combo['values']):
-                self.detected_ids_combo['values'] = detected_ids_list
-                if detected_ids_list: self.detected_ids_combo.set(detected_ids_list[-1])
-            
-            display_image_on_label(self, frame, self.camera_label)
-        self.after(30, self.update_loop)
+            timer.draw_overlay(frame)
+        
+        if detected and set(detected_ids_list) != set(self.detected_ids_combo['values']):
+            self.detected_ids_combo['values'] = detected_ids_list
+            if detected_ids_list: self.detected_ids_combo.set(detected_ids_list[-1])
+        
+        with timer.stage("visualizacion"): self.viewer.show(frame)
+        timer.tick()
 
     def save_association(self):
         aruco_id, model, p_type = self.detected_ids_combo.get(), self.model_entry.get(), self.type_var.get()
         if not aruco_id or not model: self.status_label.config(text="Error: Complete ID y Modelo."); return
         self.highlighted_id = aruco_id; self.after(2000, self.clear_highlight)
-        db = load_piece_database(); found = False
-        for entry in db:
-            if 'aruco_id' in entry and entry['aruco_id'] == aruco_id: entry['model'], entry['type'], found = model, p_type, True; break
-        if not found: db.append({"aruco_id": aruco_id, "model": model, "type": p_type})
-        with open(DB_FILE, 'w') as f: json.dump(db, f, indent=4)
+        found = aruco_id in self.controller.pieces
+        self.controller.pieces.put(aruco_id, model, p_type) # La tabla se actualiza vía on_pieces_changed.
         self.status_label.config(text=f"ID {aruco_id} {'actualizado' if found else 'clasificado'}.")
-        self.update_db_view(); self.model_entry.delete(0, tk.END)
+        self.model_entry.delete(0, tk.END)
 
     def clear_highlight(self): self.highlighted_id = None
     
-    def update_db_view(self):
-        self.db_tree.delete(*self.db_tree.get_children())
-        for entry in load_piece_database():
-            if all(k in entry for k in ['aruco_id', 'model', 'type']): self.db_tree.insert("", "end", values=(entry['aruco_id'], entry['model'], entry['type']))
+    def on_pieces_changed(self, changes):
+        """Actualiza sólo las filas de la tabla cuyas piezas cambiaron."""
+        for aruco_id, entry in changes.items():
+            if entry is None:
+                if self.db_tree.exists(aruco_id): self.db_tree.delete(aruco_id)
+            elif self.db_tree.exists(aruco_id): self.db_tree.item(aruco_id, values=(aruco_id, entry['model'], entry['type']))
+            else: self.db_tree.insert("", "end", iid=aruco_id, values=(aruco_id, entry['model'], entry['type']))
     
     def delete_selected_associations(self):
         selected_items = self.db_tree.selection()
         if not selected_items: messagebox.showinfo("Selección Requerida", "Por favor, selecciona las clasificaciones a eliminar."); return
         if messagebox.askyesno("Confirmar Eliminación", f"¿Eliminar {len(selected_items)} clasificaciones seleccionadas?"):
-            db = load_piece_database(); ids_to_delete = {str(self.db_tree.item(item)['values'][0]) for item in selected_items}
-            updated_db = [entry for entry in db if str(entry.get('aruco_id')) not in ids_to_delete]
-            with open(DB_FILE, 'w') as f: json.dump(updated_db, f, indent=4)
-            self.update_db_view(); self.status_label.config(text=f"{len(ids_to_delete)} clasificaciones eliminadas.")
+            deleted = self.controller.pieces.delete_many(selected_items) # Los iid son los aruco_id; un único commit.
+            self.status_label.config(text=f"{len(deleted)} clasificaciones eliminadas.")
 
 # =================================================================================
 # === SECCIÓN 5: ETAPA 3 - GESTIÓN DE ALMACÉN (ARUCO) ===
@@ -289,8 +304,16 @@ class WarehouseScreen(tk.Frame):
     """Pantalla para la gestión del inventario en tiempo real usando una rejilla configurable."""
     def __init__(self, parent, controller):
         super().__init__(parent, bg=BG_COLOR)
-        self.controller = controller; self.cap = None; self.is_camera_active = False; self.piece_db = {}; self.flip_camera = False
-        self.aruco_dict = aruco.getPredefinedDictionary(aruco.DICT_5X5_100); self.aruco_params = aruco.DetectorParameters(); self.aruco_params.cornerRefinementMethod = aruco.CORNER_REFINE_SUBPIX
+        self.controller = controller # La cámara y el detector ArUco los provee controller.vision.
+        self.cell_styles = {} # aruco_id -> (texto, color, color del rectángulo); se invalida con los cambios de la base.
+        # Estado estable de la rejilla (ID de marcador por celda, -1 vacía); la matriz y los colores de
+        # los rectángulos sólo se actualizan con sus eventos, no con cada frame.
+        self.occupancy = OccupancyTracker(empty=-1, piece_ids=True); self.occupancy.subscribe(self.on_occupancy_events); self.occupancy.subscribe_reset(self.on_occupancy_reset)
+        self.rect_colors = {}
+        # Rectificación: la rejilla se ubica sobre la estantería vista de frente (ver rectificacion.py).
+        self.rectifier = Rectifier(); self.rectifier.load_calibration(CALIBRACION_FILE)
+        self.capturing_corners = False # True mientras se esperan los marcadores de esquina en la imagen cruda.
+        controller.pieces.subscribe(self.on_pieces_changed)
         
         # --- Layout de la Interfaz ---
         top_controls = tk.Frame(self, bg=BG_COLOR, pady=10, padx=20); top_controls.pack(fill="x")
@@ -314,92 +337,281 @@ class WarehouseScreen(tk.Frame):
         # Contenedor para el botón de volver y las dimensiones a la derecha
         right_controls = tk.Frame(top_controls, bg=BG_COLOR); right_controls.grid(row=0, column=1, sticky='e', padx=20)
         tk.Button(right_controls, text="<< Volver a Clasificación", command=lambda: controller.show_frame(ClassificationScreen), bg=BUTTON_BG, fg=BUTTON_FG, font=FONT_BOLD, relief='flat', padx=10, pady=5).pack(pady=(0, 10))
+        tk.Button(right_controls, text="Varias Estanterías >>", command=lambda: controller.show_frame(ShelvesScreen), bg=INFO_COLOR, fg="white", font=FONT_BOLD, relief='flat', padx=10, pady=5).pack(pady=(0, 10))
+        # Fuente de video: cámara en vivo o un video grabado (para revisar diferencias de inventario).
+        source_frame = tk.Frame(right_controls, bg=FRAME_COLOR, bd=1, relief='sunken'); source_frame.pack(anchor='e', pady=(0, 5))
+        tk.Button(source_frame, text="Reproducir Video...", command=self.open_video, bg=BUTTON_BG, fg=BUTTON_FG, font=FONT_NORMAL, relief='flat', padx=5).pack(side="left", padx=(10,5), pady=5)
+        self.speed_var = tk.StringVar(value="1x")
+        ttk.Combobox(source_frame, textvariable=self.speed_var, values=list(VELOCIDADES_VIDEO), width=5, state="readonly", font=FONT_NORMAL).pack(side="left", padx=5, pady=5)
+        tk.Button(source_frame, text="Cámara", command=lambda: controller.vision.set_source(0), bg=BUTTON_BG, fg=BUTTON_FG, font=FONT_NORMAL, relief='flat', padx=5).pack(side="left", padx=(5,10), pady=5)
         dims_frame = tk.Frame(right_controls, bg=FRAME_COLOR, bd=1, relief='sunken'); dims_frame.pack(anchor='e')
         self.rows_var = tk.IntVar(value=3); self.cols_var = tk.IntVar(value=4)
         tk.Label(dims_frame, text="Filas:", bg=FRAME_COLOR, fg=TEXT_COLOR, font=FONT_NORMAL).pack(side="left", padx=(10,5), pady=5)
         ttk.Entry(dims_frame, textvariable=self.rows_var, width=5, font=FONT_NORMAL).pack(side="left", padx=5, pady=5)
         tk.Label(dims_frame, text="Columnas:", bg=FRAME_COLOR, fg=TEXT_COLOR, font=FONT_NORMAL).pack(side="left", padx=(10,5), pady=5)
         ttk.Entry(dims_frame, textvariable=self.cols_var, width=5, font=FONT_NORMAL).pack(side="left", padx=10, pady=5)
+        # Modo ROI: la detección sólo analiza el rectángulo de la rejilla más un margen.
+        roi_frame = tk.Frame(right_controls, bg=FRAME_COLOR, bd=1, relief='sunken'); roi_frame.pack(anchor='e', pady=(5, 0))
+        self.roi_var = tk.BooleanVar(value=False); self.roi_margin_var = tk.IntVar(value=ROI_MARGEN)
+        tk.Checkbutton(roi_frame, text="Sólo la rejilla (ROI)", variable=self.roi_var, bg=FRAME_COLOR, fg=TEXT_COLOR, selectcolor=BG_COLOR, activebackground=FRAME_COLOR, activeforeground=TEXT_COLOR, font=FONT_NORMAL).pack(side="left", padx=(10,5), pady=5)
+        tk.Label(roi_frame, text="Margen:", bg=FRAME_COLOR, fg=TEXT_COLOR, font=FONT_NORMAL).pack(side="left", padx=(10,5), pady=5)
+        ttk.Entry(roi_frame, textvariable=self.roi_margin_var, width=5, font=FONT_NORMAL).pack(side="left", padx=10, pady=5)
+        # Modo seguimiento: entre escaneos completos sólo se buscan los marcadores conocidos.
+        track_frame = tk.Frame(right_controls, bg=FRAME_COLOR, bd=1, relief='sunken'); track_frame.pack(anchor='e', pady=(5, 0))
+        self.tracking_var = tk.BooleanVar(value=True); self.full_scan_var = tk.IntVar(value=ESCANEO_COMPLETO_CADA)
+        tk.Checkbutton(track_frame, text="Seguimiento", variable=self.tracking_var, bg=FRAME_COLOR, fg=TEXT_COLOR, selectcolor=BG_COLOR, activebackground=FRAME_COLOR, activeforeground=TEXT_COLOR, font=FONT_NORMAL).pack(side="left", padx=(10,5), pady=5)
+        tk.Label(track_frame, text="Escaneo completo cada:", bg=FRAME_COLOR, fg=TEXT_COLOR, font=FONT_NORMAL).pack(side="left", padx=(10,5), pady=5)
+        ttk.Entry(track_frame, textvariable=self.full_scan_var, width=5, font=FONT_NORMAL).pack(side="left", padx=10, pady=5)
+        # Modo pirámide: candidatos en la imagen reducida, esquinas refinadas a resolución completa.
+        tk.Label(track_frame, text="Escala:", bg=FRAME_COLOR, fg=TEXT_COLOR, font=FONT_NORMAL).pack(side="left", padx=(10,5), pady=5)
+        self.scale_var = tk.StringVar(value=str(ESCALAS_DETECCION[0]))
+        ttk.Combobox(track_frame, textvariable=self.scale_var, values=[str(s) for s in ESCALAS_DETECCION], width=5, font=FONT_NORMAL).pack(side="left", padx=(5,10), pady=5)
+        self.tracking_var.trace_add("write", self.update_tracking); self.full_scan_var.trace_add("write", self.update_tracking); self.scale_var.trace_add("write", self.update_tracking)
+        # Rectificación: detección y rejilla sobre la imagen compacta de la estantería.
+        rect_frame = tk.Frame(right_controls, bg=FRAME_COLOR, bd=1, relief='sunken'); rect_frame.pack(anchor='e', pady=(5, 0))
+        self.rectify_var = tk.BooleanVar(value=False)
+        tk.Checkbutton(rect_frame, text="Rectificar estantería", variable=self.rectify_var, bg=FRAME_COLOR, fg=TEXT_COLOR, selectcolor=BG_COLOR, activebackground=FRAME_COLOR, activeforeground=TEXT_COLOR, font=FONT_NORMAL).pack(side="left", padx=(10,5), pady=5)
+        self.corners_button = tk.Button(rect_frame, text="Fijar esquinas", command=self.capture_corners, bg=BUTTON_BG, fg=BUTTON_FG, font=FONT_NORMAL, relief='flat', padx=5)
+        self.corners_button.pack(side="left", padx=(5,10), pady=5)
+        self.rectify_var.trace_add("write", self.update_rectification)
+        # Registro de auditoría: la matriz de IDs de cada detección, a tasa completa.
+        self.record_var = tk.BooleanVar(value=False)
+        tk.Checkbutton(right_controls, text=f"Registrar ocupación ({REGISTRO_DIR}/)", variable=self.record_var, bg=BG_COLOR, fg=TEXT_COLOR, selectcolor=FRAME_COLOR, activebackground=BG_COLOR, activeforeground=TEXT_COLOR, font=FONT_NORMAL,
+                       command=lambda: controller.recorder.start() if self.record_var.get() else controller.recorder.stop()).pack(anchor='e', pady=(5, 0))
 
         # Panel de contenido principal
         main_content_frame = tk.Frame(self, bg=BG_COLOR, padx=20, pady=10); main_content_frame.pack(fill="both", expand=True)
         main_content_frame.grid_columnconfigure(0, weight=2); main_content_frame.grid_columnconfigure(1, weight=1); main_content_frame.grid_rowconfigure(0, weight=1)
         self.camera_label = tk.Label(main_content_frame, bg="black"); self.camera_label.grid(row=0, column=0, sticky="nsew", padx=(0, 10))
-        self.status_grid_frame = tk.Frame(main_content_frame, bg=FRAME_COLOR, bd=2, relief='sunken'); self.status_grid_frame.grid(row=0, column=1, sticky="nsew")
-        self.status_labels = {}
+        self.viewer = FrameViewer(self.camera_label)
+        self.status_matrix = StatusMatrix(main_content_frame, empty_color=FRAME_COLOR, font=FONT_NORMAL, bd=2, relief='sunken'); self.status_matrix.grid(row=0, column=1, sticky="nsew")
         
     def on_show(self):
-        db_list = load_piece_database(); self.piece_db = {entry['aruco_id']: entry for entry in db_list if 'aruco_id' in entry}
-        self.setup_status_grid(); self.activate_camera()
-    def on_hide(self): self.release_camera()
-    def activate_camera(self):
-        if self.is_camera_active: return
-        self.cap = cv2.VideoCapture(0)
-        if self.cap.isOpened(): self.is_camera_active = True; self.update_warehouse_view()
-    def release_camera(self): self.is_camera_active = False; self.cap.release() if self.cap else None
+        self.setup_status_grid(); self.update_tracking(); self.update_rectification(); self.controller.vision.subscribe(self.on_frame, roi=self.detection_roi)
+    def on_hide(self): self.controller.vision.unsubscribe(self.on_frame); self.controller.vision.rectifier = None
+    
+    def on_pieces_changed(self, changes):
+        for aruco_id in changes: self.cell_styles.pop(aruco_id, None)
+        if self.occupancy.state is None: return
+        for aruco_id in changes: # Vuelve a pintar las celdas que muestran una pieza modificada.
+            if aruco_id.isdigit():
+                for r, c in self.occupancy.cells_in(int(aruco_id)): self.show_cell((r, c), aruco_id)
+    
+    def on_occupancy_events(self, events):
+        """Aplica sólo los cambios de celda confirmados por el seguimiento de ocupación."""
+        for event in events: self.show_cell(event.cell, None if event.new == -1 else str(event.new))
+    
+    def on_occupancy_reset(self, state):
+        """Estado inicial o nueva geometría (sin eventos): se dibujan todas las celdas."""
+        self.status_matrix.set_geometry(*state.shape); self.rect_colors.clear()
+        for (r, c), found_id in np.ndenumerate(state): self.show_cell((r, c), None if found_id == -1 else str(found_id))
+    
+    def show_cell(self, cell, found_id):
+        if found_id is None: self.rect_colors.pop(cell, None); self.status_matrix.set_cell(*cell); return
+        text, color, rect_color = self.cell_style(found_id)
+        self.rect_colors[cell] = rect_color; self.status_matrix.set_cell(*cell, (text, color))
+    
+    def cell_style(self, found_id):
+        """Texto y colores de la celda para un ID; se calculan una vez por ID hasta que su pieza cambie."""
+        style = self.cell_styles.get(found_id)
+        if style is None: style = self.cell_styles[found_id] = piece_cell_style(self.controller.pieces, found_id)
+        return style
+    
+    def open_video(self):
+        path = filedialog.askopenfilename(filetypes=[("Archivos de video", "*.mp4 *.avi *.mkv *.mov")])
+        if path and not self.controller.vision.set_source(path, VELOCIDADES_VIDEO[self.speed_var.get()]):
+            messagebox.showerror("Video", f"No se pudo abrir {path}.")
+    
+    def update_tracking(self, *args):
+        """Aplica el modo seguimiento, su período de escaneo completo y la escala de detección al detector compartido."""
+        tracker = self.controller.vision.tracker
+        tracker.enabled = self.tracking_var.get()
+        try: tracker.full_scan_every = max(1, self.full_scan_var.get())
+        except tk.TclError: pass
+        try: tracker.scale = min(1.0, max(0.05, float(self.scale_var.get())))
+        except ValueError: pass
+    
+    def update_rectification(self, *args):
+        """Rectifica los frames del servicio de visión si está activado y hay un cuadrilátero fijado."""
+        active = self.rectify_var.get() and self.rectifier.ready and not self.capturing_corners
+        self.controller.vision.rectifier = self.rectifier if active else None
+    
+    def capture_corners(self):
+        """Vuelve a la imagen cruda hasta detectar los cuatro marcadores de esquina (ver on_frame)."""
+        self.capturing_corners = True; self.update_rectification()
+        self.corners_button.config(text=f"Buscando {MARCADORES_ESQUINA[0]}-{MARCADORES_ESQUINA[-1]}...")
+    
+    def corners_found(self, corners, ids):
+        if not self.rectifier.set_quad_from_markers(corners, ids): return
+        self.capturing_corners = False; self.corners_button.config(text="Fijar esquinas")
+        # La rejilla pasa a cubrir toda la imagen rectificada.
+        width, height = self.rectifier.size
+        self.x_offset_var.set(0); self.y_offset_var.set(0); self.grid_width_var.set(width); self.grid_height_var.set(height)
+        if self.rectify_var.get(): self.update_rectification()
+        else: self.rectify_var.set(True) # El trace aplica la rectificación.
     
     def setup_status_grid(self):
-        for widget in self.status_grid_frame.winfo_children(): widget.destroy()
-        self.status_labels = {}
         try: rows, cols = self.rows_var.get(), self.cols_var.get()
         except tk.TclError: rows, cols = 3, 3
         if rows <= 0 or cols <= 0: return
-        for r in range(rows):
-            self.status_grid_frame.rowconfigure(r, weight=1)
-            for c in range(cols):
-                self.status_grid_frame.columnconfigure(c, weight=1)
-                lbl = tk.Label(self.status_grid_frame, text="Vacío", bg=FRAME_COLOR, fg="white", font=FONT_NORMAL, relief='sunken', bd=1, wraplength=120)
-                lbl.grid(row=r, column=c, padx=2, pady=2, sticky="nsew"); self.status_labels[(r, c)] = lbl
+        self.status_matrix.set_geometry(rows, cols) # Las celdas se crean una vez por geometría.
+    
+    def on_frame(self, frame, corners, ids, roi, detected):
+        """Recibe cada frame de la cámara compartida con los marcadores ya detectados."""
+        timer = self.controller.timer
+        if self.capturing_corners and detected and self.controller.vision.rectifier is None: self.corners_found(corners, ids)
+        self.draw_grid_and_analyze(frame, corners, ids, roi, detected)
+        timer.draw_overlay(frame)
+        with timer.stage("visualizacion"): self.viewer.show(frame)
+        timer.tick()
     
-    def update_warehouse_view(self):
-        if not self.is_camera_active or not self.cap or not self.cap.isOpened(): return
-        ret, frame = self.cap.read()
-        if ret:
-            if self.flip_camera: frame = cv2.flip(frame, 1)
-            self.draw_grid_and_analyze(frame)
-            display_image_on_label(self, frame, self.camera_label)
-        self.after(50, self.update_warehouse_view)
+    def detection_roi(self, frame):
+        """Región que el servicio de visión debe analizar para esta pantalla."""
+        return self.get_roi(frame, self.x_offset_var.get(), self.y_offset_var.get(), self.grid_width_var.get(), self.grid_height_var.get())
         
-    def draw_grid_and_analyze(self, frame):
+    def get_roi(self, frame, x0, y0, grid_w, grid_h):
+        """Rectángulo de la rejilla más el margen si el modo ROI está activo; None para el frame completo."""
+        if not self.roi_var.get(): return None
+        try: margin = max(0, self.roi_margin_var.get())
+        except tk.TclError: margin = ROI_MARGEN
+        return roi_bounds(frame.shape, x0, y0, grid_w, grid_h, margin)
+
+    def draw_grid_and_analyze(self, frame, corners, ids, roi, detected=True):
         try:
             rows, cols = self.rows_var.get(), self.cols_var.get()
             if rows <= 0 or cols <= 0: raise tk.TclError
         except tk.TclError: self.setup_status_grid(); return
         
-        current_cols, current_rows = self.status_grid_frame.grid_size()
-        if rows != current_rows or cols != current_cols: self.setup_status_grid()
+        self.status_matrix.set_geometry(rows, cols)
         
         x0, y0 = self.x_offset_var.get(), self.y_offset_var.get(); grid_w, grid_h = self.grid_width_var.get(), self.grid_height_var.get()
-        cell_w, cell_h = (grid_w / cols) if cols > 0 else 0, (grid_h / rows) if rows > 0 else 0
-        gray = cv2.cvtColor(frame, cv2.COLOR_BGR2GRAY); corners, ids, _ = aruco.detectMarkers(gray, self.aruco_dict, parameters=self.aruco_params)
+        timer = self.controller.timer
+        # El antirrebote cuenta detecciones, no frames mostrados: sólo se actualiza con una detección nueva
+        # (o si cambió la geometría de la rejilla).
+        state = self.occupancy.state
+        if detected or state is None or state.shape != (rows, cols):
+            id_locations = marker_cells(corners, ids, rows, cols, x0, y0, grid_w, grid_h)
+            observed = np.full((rows, cols), -1, dtype=np.int32) # ID de marcador por celda; -1 vacía.
+            for (r, c), found_id in id_locations.items(): observed[r, c] = int(found_id)
+            if detected: self.controller.recorder.record(observed) # Sin E/S: el flush lo hace el hilo del registro.
+            with timer.stage("matriz"):
+                self.occupancy.update(observed) # Emite eventos sólo para las celdas que cambiaron de verdad.
+            occupied = int(np.count_nonzero(self.occupancy.state != -1))
+            self.controller.metrics.set("vision_cells", occupied, state="occupied"); self.controller.metrics.set("vision_cells", self.occupancy.state.size - occupied, state="empty")
         
-        id_locations = {}
-        if ids is not None:
-            aruco.drawDetectedMarkers(frame, corners, ids, borderColor=(0, 0, 255))
-            for i, corner_set in enumerate(corners):
-                cx, cy = int(np.mean(corner_set[0][:, 0])), int(np.mean(corner_set[0][:, 1]))
-                if x0 <= cx < x0 + grid_w and y0 <= cy < y0 + grid_h:
-                    c_idx, r_idx = int((cx - x0) / cell_w), int((cy - y0) / cell_h)
-                    if r_idx < rows and c_idx < cols: id_locations[(r_idx, c_idx)] = str(ids.flatten()[i])
+        with timer.stage("dibujo"):
+            if roi is not None: cv2.rectangle(frame, roi[:2], roi[2:], (128, 128, 128), 1)
+            if ids is not None: aruco.drawDetectedMarkers(frame, corners, ids, borderColor=(0, 0, 255))
+            draw_cells(frame, rows, cols, x0, y0, grid_w, grid_h, self.rect_colors)
+
+# =================================================================================
+# === SECCIÓN 6: ETAPA 4 - VARIAS ESTANTERÍAS (UNA CÁMARA Y UN PROCESO POR ESTANTERÍA) ===
+# =================================================================================
+class ShelvesScreen(tk.Frame):
+    """Inventario agregado de varias estanterías, cada una detectada en su propio proceso (ver estanterias.py)."""
+    def __init__(self, parent, controller):
+        super().__init__(parent, bg=BG_COLOR)
+        self.controller = controller
+        self.shelves = load_shelves(SHELVES_FILE); self.monitor = ShelfMonitor(self.shelves)
+        self.shelf_cells = {shelf['nombre']: {} for shelf in self.shelves} # Último {(fila, col): ID} de cada estantería.
+        
+        # --- Layout de la Interfaz ---
+        top_controls = tk.Frame(self, bg=BG_COLOR, pady=10, padx=20); top_controls.pack(fill="x")
+        tk.Label(top_controls, text=f"Estanterías ({len(self.shelves)}) - configuración en {SHELVES_FILE}", font=FONT_BOLD, bg=BG_COLOR, fg=TEXT_COLOR).pack(side="left")
+        tk.Button(top_controls, text="<< Volver al Almacén", command=lambda: controller.show_frame(WarehouseScreen), bg=BUTTON_BG, fg=BUTTON_FG, font=FONT_BOLD, relief='flat', padx=10, pady=5).pack(side="right")
         
-        for r in range(rows):
-            for c in range(cols):
-                x1, y1 = int(x0 + c * cell_w), int(y0 + r * cell_h); x2, y2 = int(x1 + cell_w), int(y1 + cell_h)
-                text, color, rect_color = "Vacío", FRAME_COLOR, (80, 80, 80)
-                if (r, c) in id_locations:
-                    found_id = id_locations[(r, c)]
-                    if piece := self.piece_db.get(found_id):
-                        text, color, rect_color = f"{piece['model']}\n ({piece['type']})\nID: {found_id}", SUCCESS_COLOR, (0, 255, 0)
-                    else:
-                        text, color, rect_color = f"ID: {found_id}\n(No asociado)", HIGHLIGHT_COLOR, (0, 191, 255)
-                
-                cv2.rectangle(frame, (x1, y1), (x2, y2), rect_color, 1)
-                if (r, c) in self.status_labels: self.status_labels[(r, c)].config(text=text, bg=color)
+        main_content_frame = tk.Frame(self, bg=BG_COLOR, padx=20, pady=10); main_content_frame.pack(fill="both", expand=True)
+        main_content_frame.grid_columnconfigure(0, weight=2); main_content_frame.grid_columnconfigure(1, weight=1); main_content_frame.grid_rowconfigure(0, weight=1)
+        
+        # Una matriz de estado por estantería, en dos columnas.
+        shelves_frame = tk.Frame(main_content_frame, bg=BG_COLOR); shelves_frame.grid(row=0, column=0, sticky="nsew", padx=(0, 10))
+        shelves_frame.grid_columnconfigure((0, 1), weight=1)
+        self.matrices, self.shelf_labels = {}, {}
+        for i, shelf in enumerate(self.shelves):
+            name = shelf['nombre']; shelves_frame.grid_rowconfigure(i // 2, weight=1)
+            box = tk.Frame(shelves_frame, bg=FRAME_COLOR, bd=2, relief='sunken'); box.grid(row=i // 2, column=i % 2, sticky="nsew", padx=5, pady=5)
+            self.shelf_labels[name] = tk.Label(box, text=f"{name} - cámara {shelf['camara']}: iniciando...", font=FONT_NORMAL, bg=FRAME_COLOR, fg=TEXT_COLOR); self.shelf_labels[name].pack(anchor='w', padx=5)
+            self.matrices[name] = StatusMatrix(box, empty_color=BG_COLOR, font=FONT_NORMAL); self.matrices[name].pack(fill="both", expand=True, padx=5, pady=5)
+            self.matrices[name].set_geometry(shelf['filas'], shelf['columnas'])
+        
+        # Inventario agregado: una fila por pieza (o ID sin asociar) con su cantidad y ubicaciones.
+        inventory_frame = tk.Frame(main_content_frame, bg=FRAME_COLOR, bd=2, relief='sunken', padx=10, pady=10); inventory_frame.grid(row=0, column=1, sticky="nsew")
+        tk.Label(inventory_frame, text="Inventario Total", font=FONT_BOLD, bg=FRAME_COLOR, fg=TEXT_COLOR).pack(pady=(0, 5))
+        self.inventory_tree = ttk.Treeview(inventory_frame, columns=("Pieza", "Cantidad", "Ubicaciones"), show="headings")
+        for col, width, stretch in (("Pieza", 160, True), ("Cantidad", 70, False), ("Ubicaciones", 200, True)):
+            self.inventory_tree.heading(col, text=col); self.inventory_tree.column(col, width=width, anchor='center', stretch=stretch)
+        self.inventory_tree.pack(fill="both", expand=True)
+        controller.pieces.subscribe(self.on_pieces_changed)
+    
+    def on_show(self):
+        self.controller.vision.stop() # Libera la cámara de las otras pantallas: los procesos abren las suyas.
+        self.monitor.start(); self.poll_results()
+    def on_hide(self): self.monitor.stop()
+    
+    def poll_results(self):
+        """Aplica los resultados que enviaron los procesos; sólo llegan mapas de celdas cuando cambian."""
+        if not self.monitor.is_running(): return
+        changed = False
+        for kind, name, data in self.monitor.poll():
+            if kind == "celdas": self.shelf_cells[name] = data; self.update_shelf(name); changed = True
+            elif kind == "estado": self.shelf_labels[name].config(text=f"{name}: {data:.1f} FPS")
+            else: self.shelf_labels[name].config(text=f"{name}: {data}", fg="#dc3545")
+        if changed: self.update_inventory()
+        self.after(100, self.poll_results)
+    
+    def update_shelf(self, name):
+        pieces = self.controller.pieces
+        self.matrices[name].update_cells({cell: piece_cell_style(pieces, found_id)[:2] for cell, found_id in self.shelf_cells[name].items()})
+    
+    def on_pieces_changed(self, changes):
+        for name, cells in self.shelf_cells.items():
+            if any(found_id in changes for found_id in cells.values()): self.update_shelf(name)
+        self.update_inventory()
+    
+    def update_inventory(self):
+        """Recalcula el inventario agregado y modifica sólo las filas que cambiaron."""
+        inventory = {}
+        for name, cells in self.shelf_cells.items():
+            for (r, c), found_id in sorted(cells.items()):
+                piece = self.controller.pieces.get(found_id)
+                key = f"{piece['model']} ({piece['type']})" if piece else f"ID {found_id} (No asociado)"
+                inventory.setdefault(key, []).append(f"{name} ({r + 1},{c + 1})")
+        for iid in self.inventory_tree.get_children():
+            if iid not in inventory: self.inventory_tree.delete(iid)
+        for key in sorted(inventory):
+            values = (key, len(inventory[key]), ", ".join(inventory[key]))
+            if not self.inventory_tree.exists(key): self.inventory_tree.insert("", "end", iid=key, values=values)
+            elif tuple(self.inventory_tree.item(key, 'values')) != tuple(map(str, values)): self.inventory_tree.item(key, values=values)
 
 # =================================================================================
-# === SECCIÓN 6: PUNTO DE ENTRADA DE LA APLICACIÓN ===
+# === SECCIÓN 7: PUNTO DE ENTRADA DE LA APLICACIÓN ===
 # =================================================================================
+def report_startup(app, video=None, limit=10.0):
+    """Modo --medir-arranque (ver bench_arranque.py): imprime cuándo (time.time()) la ventana queda
+    dibujada y cuándo la clasificación muestra su primer frame, y cierra la aplicación."""
+    emit = lambda event, t: print(json.dumps({"evento": event, "t": t}), flush=True)
+    app.update() # Procesa el mapeo y el primer dibujo de la ventana.
+    emit("ventana", time.time())
+
+    def first_frame(*_):
+        app.vision.unsubscribe(first_frame)
+        emit("frame", time.time()); app.after(0, app.on_close)
+    def give_up():
+        emit("frame", None); app.on_close()
+    # El mismo camino que el operador: construir la pantalla, abrir la cámara y mostrar el frame.
+    if video: app.vision.set_source(video)
+    app.show_frame(ClassificationScreen)
+    app.vision.subscribe(first_frame) # Después de la pantalla: se llama cuando ella ya dibujó el frame.
+    app.after(int(limit * 1000), give_up)
+
 if __name__ == "__main__":
-    app = App()
+    parser = argparse.ArgumentParser(description="Sistema de gestión de inventario por visión con ArUco.")
+    parser.add_argument("--servidor", help="host:puerto (o unix:ruta) de un servidor_vision.py; sin él se usa la cámara local.")
+    parser.add_argument("--medir-arranque", action="store_true", help="Imprime los tiempos de arranque y sale (ver bench_arranque.py).")
+    parser.add_argument("--video", help="Con --medir-arranque, video grabado en lugar de la cámara.")
+    args = parser.parse_args()
+    if args.medir_arranque: print(json.dumps({"evento": "importado", "t": time.time()}), flush=True)
+    app = App(servidor=args.servidor)
+    if args.medir_arranque: report_startup(app, args.video)
     app.mainloop()
 # =================================================================================
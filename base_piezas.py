@@ -0,0 +1,92 @@
+# =================================================================================
+# === BASE DE DATOS DE PIEZAS INDEXADA (SQLITE) ===
+# =================================================================================
+#
+# Reemplaza a piece_database.json. Las piezas se guardan en una tabla SQLite con
+# aruco_id como clave primaria y además se mantienen en un diccionario en memoria,
+# así que las consultas por ID (una por marcador y por frame en el almacén) no
+# tocan el disco. Las escrituras se agrupan en una sola transacción y, al
+# confirmarse, se avisa a los suscriptores sólo con las piezas que cambiaron.
+#
+# Si la base aún no existe y hay un piece_database.json, se importa una vez.
+#
+# =================================================================================
+
+import json
+import os
+import sqlite3
+
+# Campos de cada pieza, en el mismo formato que el JSON original.
+CAMPOS = ("aruco_id", "model", "type")
+
+
+class PieceStore:
+    """Piezas por aruco_id con consultas O(1), escrituras atómicas por lote y avisos de cambios."""
+
+    def __init__(self, path="piece_database.db", legacy_json=None):
+        self.path = path
+        new_db = not os.path.exists(path)
+        self.conn = sqlite3.connect(path)
+        self.conn.execute("CREATE TABLE IF NOT EXISTS pieces (aruco_id TEXT PRIMARY KEY, model TEXT NOT NULL, type TEXT NOT NULL)")
+        self._listeners = []
+        if new_db and legacy_json and os.path.exists(legacy_json): self._import_json(legacy_json)
+        # Orden de inserción (rowid), igual que el orden de la lista en el JSON.
+        rows = self.conn.execute("SELECT aruco_id, model, type FROM pieces ORDER BY rowid")
+        self._pieces = {row[0]: dict(zip(CAMPOS, row)) for row in rows}
+
+    def _import_json(self, legacy_json):
+        try:
+            with open(legacy_json, 'r') as f: entries = json.load(f)
+        except (json.JSONDecodeError, IOError): return
+        rows = [(str(e['aruco_id']), e['model'], e['type']) for e in entries if all(k in e for k in CAMPOS)]
+        with self.conn: self.conn.executemany("INSERT OR REPLACE INTO pieces VALUES (?, ?, ?)", rows)
+
+    def close(self):
+        self.conn.close()
+
+    # --- Consultas (desde memoria) ---
+    def get(self, aruco_id):
+        """Pieza {'aruco_id', 'model', 'type'} con ese ID (texto), o None."""
+        return self._pieces.get(aruco_id)
+
+    def __contains__(self, aruco_id): return aruco_id in self._pieces
+    def __len__(self): return len(self._pieces)
+    def all(self): return list(self._pieces.values())
+
+    # --- Escrituras (una transacción por llamada) ---
+    def put_many(self, entries):
+        """Inserta o actualiza varias piezas de forma atómica. Retorna {aruco_id: pieza} de las que cambiaron."""
+        changes = {}
+        for entry in entries:
+            piece = {k: str(entry[k]) for k in CAMPOS}
+            if self._pieces.get(piece['aruco_id']) != piece: changes[piece['aruco_id']] = piece
+        if not changes: return changes
+        with self.conn:
+            self.conn.executemany("INSERT INTO pieces VALUES (?, ?, ?) ON CONFLICT(aruco_id) DO UPDATE SET model = excluded.model, type = excluded.type",
+                                  [tuple(p[k] for k in CAMPOS) for p in changes.values()])
+        self._pieces.update(changes) # Sólo después de confirmar la transacción.
+        self._notify(changes)
+        return changes
+
+    def put(self, aruco_id, model, p_type):
+        return self.put_many([{"aruco_id": aruco_id, "model": model, "type": p_type}])
+
+    def delete_many(self, ids):
+        """Elimina varias piezas de forma atómica. Retorna {aruco_id: None} de las eliminadas."""
+        changes = {aruco_id: None for aruco_id in ids if aruco_id in self._pieces}
+        if not changes: return changes
+        with self.conn: self.conn.executemany("DELETE FROM pieces WHERE aruco_id = ?", [(i,) for i in changes])
+        for aruco_id in changes: del self._pieces[aruco_id]
+        self._notify(changes)
+        return changes
+
+    # --- Avisos de cambios ---
+    def subscribe(self, callback):
+        """callback(changes) con {aruco_id: pieza nueva, o None si se eliminó} tras cada escritura."""
+        self._listeners.append(callback)
+
+    def unsubscribe(self, callback):
+        if callback in self._listeners: self._listeners.remove(callback)
+
+    def _notify(self, changes):
+        for callback in list(self._listeners): callback(changes)
@@ -0,0 +1,88 @@
+# =================================================================================
+# === BENCHMARK DEL ARRANQUE DE LA APLICACIÓN ===
+# =================================================================================
+#
+# Lanza Tarea5_Parra.py --medir-arranque varias veces, cada una en un proceso
+# nuevo (como al reiniciar la estación), y mide desde el lanzamiento:
+#   importado: fin de los imports del módulo (intérprete + cv2, numpy, Tk...).
+#   ventana:   la ventana de bienvenida dibujada y usable.
+#   frame:     la pantalla de clasificación construida y mostrando el primer frame.
+# El reporte (mediana, mínimo y máximo en ms por etapa) se escribe en JSON.
+# Necesita una pantalla; sin cámara se puede usar un video grabado.
+#
+# Ejemplos:
+#   python bench_arranque.py --video grabacion.avi
+#   python bench_arranque.py --repeticiones 5 --servidor 127.0.0.1:8765
+#
+# =================================================================================
+
+import argparse
+import json
+import os
+import platform
+import statistics
+import subprocess
+import sys
+import time
+
+APP = os.path.join(os.path.dirname(os.path.abspath(__file__)), "Tarea5_Parra.py")
+EVENTOS = ("importado", "ventana", "frame")
+# Tiempo para que la ventana quede usable que se busca al reiniciar la estación.
+OBJETIVO_VENTANA_MS = 1000
+
+def run_once(extra_args, limit):
+    """{evento: ms desde el lanzamiento (None si no ocurrió), "timeout": bool} de una ejecución."""
+    start = time.time()
+    times = dict.fromkeys(EVENTOS)
+    try:
+        process = subprocess.run([sys.executable, APP, "--medir-arranque", *extra_args], cwd=os.path.dirname(APP),
+                                 capture_output=True, text=True, timeout=limit)
+        stdout, stderr, times["timeout"] = process.stdout, process.stderr, False
+    except subprocess.TimeoutExpired as e:
+        # Un arranque colgado no corta el benchmark: cuenta lo que alcanzó a informar.
+        decode = lambda data: data.decode("utf-8", "replace") if isinstance(data, bytes) else (data or "")
+        stdout, stderr, times["timeout"] = decode(e.stdout), decode(e.stderr), True
+        print(f"ADVERTENCIA: La ejecución superó el límite de {limit:g} s.", file=sys.stderr)
+    for line in stdout.splitlines():
+        try: message = json.loads(line)
+        except ValueError: continue # Otras salidas de la aplicación.
+        if isinstance(message, dict) and message.get("evento") in times and message["t"] is not None:
+            times[message["evento"]] = (message["t"] - start) * 1000
+    if times["ventana"] is None: print(stderr.strip(), file=sys.stderr)
+    return times
+
+def summarize(samples):
+    values = [v for v in samples if v is not None]
+    if not values: return {"mediana_ms": None, "min_ms": None, "max_ms": None, "fallidas": len(samples)}
+    return {"mediana_ms": round(statistics.median(values), 1), "min_ms": round(min(values), 1),
+            "max_ms": round(max(values), 1), "fallidas": len(samples) - len(values)}
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Tiempo hasta la ventana usable y hasta el primer frame de Tarea5_Parra.py.")
+    parser.add_argument("--salida", default="-", help="Archivo JSON del reporte. '-' para la salida estándar.")
+    parser.add_argument("--repeticiones", type=int, default=10)
+    parser.add_argument("--video", help="Video grabado en lugar de la cámara.")
+    parser.add_argument("--servidor", help="host:puerto de un servidor_vision.py (la aplicación no abre la cámara).")
+    parser.add_argument("--limite", type=float, default=30.0, help="Segundos máximos por ejecución.")
+    args = parser.parse_args(argv)
+    extra_args = (["--video", args.video] if args.video else []) + (["--servidor", args.servidor] if args.servidor else [])
+
+    runs = []
+    for i in range(args.repeticiones):
+        runs.append(run_once(extra_args, args.limite))
+        print(f"Ejecución {i + 1}: " + ", ".join(f"{e} {'-' if runs[-1][e] is None else f'{runs[-1][e]:.0f} ms'}" for e in EVENTOS), file=sys.stderr)
+
+    stages = {event: summarize([run[event] for run in runs]) for event in EVENTOS}
+    window = stages["ventana"]["mediana_ms"]
+    report = {"python": platform.python_version(), "maquina": platform.machine(), "procesador": platform.processor(),
+              "repeticiones": args.repeticiones, "timeouts": sum(run["timeout"] for run in runs), "video": args.video, "servidor": args.servidor,
+              "objetivo_ventana_ms": OBJETIVO_VENTANA_MS, "cumple_objetivo": window is not None and window <= OBJETIVO_VENTANA_MS,
+              "etapas": stages, "ejecuciones": runs}
+    text = json.dumps(report, indent=2, ensure_ascii=False)
+    if args.salida == "-": print(text)
+    else:
+        with open(args.salida, "w", encoding="utf-8") as f: f.write(text)
+    return 0
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,183 @@
+# =================================================================================
+# === BENCHMARK DE LOS PIPELINES DE CONTEO Y ARUCO ===
+# =================================================================================
+#
+# Genera frames sintéticos con una cantidad conocida de manchas y frames con
+# marcadores ArUco (DICT_5X5_100) en celdas conocidas, y mide por etapa el
+# tiempo de la lógica de process_frame/check_grid_status (TEST.py) y de
+# draw_grid_and_analyze (Tarea5) para varias resoluciones, cantidades de
+# manchas y tamaños de grilla. El reporte se escribe en JSON.
+#
+# Ejemplos:
+#   python bench_pipeline.py --salida bench.json
+#   python bench_pipeline.py --rapido
+#
+# =================================================================================
+
+import argparse
+import json
+import platform
+import sys
+import time
+
+import cv2
+import cv2.aruco as aruco
+import numpy as np
+
+from conteo import MIN_AREA_MANCHA, UMBRAL_ALTO, UMBRAL_BAJO, blob_mask, blob_table, draw_blobs, grid_occupancy, preprocess
+from detector_aruco import ESCALAS_DETECCION, detect_markers, marker_cells
+from grilla import draw_cells, draw_grid_lines
+
+RESOLUCIONES = {"VGA": (640, 480), "HD": (1280, 720), "FHD": (1920, 1080), "4K": (3840, 2160)}
+CANTIDADES_MANCHAS = [10, 100, 500]
+GRILLAS = [(3, 2), (10, 10), (50, 50)]
+
+# =================================================================================
+# === FRAMES SINTÉTICOS ===
+# =================================================================================
+
+def grid_rect(width, height):
+    """Rectángulo de la grilla usado en los frames sintéticos: el 80% central del frame."""
+    return int(width * 0.1), int(height * 0.1), int(width * 0.8), int(height * 0.8)
+
+def synthetic_blob_frame(width, height, n_blobs, rng):
+    """Frame BGR oscuro con n_blobs círculos claros (dentro del rango de umbral) que no se tocan."""
+    frame = rng.integers(20, 60, size=(height, width), dtype=np.uint8)
+    # Los círculos se ubican en puntos distintos de una malla, con espacio suficiente
+    # para que el desenfoque no los una; la malla se achica para la cantidad pedida.
+    # Si aun así no caben, se usan todos los puntos y el reporte indica la cantidad real.
+    radius = 10 # Con el desenfoque 7x7, el área que queda en el rango de umbral sigue sobre MIN_AREA_MANCHA.
+    for step in (radius * 4, radius * 3):
+        xs, ys = np.arange(step, width - step, step), np.arange(step, height - step, step)
+        if len(xs) * len(ys) >= n_blobs: break
+    points = np.array([(x, y) for y in ys for x in xs])
+    n_blobs = min(n_blobs, len(points))
+    centers = points[rng.choice(len(points), size=n_blobs, replace=False)]
+    for x, y in centers:
+        cv2.circle(frame, (int(x), int(y)), radius, 205, -1)
+    return cv2.cvtColor(frame, cv2.COLOR_GRAY2BGR), centers
+
+def synthetic_aruco_frame(width, height, rows, cols, n_markers, rng, aruco_dict):
+    """Frame con marcadores en celdas aleatorias de la grilla. Retorna (frame, {(fila, col): id})."""
+    frame = np.full((height, width, 3), 255, dtype=np.uint8)
+    x0, y0, grid_w, grid_h = grid_rect(width, height)
+    cell_w, cell_h = grid_w / cols, grid_h / rows
+    side = int(min(cell_w, cell_h) * 0.6)
+    expected = {}
+    if side < 12: return frame, expected # Celdas demasiado chicas para dibujar un marcador.
+    n_markers = min(n_markers, rows * cols, 100)
+    cells = rng.choice(rows * cols, size=n_markers, replace=False)
+    for marker_id, cell in enumerate(cells.tolist()):
+        r, c = divmod(cell, cols)
+        cx, cy = int(x0 + (c + 0.5) * cell_w), int(y0 + (r + 0.5) * cell_h)
+        marker = aruco.generateImageMarker(aruco_dict, marker_id, side)
+        frame[cy - side // 2:cy - side // 2 + side, cx - side // 2:cx - side // 2 + side] = marker[..., None]
+        expected[(r, c)] = str(marker_id)
+    return frame, expected
+
+# =================================================================================
+# === MEDICIÓN ===
+# =================================================================================
+
+def time_stage(fn, repeats):
+    """Ejecuta fn repeats veces (tras una vuelta de calentamiento) y retorna estadísticas en ms."""
+    result = fn()
+    samples = []
+    for _ in range(repeats):
+        t0 = time.perf_counter()
+        fn()
+        samples.append((time.perf_counter() - t0) * 1000.0)
+    samples = np.array(samples)
+    stats = {"mediana_ms": float(np.median(samples)), "p95_ms": float(np.percentile(samples, 95)),
+             "media_ms": float(samples.mean()), "min_ms": float(samples.min())}
+    return result, stats
+
+def bench_counting(name, width, height, n_blobs, rows, cols, repeats, rng):
+    frame, centers = synthetic_blob_frame(width, height, n_blobs, rng)
+    x0, y0, grid_w, grid_h = grid_rect(width, height)
+
+    blurred, t_blur = time_stage(lambda: preprocess(frame), repeats)
+    thresholded, t_thr = time_stage(lambda: cv2.inRange(blurred, UMBRAL_BAJO, UMBRAL_ALTO), repeats)
+    (labels, blobs), t_blobs = time_stage(lambda: blob_table(thresholded, MIN_AREA_MANCHA), repeats)
+    _, t_grid = time_stage(lambda: grid_occupancy(blobs, rows, cols, x0, y0, grid_w, grid_h), repeats)
+
+    def draw():
+        img_entrada = frame.copy()
+        img_umbral = cv2.cvtColor(thresholded, cv2.COLOR_GRAY2RGB)
+        draw_grid_lines(img_entrada, rows, cols, x0, y0, grid_w, grid_h)
+        img_umbral[blob_mask(labels, blobs)] = (0, 255, 0)
+        draw_blobs(img_entrada, img_umbral, blobs)
+    _, t_draw = time_stage(draw, repeats)
+
+    base = {"pipeline": "conteo", "resolucion": name, "ancho": width, "alto": height,
+            "manchas": len(centers), "filas": rows, "columnas": cols,
+            "manchas_detectadas": int(len(blobs)), "conteo_correcto": bool(len(blobs) == len(centers))}
+    stages = {"gris_desenfoque": t_blur, "umbral": t_thr, "tabla_manchas": t_blobs, "ocupacion": t_grid, "dibujo": t_draw}
+    return [dict(base, etapa=etapa, **t) for etapa, t in stages.items()]
+
+def bench_aruco(name, width, height, rows, cols, repeats, rng, aruco_dict, aruco_params, scale=1.0):
+    frame, expected = synthetic_aruco_frame(width, height, rows, cols, rows * cols, rng, aruco_dict)
+    x0, y0, grid_w, grid_h = grid_rect(width, height)
+
+    gray, t_gray = time_stage(lambda: cv2.cvtColor(frame, cv2.COLOR_BGR2GRAY), repeats)
+    (corners, ids), t_detect = time_stage(lambda: detect_markers(gray, aruco_dict, aruco_params, scale=scale), repeats)
+    found, t_assign = time_stage(lambda: marker_cells(corners, ids, rows, cols, x0, y0, grid_w, grid_h), repeats)
+
+    def draw():
+        img = frame.copy()
+        if ids is not None: aruco.drawDetectedMarkers(img, corners, ids, borderColor=(0, 0, 255))
+        draw_cells(img, rows, cols, x0, y0, grid_w, grid_h, {cell: (0, 255, 0) for cell in found})
+    _, t_draw = time_stage(draw, repeats)
+
+    hits = sum(1 for cell, marker_id in expected.items() if found.get(cell) == marker_id)
+    base = {"pipeline": "aruco", "resolucion": name, "ancho": width, "alto": height,
+            "marcadores": len(expected), "filas": rows, "columnas": cols, "escala": scale,
+            "marcadores_detectados": hits, "recall": (hits / len(expected)) if expected else None}
+    stages = {"gris": t_gray, "deteccion": t_detect, "asignacion_celdas": t_assign, "dibujo": t_draw}
+    return [dict(base, etapa=etapa, **t) for etapa, t in stages.items()]
+
+# =================================================================================
+# === PUNTO DE ENTRADA ===
+# =================================================================================
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Benchmark por etapa de los pipelines de conteo y ArUco.")
+    parser.add_argument("--salida", default="-", help="Archivo JSON del reporte. '-' para la salida estándar.")
+    parser.add_argument("--repeticiones", type=int, default=20)
+    parser.add_argument("--resoluciones", nargs="+", choices=list(RESOLUCIONES), default=list(RESOLUCIONES))
+    parser.add_argument("--pipelines", nargs="+", choices=("conteo", "aruco"), default=["conteo", "aruco"])
+    parser.add_argument("--escalas", type=float, nargs="+", default=list(ESCALAS_DETECCION), help="Escalas del modo pirámide ArUco.")
+    parser.add_argument("--rapido", action="store_true", help="Sólo VGA y HD, 5 repeticiones.")
+    parser.add_argument("--semilla", type=int, default=0)
+    args = parser.parse_args(argv)
+    if args.rapido:
+        args.resoluciones, args.repeticiones = ["VGA", "HD"], 5
+
+    rng = np.random.default_rng(args.semilla)
+    aruco_dict = aruco.getPredefinedDictionary(aruco.DICT_5X5_100)
+    aruco_params = aruco.DetectorParameters()
+    aruco_params.cornerRefinementMethod = aruco.CORNER_REFINE_SUBPIX
+
+    results = []
+    for name in args.resoluciones:
+        width, height = RESOLUCIONES[name]
+        for rows, cols in GRILLAS:
+            if "conteo" in args.pipelines:
+                for n_blobs in CANTIDADES_MANCHAS:
+                    results += bench_counting(name, width, height, n_blobs, rows, cols, args.repeticiones, rng)
+            if "aruco" in args.pipelines:
+                for scale in args.escalas:
+                    results += bench_aruco(name, width, height, rows, cols, args.repeticiones, rng, aruco_dict, aruco_params, scale)
+        print(f"{name} listo.", file=sys.stderr)
+
+    report = {"opencv": cv2.__version__, "numpy": np.__version__, "python": platform.python_version(),
+              "maquina": platform.machine(), "procesador": platform.processor(), "hilos_opencv": cv2.getNumThreads(),
+              "repeticiones": args.repeticiones, "resultados": results}
+    text = json.dumps(report, indent=2, ensure_ascii=False)
+    if args.salida == "-": print(text)
+    else:
+        with open(args.salida, "w", encoding="utf-8") as f: f.write(text)
+    return 0
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,102 @@
+# =================================================================================
+# === CAPTURA DE CÁMARA EN SEGUNDO PLANO ===
+# =================================================================================
+#
+# El hilo de captura es el único dueño del cv2.VideoCapture. Lee frames de forma
+# continua y los deja en un buffer acotado que sólo conserva los más recientes:
+# si la GUI no alcanza a consumirlos, los frames viejos se descartan en vez de
+# acumularse en el driver. Así los bucles de Tkinter nunca se bloquean en
+# cap.read() y siempre trabajan sobre la imagen más nueva.
+#
+# Si la lectura falla (cámara desconectada), el hilo espera cada vez más entre
+# intentos y, tras SEGUNDOS_SIN_FRAMES sin un frame, se detiene: is_running()
+# pasa a False y la GUI lo trata igual que una cámara detenida.
+#
+# =================================================================================
+
+import threading
+import time
+from collections import deque
+
+import cv2
+
+# Espera inicial y máxima entre lecturas fallidas, y tiempo sin frames tras el que se abandona la cámara.
+ESPERA_FALLO = 0.005
+ESPERA_FALLO_MAX = 0.5
+SEGUNDOS_SIN_FRAMES = 5.0
+
+
+class CameraCapture:
+    """Hilo de captura que publica el último frame leído junto a su marca de tiempo."""
+
+    def __init__(self, index=0, flip=False, buffer_size=1):
+        self.index = index
+        self.flip = flip
+        self.cap = None
+        self.frames_read = 0
+        self.frames_dropped = 0
+        self._buffer = deque(maxlen=max(1, buffer_size))
+        self._lock = threading.Lock()
+        self._running = False
+        self._thread = None
+
+    def start(self):
+        """Abre la cámara y lanza el hilo de captura. Retorna False si no se pudo abrir."""
+        if self._running: return True
+        self.cap = cv2.VideoCapture(self.index)
+        if not self.cap.isOpened():
+            self.cap.release(); self.cap = None
+            return False
+        # Se pide al driver el buffer mínimo; no todos los backends lo respetan.
+        self.cap.set(cv2.CAP_PROP_BUFFERSIZE, 1)
+        self._running = True
+        self._thread = threading.Thread(target=self._loop, name=f"captura-{self.index}", daemon=True)
+        self._thread.start()
+        return True
+
+    def stop(self):
+        """Detiene el hilo y libera la cámara."""
+        self._running = False
+        if self._thread is not None:
+            self._thread.join(timeout=1.0)
+            self._thread = None
+        if self.cap is not None:
+            self.cap.release(); self.cap = None
+        with self._lock: self._buffer.clear()
+
+    def is_running(self):
+        return self._running
+
+    def _loop(self):
+        delay, failing_since = ESPERA_FALLO, None
+        while self._running:
+            ret, frame = self.cap.read()
+            if not ret:
+                now = time.monotonic()
+                if failing_since is None: failing_since = now
+                elif now - failing_since >= SEGUNDOS_SIN_FRAMES:
+                    print(f"ADVERTENCIA: La cámara {self.index} no entrega frames hace {SEGUNDOS_SIN_FRAMES:g} s; se detiene la captura.")
+                    self._running = False # La cámara la libera stop(), desde el hilo que la abrió.
+                    break
+                time.sleep(delay); delay = min(delay * 2, ESPERA_FALLO_MAX)
+                continue
+            delay, failing_since = ESPERA_FALLO, None
+            timestamp = time.time()
+            if self.flip: frame = cv2.flip(frame, 1)
+            with self._lock:
+                if len(self._buffer) == self._buffer.maxlen: self.frames_dropped += 1
+                self._buffer.append((frame, timestamp))
+                self.frames_read += 1
+
+    def read(self):
+        """Entrega el frame más reciente no consumido y su marca de tiempo, o (None, None).
+
+        El frame pasa a ser del llamador: el hilo de captura no vuelve a tocarlo,
+        por lo que se puede dibujar sobre él sin copiarlo.
+        """
+        with self._lock:
+            if not self._buffer: return None, None
+            frame, timestamp = self._buffer.pop()
+            self.frames_dropped += len(self._buffer)
+            self._buffer.clear()
+        return frame, timestamp
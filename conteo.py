@@ -0,0 +1,156 @@
+# =================================================================================
+# === LÓGICA DE CONTEO DE MANCHAS (SIN INTERFAZ) ===
+# =================================================================================
+#
+# Contiene los pasos de visión de process_frame y check_grid_status separados
+# de Tkinter, para poder usarlos tanto desde la GUI como desde procesos por lotes.
+#
+# =================================================================================
+
+import cv2
+import numpy as np
+
+from grilla import crop, grid_geometry
+from metricas import NULL_TIMER
+
+# --- Parámetros de detección por defecto ---
+MIN_AREA_MANCHA = 200
+UMBRAL_BAJO = 180
+UMBRAL_ALTO = 230
+
+# --- Tabla de manchas ---
+# Una fila por mancha, calculada en una sola pasada con connectedComponentsWithStats.
+# El filtrado por área, la asignación a la grilla y el dibujo leen todos esta tabla.
+# El área es la cantidad de píxeles de la mancha: una pieza con forma de anillo no
+# suma su hueco, y lo que quede dentro del hueco cuenta como otra mancha (los
+# contornos externos de antes rellenaban el hueco; hacerlo en cada frame costaba
+# más que el etiquetado y la escena normal no tiene huecos).
+BLOB_DTYPE = np.dtype([
+    ("label", np.int32), ("area", np.int32),
+    ("x", np.int32), ("y", np.int32), ("w", np.int32), ("h", np.int32),
+    ("cx", np.float32), ("cy", np.float32),
+])
+
+def blob_table(thresholded, min_area=MIN_AREA_MANCHA):
+    """Etiqueta la imagen binaria y retorna (imagen de etiquetas, tabla de manchas con área mayor a min_area)."""
+    _, labels, stats, centroids = cv2.connectedComponentsWithStats(thresholded, connectivity=8)
+    keep = np.flatnonzero(stats[1:, cv2.CC_STAT_AREA] > min_area) + 1 # La etiqueta 0 es el fondo.
+    blobs = np.empty(len(keep), dtype=BLOB_DTYPE)
+    blobs["label"] = keep
+    blobs["area"] = stats[keep, cv2.CC_STAT_AREA]
+    blobs["x"], blobs["y"] = stats[keep, cv2.CC_STAT_LEFT], stats[keep, cv2.CC_STAT_TOP]
+    blobs["w"], blobs["h"] = stats[keep, cv2.CC_STAT_WIDTH], stats[keep, cv2.CC_STAT_HEIGHT]
+    blobs["cx"], blobs["cy"] = centroids[keep, 0], centroids[keep, 1]
+    return labels, blobs
+
+def blob_mask(labels, blobs):
+    """Máscara booleana con los píxeles de las manchas de la tabla (las filtradas por área quedan fuera)."""
+    lut = np.zeros(int(labels.max()) + 1, dtype=bool)
+    lut[blobs["label"]] = True
+    return lut[labels]
+
+def preprocess(frame):
+    """Escala de grises y desenfoque gaussiano 7x7."""
+    gray = cv2.cvtColor(frame, cv2.COLOR_BGR2GRAY) if frame.ndim == 3 else frame
+    return cv2.GaussianBlur(gray, (7, 7), 0)
+
+def offset_blobs(blobs, roi):
+    """Lleva las coordenadas de la tabla (calculadas dentro del roi) al frame completo."""
+    if roi is not None and len(blobs):
+        x1, y1 = roi[0], roi[1]
+        blobs["x"] += x1; blobs["cx"] += x1
+        blobs["y"] += y1; blobs["cy"] += y1
+    return blobs
+
+def find_blobs(frame, lower=UMBRAL_BAJO, upper=UMBRAL_ALTO, min_area=MIN_AREA_MANCHA, roi=None):
+    """Umbraliza el frame y retorna (imagen umbralizada, imagen de etiquetas, tabla de manchas).
+
+    Con roi=(x1, y1, x2, y2) sólo se procesa esa región: las imágenes retornadas
+    tienen el tamaño del roi, pero la tabla queda en coordenadas del frame completo.
+    """
+    thresholded = cv2.inRange(preprocess(crop(frame, roi)), lower, upper)
+    labels, blobs = blob_table(thresholded, min_area)
+    return thresholded, labels, offset_blobs(blobs, roi)
+
+def grid_occupancy(blobs, rows, cols, x0, y0, grid_w, grid_h, row_sizes=None, col_sizes=None):
+    """Retorna una matriz rows x cols con 1 en las celdas que contienen el centroide de alguna mancha."""
+    matriz_estado = np.zeros((rows, cols), dtype=int)
+    if rows <= 0 or cols <= 0: # Evitar división por cero
+        return matriz_estado
+
+    # Cada centroide se busca en el mapa píxel -> celda de la grilla (-1 fuera de ella).
+    geometry = grid_geometry(rows, cols, x0, y0, grid_w, grid_h, row_sizes, col_sizes)
+    cells = geometry.cell_ids(blobs["cx"].astype(int), blobs["cy"].astype(int))
+    matriz_estado.flat[cells[cells >= 0]] = 1
+
+    return matriz_estado
+
+def draw_blobs(img_entrada, img_umbral, blobs):
+    """Dibuja el rectángulo y el número de cada mancha sobre la imagen real y la umbralizada."""
+    columnas = (blobs[k].astype(int).tolist() for k in ("x", "y", "w", "h", "cx", "cy"))
+    for i, (x, y, w, h, cX, cY) in enumerate(zip(*columnas)):
+        cv2.rectangle(img_entrada, (x, y), (x + w, y + h), (0, 255, 0), 2)
+        cv2.putText(img_entrada, str(i + 1), (cX - 10, cY + 10), cv2.FONT_HERSHEY_TRIPLEX, 1, (0, 0, 255), 2)
+        cv2.putText(img_umbral, str(i + 1), (cX - 10, cY + 10), cv2.FONT_HERSHEY_TRIPLEX, 1, (0, 0, 255), 2)
+
+# --- Pipeline con caché por etapas ---
+# Cada etapa guarda su último resultado junto con la clave que lo produjo: la
+# identidad del frame de entrada más los parámetros de esa etapa y de las
+# anteriores. Al mover un slider sólo se recalculan las etapas cuya clave cambió;
+# por ejemplo, un cambio de umbral no repite la escala de grises ni el desenfoque,
+# y un cambio de la grilla sólo repite la asignación de celdas.
+class CountingPipeline:
+    """Etapas de conteo (desenfoque -> umbral -> manchas -> ocupación) con caché."""
+
+    def __init__(self, timer=NULL_TIMER):
+        self.timer = timer # Mide sólo las etapas que realmente se recalculan.
+        self._frame = None
+        self._frame_token = 0
+        self._cache = {}
+
+    def _cached(self, stage, key, compute):
+        cached = self._cache.get(stage)
+        if cached is not None and cached[0] == key: return cached[1]
+        value = compute()
+        self._cache[stage] = (key, value)
+        return value
+
+    def _token(self, frame):
+        # Se compara la identidad del objeto (no su contenido): cada frame nuevo de la
+        # cámara es un arreglo distinto, mientras que una imagen cargada se reutiliza.
+        if frame is not self._frame:
+            self._frame = frame
+            self._frame_token += 1
+        return self._frame_token
+
+    # El roi forma parte de la clave desde la primera etapa: con el modo ROI activo,
+    # mover la grilla cambia la región recortada y obliga a repetir el desenfoque.
+    def blurred(self, frame, roi=None):
+        key = (self._token(frame), roi)
+        def compute():
+            with self.timer.stage("desenfoque"): return preprocess(crop(frame, roi))
+        return self._cached("blurred", key, compute)
+
+    def threshold(self, frame, lower, upper, roi=None):
+        key = (self._token(frame), roi, lower, upper)
+        def compute():
+            blurred = self.blurred(frame, roi)
+            with self.timer.stage("umbral"): return cv2.inRange(blurred, lower, upper)
+        return self._cached("threshold", key, compute)
+
+    def blobs(self, frame, lower, upper, min_area=MIN_AREA_MANCHA, roi=None):
+        """Igual que find_blobs, pero reutilizando las etapas cuya clave no cambió."""
+        key = (self._token(frame), roi, lower, upper, min_area)
+        def compute():
+            thresholded = self.threshold(frame, lower, upper, roi)
+            with self.timer.stage("manchas"):
+                labels, blobs = blob_table(thresholded, min_area)
+                return thresholded, labels, offset_blobs(blobs, roi)
+        return self._cached("blobs", key, compute)
+
+    def occupancy(self, frame, lower, upper, min_area, rows, cols, x0, y0, grid_w, grid_h, roi=None):
+        key = (self._token(frame), roi, lower, upper, min_area, rows, cols, x0, y0, grid_w, grid_h)
+        def compute():
+            _, _, blobs = self.blobs(frame, lower, upper, min_area, roi)
+            with self.timer.stage("ocupacion"): return grid_occupancy(blobs, rows, cols, x0, y0, grid_w, grid_h)
+        return self._cached("occupancy", key, compute)
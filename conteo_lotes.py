@@ -0,0 +1,130 @@
+# =================================================================================
+# === CONTEO DE MANCHAS POR LOTES (SIN INTERFAZ GRÁFICA) ===
+# =================================================================================
+#
+# Procesa un directorio o patrón glob de imágenes con la misma lógica de conteo
+# de TEST.py, repartiendo las imágenes en un pool de procesos y escribiendo el
+# resultado de cada imagen a CSV o JSONL a medida que se obtiene.
+#
+# Ejemplo:
+#   python conteo_lotes.py fotos/ "otras/*.png" --salida conteo.csv \
+#       --umbral-bajo 180 --umbral-alto 230 --grilla 40 10 400 300 --filas 3 --columnas 2
+#
+# =================================================================================
+
+import argparse
+import csv
+import glob
+import json
+import os
+import sys
+from multiprocessing import Pool
+
+import cv2
+
+from conteo import MIN_AREA_MANCHA, UMBRAL_ALTO, UMBRAL_BAJO, find_blobs, grid_occupancy
+from grilla import roi_bounds
+
+EXTENSIONES = (".jpg", ".jpeg", ".png", ".bmp", ".tif", ".tiff")
+
+def expand_inputs(entradas):
+    """Convierte directorios y patrones glob en una lista ordenada de rutas de imagen."""
+    rutas = []
+    for entrada in entradas:
+        if os.path.isdir(entrada):
+            candidatos = [os.path.join(entrada, n) for n in os.listdir(entrada)]
+        else:
+            candidatos = glob.glob(entrada, recursive=True)
+        rutas.extend(p for p in candidatos if p.lower().endswith(EXTENSIONES) and os.path.isfile(p))
+    return sorted(set(rutas))
+
+# --- Trabajo de cada proceso ---
+# Los parámetros se fijan una vez por proceso en el inicializador para no
+# serializarlos con cada imagen.
+_params = {}
+
+def _init_worker(params):
+    global _params
+    _params = params
+    cv2.setNumThreads(1) # El paralelismo lo da el pool; evita sobre-suscribir los núcleos.
+
+def count_image(path):
+    """Cuenta las manchas de una imagen y, si hay grilla configurada, calcula su ocupación."""
+    frame = cv2.imread(path)
+    if frame is None:
+        return {"archivo": path, "error": "no se pudo leer la imagen"}
+    roi = None
+    if _params.get("grid") and _params.get("roi_margin") is not None:
+        roi = roi_bounds(frame.shape, *_params["grid"], _params["roi_margin"])
+    _, _, manchas = find_blobs(frame, _params["lower"], _params["upper"], _params["min_area"], roi)
+    resultado = {"archivo": path, "manchas": len(manchas)}
+    if _params.get("grid"):
+        x0, y0, grid_w, grid_h = _params["grid"]
+        matriz = grid_occupancy(manchas, _params["rows"], _params["cols"], x0, y0, grid_w, grid_h)
+        resultado["ocupadas"] = int(matriz.sum())
+        resultado["ocupacion"] = matriz.tolist()
+    return resultado
+
+# --- Escritura de resultados ---
+class ResultWriter:
+    """Escribe los resultados en CSV o JSONL, una línea por imagen (o por frame, con fields propios)."""
+    def __init__(self, stream, fmt, with_grid=False, fields=None):
+        self.stream, self.fmt = stream, fmt
+        if fmt == "csv":
+            campos = fields or ["archivo", "manchas"] + (["ocupadas", "ocupacion"] if with_grid else []) + ["error"]
+            self.writer = csv.DictWriter(stream, fieldnames=campos, extrasaction="ignore")
+            self.writer.writeheader()
+
+    def write(self, resultado):
+        if self.fmt == "csv":
+            fila = dict(resultado)
+            if "ocupacion" in fila: # Filas separadas por ';' y columnas por ','.
+                fila["ocupacion"] = ";".join(",".join(str(v) for v in r) for r in fila["ocupacion"])
+            self.writer.writerow(fila)
+        else:
+            self.stream.write(json.dumps(resultado, ensure_ascii=False) + "\n")
+        self.stream.flush()
+
+def parse_args(argv=None):
+    parser = argparse.ArgumentParser(description="Conteo de manchas por lotes, sin interfaz gráfica.")
+    parser.add_argument("entradas", nargs="+", help="Directorios o patrones glob de imágenes.")
+    parser.add_argument("--salida", default="-", help="Archivo de salida (.csv o .jsonl). '-' para la salida estándar.")
+    parser.add_argument("--formato", choices=("csv", "jsonl"), help="Formato de salida; por defecto se deduce de la extensión.")
+    parser.add_argument("--umbral-bajo", type=int, default=UMBRAL_BAJO)
+    parser.add_argument("--umbral-alto", type=int, default=UMBRAL_ALTO)
+    parser.add_argument("--area-min", type=int, default=MIN_AREA_MANCHA)
+    parser.add_argument("--grilla", type=int, nargs=4, metavar=("X0", "Y0", "ANCHO", "ALTO"), help="Rectángulo de la grilla para calcular ocupación.")
+    parser.add_argument("--filas", type=int, default=3)
+    parser.add_argument("--columnas", type=int, default=2)
+    parser.add_argument("--roi-margen", type=int, help="Procesar sólo la grilla más este margen en píxeles (requiere --grilla).")
+    parser.add_argument("--procesos", type=int, default=os.cpu_count(), help="Cantidad de procesos del pool.")
+    parser.add_argument("--chunksize", type=int, default=8, help="Imágenes entregadas a cada proceso por envío.")
+    args = parser.parse_args(argv)
+    if args.formato is None:
+        args.formato = "jsonl" if args.salida.lower().endswith((".jsonl", ".json")) else "csv"
+    if args.grilla and (args.filas <= 0 or args.columnas <= 0):
+        parser.error("Filas y columnas deben ser mayores a cero.")
+    return args
+
+def main(argv=None):
+    args = parse_args(argv)
+    rutas = expand_inputs(args.entradas)
+    if not rutas:
+        print("ADVERTENCIA: No se encontraron imágenes.", file=sys.stderr)
+        return 1
+
+    params = {"lower": args.umbral_bajo, "upper": args.umbral_alto, "min_area": args.area_min,
+              "grid": args.grilla, "rows": args.filas, "cols": args.columnas, "roi_margin": args.roi_margen}
+    stream = sys.stdout if args.salida == "-" else open(args.salida, "w", newline="", encoding="utf-8")
+    try:
+        writer = ResultWriter(stream, args.formato, bool(args.grilla))
+        with Pool(processes=args.procesos, initializer=_init_worker, initargs=(params,)) as pool:
+            # imap_unordered permite escribir cada resultado apenas está listo.
+            for resultado in pool.imap_unordered(count_image, rutas, chunksize=args.chunksize):
+                writer.write(resultado)
+    finally:
+        if stream is not sys.stdout: stream.close()
+    return 0
+
+if __name__ == "__main__":
+    sys.exit(main())
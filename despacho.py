@@ -0,0 +1,224 @@
+# =================================================================================
+# === DESPACHADOR DE RELLENADO PARA EL ROBOT ===
+# =================================================================================
+#
+# Envía los comandos "run cobNN" al controlador por el puerto serie desde un hilo
+# propio, con una cola de trabajos. En lugar de esperar un tiempo fijo después de
+# cada comando, lee la respuesta del controlador hasta encontrar el texto que
+# indica que terminó (ready_token), con un tiempo máximo por trabajo. La GUI
+# consulta el estado de los trabajos con after() y puede cancelarlos.
+#
+# ready_token (y error_token, si el programa del controlador informa fallas) los
+# fija quien crea el despachador: deben coincidir con lo que escribe el programa
+# del robot. Un trabajo termina en ERROR sólo si la falla es segura (el puerto no
+# se pudo abrir antes de enviar, o el controlador respondió error_token): ése se
+# puede reintentar. Si el controlador no responde a tiempo queda SIN_RESPUESTA:
+# el robot pudo haberse movido igual, así que nunca se reintenta solo.
+#
+# Se puede probar sin robot con el puerto virtual de pyserial:
+#   python despacho.py --demo
+#   python -m pytest tests/test_despacho.py
+#
+# =================================================================================
+
+import itertools
+import queue
+import threading
+import time
+
+# --- Estados de un trabajo ---
+PENDIENTE = "pendiente"
+EJECUTANDO = "ejecutando"
+COMPLETADO = "completado"
+CANCELADO = "cancelado"
+ERROR = "error"                  # Falla confirmada: el relleno no se hizo.
+SIN_RESPUESTA = "sin respuesta"  # Sin acuse a tiempo (o puerto caído tras enviar): resultado desconocido.
+ACTIVOS = (PENDIENTE, EJECUTANDO)
+# Trabajos terminados que se conservan en el historial.
+HISTORIAL = 50
+
+# Programa del controlador que rellena cada celda de la webera (fila, columna).
+POSICIONES_COB = [[5, 6],
+                  [3, 4],
+                  [1, 2]]
+
+def fill_command(r, c):
+    """Comando serie que rellena la celda (r, c)."""
+    return b"run cob%02d\r" % POSICIONES_COB[r][c]
+
+
+class FillJob:
+    """Un comando enviado (o por enviar) al controlador."""
+    def __init__(self, job_id, cell, command):
+        self.id = job_id
+        self.cell = cell
+        self.command = command
+        self.state = PENDIENTE
+        self.error = None
+        self.created = time.time()
+        self.started = None
+        self.finished = None
+
+    def __repr__(self):
+        return f"FillJob({self.id}, {self.cell}, {self.command!r}, {self.state})"
+
+
+class FillDispatcher:
+    """Cola de trabajos de rellenado atendida por un hilo que espera el acuse del controlador."""
+
+    def __init__(self, port=None, *, ready_token, error_token=None, timeout=60.0, abort_command=None, open_port=None):
+        # port: cualquier objeto tipo serial.Serial (write/read/in_waiting) con timeout de
+        # lectura corto, para que el hilo pueda revisar cancelaciones mientras espera.
+        # En vez del puerto se puede pasar open_port(), que lo abre desde el hilo con el primer
+        # trabajo: así un puerto ausente no frena el arranque (el trabajo termina con el error
+        # y el siguiente vuelve a intentar abrirlo).
+        self.port = port
+        self.open_port = open_port
+        self.ready_token = ready_token
+        self.error_token = error_token
+        self.timeout = timeout
+        self.abort_command = abort_command
+        self.current = None
+        self._jobs = []
+        self._ids = itertools.count(1)
+        self._queue = queue.Queue()
+        self._lock = threading.Lock()
+        self._cancel_current = threading.Event()
+        self._running = False
+        self._thread = None
+
+    def start(self):
+        if self._running: return
+        self._running = True
+        self._thread = threading.Thread(target=self._loop, name="despacho-robot", daemon=True)
+        self._thread.start()
+
+    def stop(self):
+        self.cancel_all()
+        self._running = False
+        if self._thread is not None:
+            self._thread.join(timeout=2.0)
+            self._thread = None
+
+    # --- API para la GUI ---
+    def submit(self, cell, command=None):
+        """Encola el rellenado de una celda. Si la celda ya tiene un trabajo activo, lo retorna."""
+        with self._lock:
+            for job in self._jobs:
+                if job.cell == cell and job.state in ACTIVOS: return job
+            job = FillJob(next(self._ids), cell, command or fill_command(*cell))
+            self._jobs.append(job)
+            # Se conservan los activos y sólo un historial corto de terminados (cada trabajo una vez).
+            if len(self._jobs) > 2 * HISTORIAL:
+                finished = [j for j in self._jobs if j.state not in ACTIVOS][-HISTORIAL:]
+                self._jobs = sorted([j for j in self._jobs if j.state in ACTIVOS] + finished, key=lambda j: j.id)
+        self._queue.put(job)
+        return job
+
+    def cancel(self, job_id):
+        """Cancela un trabajo pendiente, o aborta el que se está ejecutando.
+
+        El que se está ejecutando sólo se puede cancelar con abort_command: sin él el robot
+        seguiría moviéndose y el siguiente comando le llegaría a mitad de camino, así que
+        se espera su acuse. Retorna False si no se canceló.
+        """
+        with self._lock:
+            for job in self._jobs:
+                if job.id != job_id: continue
+                if job.state == PENDIENTE: job.state, job.finished = CANCELADO, time.time(); return True
+                if job.state == EJECUTANDO and self.abort_command: self._cancel_current.set(); return True
+                return False
+        return False
+
+    def cancel_all(self):
+        """Cancela los pendientes y, si hay abort_command, también el que se está ejecutando."""
+        with self._lock:
+            for job in self._jobs:
+                if job.state == PENDIENTE: job.state, job.finished = CANCELADO, time.time()
+            if self.current is not None and self.abort_command: self._cancel_current.set()
+
+    def jobs(self):
+        """Copia de la lista de trabajos, para mostrar en la GUI."""
+        with self._lock: return list(self._jobs)
+
+    def pending_count(self):
+        with self._lock: return sum(1 for j in self._jobs if j.state == PENDIENTE)
+
+    def is_busy(self):
+        with self._lock: return any(j.state in ACTIVOS for j in self._jobs)
+
+    # --- Hilo de despacho ---
+    def _loop(self):
+        while self._running:
+            try: job = self._queue.get(timeout=0.2)
+            except queue.Empty: continue
+            self._run(job)
+
+    def _run(self, job):
+        with self._lock:
+            # Se revisa y se marca en el mismo bloque: un cancel() no puede quedar entre medio.
+            if job.state != PENDIENTE: return # Cancelado mientras estaba en cola.
+            job.state, job.started = EJECUTANDO, time.time()
+            self.current = job
+            self._cancel_current.clear()
+        state, error, sent = ERROR, None, False
+        try:
+            if self.port is None: self.port = self.open_port()
+            self.port.reset_input_buffer() # Descarta respuestas viejas antes del nuevo comando.
+            sent = True # Desde aquí el comando pudo llegar al robot, aunque write falle a medias.
+            self.port.write(job.command)
+            state, error = self._wait_ready()
+        except Exception as e: # El puerto puede desconectarse en cualquier momento.
+            state, error = (SIN_RESPUESTA if sent else ERROR), str(e)
+            if self.open_port is not None and self.port is not None:
+                # Se descarta el puerto fallido: el próximo trabajo lo vuelve a abrir.
+                try: self.port.close()
+                except Exception: pass
+                self.port = None
+        with self._lock:
+            job.state, job.error, job.finished = state, error, time.time()
+            self.current = None
+
+    def _wait_ready(self):
+        deadline = time.monotonic() + self.timeout
+        received = b""
+        while time.monotonic() < deadline:
+            if self._cancel_current.is_set():
+                if self.abort_command: self.port.write(self.abort_command)
+                return CANCELADO, None
+            chunk = self.port.read(self.port.in_waiting or 1) # Bloquea a lo más el timeout del puerto.
+            if not chunk: continue
+            received = (received + chunk)[-(len(self.ready_token) + len(self.error_token or b"") + 256):]
+            if self.ready_token in received: return COMPLETADO, None
+            if self.error_token and self.error_token in received: return ERROR, "el controlador informó un error"
+        return SIN_RESPUESTA, "sin respuesta del controlador"
+
+
+# --- Demostración con el puerto virtual loop:// de pyserial ---
+# Un hilo hace de controlador: escribe el acuse en el mismo puerto (el eco de loop://
+# hace que el despachador lo lea) un momento después de cada comando.
+if __name__ == "__main__":
+    import sys
+    import serial
+
+    if "--demo" not in sys.argv:
+        print("Uso: python despacho.py --demo")
+        sys.exit(1)
+
+    port = serial.serial_for_url("loop://", timeout=0.1)
+    write_lock = threading.Lock()
+    original_write = port.write
+
+    def controller_write(data):
+        with write_lock: original_write(data)
+        if data.startswith(b"run"):
+            threading.Timer(0.5, lambda: controller_write(b"Done.\r\n")).start()
+
+    port.write = controller_write
+    dispatcher = FillDispatcher(port, ready_token=b"Done", timeout=5)
+    dispatcher.start()
+    for cell in [(0, 0), (1, 1), (2, 0)]: dispatcher.submit(cell)
+    while dispatcher.is_busy():
+        time.sleep(0.1)
+    for job in dispatcher.jobs(): print(job)
+    dispatcher.stop()
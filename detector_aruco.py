@@ -0,0 +1,249 @@
+# =================================================================================
+# === DETECCIÓN DE MARCADORES ARUCO ===
+# =================================================================================
+#
+# Funciones de detección compartidas por las pantallas de Tarea5_Parra.py.
+#
+# =================================================================================
+
+import os
+import threading
+from collections import deque
+from concurrent.futures import ThreadPoolExecutor
+
+import cv2
+import cv2.aruco as aruco
+import numpy as np
+
+from grilla import crop, grid_geometry
+
+def detect_markers(frame, aruco_dict, aruco_params, roi=None, scale=1.0):
+    """detectMarkers sobre el frame (BGR o gris), opcionalmente restringido a roi=(x1, y1, x2, y2).
+
+    Sólo se convierte a gris y se analiza la región recortada (una vista del
+    frame, sin copia); las esquinas se devuelven en coordenadas del frame completo.
+    Con scale < 1 los candidatos se buscan en la imagen reducida y sólo las esquinas
+    de los marcadores encontrados se refinan a resolución completa (modo pirámide).
+    """
+    region = crop(frame, roi)
+    gray = cv2.cvtColor(region, cv2.COLOR_BGR2GRAY) if region.ndim == 3 else region
+    if scale < 1.0: corners, ids = _detect_pyramid(gray, aruco_dict, aruco_params, scale)
+    else: corners, ids, _ = aruco.detectMarkers(gray, aruco_dict, parameters=aruco_params)
+    if roi is not None and ids is not None:
+        offset = np.array([roi[0], roi[1]], dtype=np.float32)
+        corners = tuple(c + offset for c in corners)
+    return corners, ids
+
+def _detect_pyramid(gray, aruco_dict, aruco_params, scale):
+    small = cv2.resize(gray, None, fx=scale, fy=scale, interpolation=cv2.INTER_AREA)
+    # El refinamiento configurado se reemplaza por cornerSubPix a resolución completa. La pasada
+    # gruesa usa una copia: los parámetros recibidos pueden estar compartidos con otros hilos.
+    refinement = aruco_params.cornerRefinementMethod
+    coarse = copy_params(aruco_params)
+    coarse.cornerRefinementMethod = aruco.CORNER_REFINE_NONE
+    corners, ids, _ = aruco.detectMarkers(small, aruco_dict, parameters=coarse)
+    if ids is None: return corners, ids
+
+    # Las esquinas de la imagen reducida (llevadas a resolución completa respetando el centro de
+    # los píxeles) tienen un error de hasta ~1.5 píxeles reducidos: la ventana de búsqueda de
+    # cornerSubPix se agranda en proporción.
+    points = (np.concatenate(corners).reshape(-1, 1, 2) + 0.5) / scale - 0.5
+    win = max(aruco_params.cornerRefinementWinSize, int(np.ceil(1.5 / scale)) + 1)
+    criteria = (cv2.TERM_CRITERIA_EPS + cv2.TERM_CRITERIA_MAX_ITER, aruco_params.cornerRefinementMaxIterations, aruco_params.cornerRefinementMinAccuracy)
+    if refinement != aruco.CORNER_REFINE_NONE:
+        points = cv2.cornerSubPix(gray, points.astype(np.float32), (win, win), (-1, -1), criteria)
+    points = points.astype(np.float32).reshape(-1, 1, 4, 2)
+    return tuple(points), ids
+
+def marker_cells(corners, ids, rows, cols, x0, y0, grid_w, grid_h, row_sizes=None, col_sizes=None):
+    """Asigna cada marcador a la celda que contiene su centro: {(fila, col): ID como texto}."""
+    id_locations = {}
+    if ids is None or len(corners) == 0: return id_locations
+    centers = np.concatenate(corners).reshape(-1, 4, 2).mean(axis=1).astype(int)
+    geometry = grid_geometry(rows, cols, x0, y0, grid_w, grid_h, row_sizes, col_sizes)
+    r_idx, c_idx, inside = geometry.locate(centers[:, 0], centers[:, 1])
+    ids_flat = ids.flatten()
+    for i in np.flatnonzero(inside).tolist(): id_locations[(int(r_idx[i]), int(c_idx[i]))] = str(ids_flat[i])
+    return id_locations
+
+def copy_params(aruco_params):
+    """Copia de DetectorParameters, para cambiar alguno sin afectar a otros hilos que usan el original."""
+    copy = aruco.DetectorParameters()
+    for name in dir(aruco_params):
+        value = getattr(aruco_params, name)
+        if not name.startswith("_") and not callable(value): setattr(copy, name, value)
+    return copy
+
+# =================================================================================
+# === DETECCIÓN POR LOTES (MODO RENDIMIENTO) ===
+# =================================================================================
+#
+# detectMarkers libera el GIL, así que varios hilos detectan en paralelo dentro
+# de un mismo proceso. BatchDetector reparte los frames en un pool de hilos y
+# entrega los resultados en el orden de entrada. Como mucho max_pending frames
+# esperan en la cola de trabajo: la lectura del video no se adelanta y la memoria
+# queda acotada. Cada hilo usa su propia copia de los parámetros.
+#
+# Sin seguimiento: cada frame se analiza completo (el seguimiento depende del
+# frame anterior y no se puede repartir).
+#
+# =================================================================================
+
+class BatchDetector:
+    """Detección ArUco sobre una secuencia de frames en un pool de hilos, con resultados en orden."""
+
+    def __init__(self, aruco_dict, aruco_params, workers=None, max_pending=None, scale=1.0):
+        self.aruco_dict = aruco_dict
+        self.aruco_params = aruco_params
+        self.scale = scale
+        self.workers = max(1, workers or os.cpu_count() or 1)
+        self.max_pending = max(1, max_pending or 2 * self.workers) # Frames en la cola de trabajo.
+        self._local = threading.local()
+        self._pool = None
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
+
+    def close(self):
+        if self._pool is not None: self._pool.shutdown(wait=True, cancel_futures=True); self._pool = None
+
+    def _detect(self, frame, roi):
+        params = getattr(self._local, "params", None)
+        if params is None: params = self._local.params = copy_params(self.aruco_params)
+        return detect_markers(frame, self.aruco_dict, params, roi, self.scale)
+
+    def map(self, frames, roi=None):
+        """Genera (corners, ids) por cada frame de frames (lista o iterador), en el mismo orden.
+
+        roi: (x1, y1, x2, y2) común a todos los frames, una función frame -> roi, o None.
+        """
+        if self._pool is None: self._pool = ThreadPoolExecutor(self.workers, thread_name_prefix="aruco")
+        pending = deque()
+        try:
+            for frame in frames:
+                if len(pending) >= self.max_pending: yield pending.popleft().result()
+                region = roi(frame) if callable(roi) else roi
+                pending.append(self._pool.submit(self._detect, frame, region))
+            while pending: yield pending.popleft().result()
+        finally:
+            for future in pending: future.cancel() # El consumidor dejó de iterar.
+
+def detect_batch(frames, aruco_dict, aruco_params, roi=None, scale=1.0, workers=None, max_pending=None):
+    """Lista de (corners, ids) de cada frame, detectados en un pool de hilos."""
+    with BatchDetector(aruco_dict, aruco_params, workers, max_pending, scale) as detector:
+        return list(detector.map(frames, roi))
+
+# =================================================================================
+# === MODO SEGUIMIENTO ===
+# =================================================================================
+#
+# Los marcadores del almacén casi nunca se mueven, así que entre escaneos completos
+# basta con buscarlos en ventanas pequeñas alrededor de sus últimas esquinas. El
+# frame completo (o la ROI) se vuelve a analizar cada ESCANEO_COMPLETO_CADA frames,
+# cuando se pierde algún marcador, o cuando cambia la forma del frame o la ROI.
+#
+# =================================================================================
+
+# Escalas ofrecidas para el modo pirámide (1.0 = detección a resolución completa).
+ESCALAS_DETECCION = (1.0, 0.5, 0.25)
+
+# Cada cuántos frames se analiza de nuevo el frame completo (detecta marcadores nuevos).
+ESCANEO_COMPLETO_CADA = 15
+# Si las ventanas cubren más que esta fracción del área de búsqueda, conviene el escaneo completo.
+MAX_FRACCION_VENTANAS = 0.5
+
+class MarkerTracker:
+    """Detección de marcadores que, entre escaneos completos, sólo busca alrededor de los ya conocidos.
+
+    detect() retorna (corners, ids) con el mismo formato que detect_markers, así que
+    marker_cells produce la misma asignación de IDs a celdas.
+    """
+
+    def __init__(self, aruco_dict, aruco_params, full_scan_every=ESCANEO_COMPLETO_CADA, margin=0.5, min_margin=12, enabled=True, scale=1.0):
+        self.aruco_dict = aruco_dict
+        self.aruco_params = aruco_params
+        self.scale = scale # Escala de la pirámide en los escaneos completos (las ventanas van a resolución completa).
+        self.full_scan_every = full_scan_every
+        self.margin = margin          # Margen de la ventana como fracción del lado del marcador.
+        self.min_margin = min_margin  # Margen mínimo en píxeles (zona blanca y refinamiento subpíxel).
+        self.enabled = enabled
+        self.full_scans = 0
+        self.tracked_frames = 0
+        self.reset()
+
+    def reset(self):
+        """Olvida los marcadores conocidos; el próximo detect() hace un escaneo completo."""
+        self._tracks = [] # [(id, esquinas (1, 4, 2))] en coordenadas del frame completo.
+        self._context = None # (forma del frame, roi) del último escaneo completo.
+        self._frames_since_scan = 0
+
+    def detect(self, frame, roi=None):
+        context = (frame.shape, roi)
+        if not self.enabled or context != self._context or self._frames_since_scan >= self.full_scan_every:
+            return self._full_scan(frame, roi, context)
+        result = self._track(frame, roi)
+        if result is None: return self._full_scan(frame, roi, context) # Se perdió un marcador.
+        self._frames_since_scan += 1; self.tracked_frames += 1
+        return result
+
+    def _full_scan(self, frame, roi, context):
+        corners, ids = detect_markers(frame, self.aruco_dict, self.aruco_params, roi, self.scale)
+        self._tracks = [] if ids is None else list(zip(ids.flatten().tolist(), corners))
+        self._context = context if self.enabled else None
+        self._frames_since_scan = 0; self.full_scans += 1
+        return corners, ids
+
+    def _window(self, corners, bounds):
+        """Rectángulo alrededor de las esquinas, ampliado por el margen y recortado a bounds."""
+        pts = corners[0]
+        (x_min, y_min), (x_max, y_max) = pts.min(axis=0), pts.max(axis=0)
+        m = max(self.min_margin, self.margin * max(x_max - x_min, y_max - y_min))
+        x1, y1 = max(bounds[0], int(x_min - m)), max(bounds[1], int(y_min - m))
+        x2, y2 = min(bounds[2], int(np.ceil(x_max + m)) + 1), min(bounds[3], int(np.ceil(y_max + m)) + 1)
+        return (x1, y1, x2, y2) if x2 > x1 and y2 > y1 else None
+
+    @staticmethod
+    def _merge(windows):
+        """Une las ventanas que se superponen, para no detectar dos veces el mismo marcador."""
+        merged = list(windows)
+        i = 0
+        while i < len(merged):
+            a = merged[i]
+            for j in range(i + 1, len(merged)):
+                b = merged[j]
+                if a[0] < b[2] and b[0] < a[2] and a[1] < b[3] and b[1] < a[3]:
+                    merged[i] = (min(a[0], b[0]), min(a[1], b[1]), max(a[2], b[2]), max(a[3], b[3]))
+                    del merged[j]
+                    break
+            else: i += 1 # Sin superposición: la ventana i queda fija. Si se unió, se revisa de nuevo.
+        return merged
+
+    def _track(self, frame, roi):
+        """Busca cada marcador conocido en su ventana. None si hay que hacer un escaneo completo."""
+        h, w = frame.shape[:2]
+        bounds = roi if roi is not None else (0, 0, w, h)
+        windows = [self._window(c, bounds) for _, c in self._tracks]
+        if None in windows: return None
+        windows = self._merge(windows)
+        area = sum((x2 - x1) * (y2 - y1) for x1, y1, x2, y2 in windows)
+        if area > MAX_FRACCION_VENTANAS * (bounds[2] - bounds[0]) * (bounds[3] - bounds[1]): return None
+
+        found = []
+        for win in windows:
+            corners, ids = detect_markers(frame, self.aruco_dict, self.aruco_params, win)
+            if ids is not None: found += zip(ids.flatten().tolist(), corners)
+
+        # Cada marcador conocido debe reaparecer; se empareja con el más cercano del mismo ID.
+        unmatched = list(range(len(found)))
+        for marker_id, prev in self._tracks:
+            center = prev[0].mean(axis=0)
+            candidates = [i for i in unmatched if found[i][0] == marker_id]
+            if not candidates: return None
+            unmatched.remove(min(candidates, key=lambda i: np.linalg.norm(found[i][1][0].mean(axis=0) - center)))
+        # Los marcadores nuevos que aparecen dentro de una ventana también se reportan.
+        self._tracks = found
+        if not found: return (), None
+        return tuple(c for _, c in found), np.array([[marker_id] for marker_id, _ in found], dtype=np.int32)
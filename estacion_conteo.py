@@ -0,0 +1,112 @@
+# =================================================================================
+# === PIEZAS COMPARTIDAS DE LAS INTERFACES DE CONTEO ===
+# =================================================================================
+#
+# TEST.py y TEST_modificado.py son la misma estación de conteo de manchas; sólo
+# cambia cómo se piden los rellenos al robot. Lo que ambas arman igual vive aquí:
+#   CountingStation: tiempos por etapa, métricas, caché del conteo, seguimiento de
+#                    ocupación, rectificación y registro, más el endpoint /metrics
+#                    y el cierre ordenado de todo eso.
+#   build_viewers:   imagen real y umbralizada en un único FrameViewer.
+#   build_processing_options: casillas de tiempos, registro, ROI y rectificación.
+#   connect_status_matrix: la StatusMatrix sigue al OccupancyTracker por eventos.
+# Los scripts siguen creando sus widgets y variables globales; sólo los piden aquí.
+#
+# =================================================================================
+
+import tkinter as tk
+from types import SimpleNamespace
+
+from conteo import CountingPipeline
+from exportador_metricas import MetricsServer, StationMetrics, capture_collector, dispatch_collector, timing_collector
+from metricas import StageTimer
+from ocupacion import OccupancyTracker
+from planificador import HZ_DETECCION, RateGate
+from rectificacion import CALIBRACION_FILE, Rectifier
+from registro_ocupacion import REGISTRO_DIR, OccupancyRecorder
+from visor import FrameViewer
+
+# Colores de la interfaz.
+BG_COLOR = "#2E2E2E"
+TEXT_COLOR = "#FFFFFF"
+BUTTON_COLOR = "#424242"
+FRAME_COLOR = "#212121"
+
+TIEMPOS_CSV = "tiempos_etapas.csv"
+# Estilo de cada estado de la matriz: (texto, color de fondo). Verde para ocupado, gris oscuro para vacío.
+ESTILOS_ESTADO = {0: ("Vacío", FRAME_COLOR), 1: ("Ocupado", "#4CAF50")}
+
+
+class CountingStation:
+    """Objetos de la estación que no son widgets, creados y cerrados igual en ambas interfaces."""
+
+    def __init__(self):
+        self.metrics = StationMetrics()  # Lo que publica el endpoint /metrics (ver exportador_metricas.py)
+        self.timer = StageTimer(csv_path=TIEMPOS_CSV, metrics=self.metrics)  # Tiempos por etapa (pantalla y /metrics)
+        self.pipeline = CountingPipeline(self.timer)  # Caché por etapas: los sliders sólo recalculan lo que cambió
+        self.occupancy = OccupancyTracker(empty=0)  # Estado estable de la grilla; avisa sólo los cambios confirmados
+        self.detection = RateGate(HZ_DETECCION)  # La detección corre a menor tasa que la visualización
+        self.rectifier = Rectifier()  # Estantería vista de frente; la grilla se ubica sobre la imagen rectificada
+        self.rectifier.load_calibration(CALIBRACION_FILE)  # Corrección del lente, si la cámara está calibrada
+        self.recorder = OccupancyRecorder(REGISTRO_DIR, prefix="conteo", empty=0)  # Matriz de cada detección en disco
+        self.metrics_server = None
+
+    def start_metrics(self, root, get_capture, scheduler, dispatcher):
+        """Registra los colectores y abre /metrics cuando la ventana ya está visible (no retrasa el arranque)."""
+        # Los colectores sólo leen contadores de la captura, el planificador y el despacho: nunca widgets.
+        self.metrics.add_collector(capture_collector(get_capture, scheduler))
+        self.metrics.add_collector(dispatch_collector(dispatcher))
+        self.metrics.add_collector(timing_collector(self.timer))
+        self.metrics_server = MetricsServer(self.metrics)
+        root.after_idle(self.metrics_server.start)
+
+    def close(self):
+        """Vuelca los tiempos, cierra el registro (esperando el archivo) y el endpoint de métricas."""
+        if self.timer.enabled: self.timer.dump_csv()
+        self.recorder.stop(wait=True) # Al salir sí se espera el cierre del archivo.
+        if self.metrics_server is not None: self.metrics_server.stop()
+
+
+def build_viewers(parent, titles, panel_width=500):
+    """Marco con un título por panel y un FrameViewer que los compone lado a lado en un único PhotoImage."""
+    frame = tk.Frame(parent, bg=FRAME_COLOR, bd=1, relief='sunken')
+    frame.pack(padx=10)
+    for i, title in enumerate(titles):
+        frame.columnconfigure(i, weight=1, uniform="visores")
+        tk.Label(frame, text=title, font=("Times New Roman", 12, "bold"), bg=FRAME_COLOR, fg=TEXT_COLOR).grid(row=0, column=i, pady=(5,0))
+    label = tk.Label(frame, bg=FRAME_COLOR)
+    label.grid(row=1, column=0, columnspan=len(titles), padx=5, pady=5)
+    return FrameViewer(label, panel_width=panel_width, panels=len(titles), gap=10, bg=(33, 33, 33))
+
+def _checkbutton(parent, text, variable, command):
+    tk.Checkbutton(parent, text=text, variable=variable, bg=BG_COLOR, fg=TEXT_COLOR, selectcolor=FRAME_COLOR, activebackground=BG_COLOR, activeforeground=TEXT_COLOR,
+                   command=command).pack(pady=(10, 0))
+
+def build_processing_options(parent, station, refresh, set_corners):
+    """Casillas de tiempos por etapa, registro, ROI y rectificación. Retorna sus variables (medir, registrar, roi, rectificar).
+
+    refresh() vuelve a procesar la imagen actual; set_corners() fija las esquinas de la rectificación.
+    """
+    options = SimpleNamespace(medir=tk.BooleanVar(value=False), registrar=tk.BooleanVar(value=False),
+                              roi=tk.BooleanVar(value=False), rectificar=tk.BooleanVar(value=False))
+    _checkbutton(parent, "Medir tiempos por etapa", options.medir, lambda: station.timer.set_enabled(options.medir.get()))
+    _checkbutton(parent, "Registrar ocupación", options.registrar,
+                 lambda: station.recorder.start() if options.registrar.get() else station.recorder.stop())
+    _checkbutton(parent, "Procesar sólo la rejilla (ROI)", options.roi, refresh)
+    _checkbutton(parent, "Rectificar estantería", options.rectificar, refresh)
+    tk.Button(parent, text="Fijar esquinas (marcadores)", command=set_corners, font=("Times New Roman", 10), bg=BUTTON_COLOR, fg=TEXT_COLOR, relief='flat', activebackground='#555555', activeforeground=TEXT_COLOR).pack(pady=(5, 0))
+    return options
+
+def connect_status_matrix(status_matrix, occupancy, styles=ESTILOS_ESTADO):
+    """La matriz se dibuja completa cuando el estado se fija y después sólo cambia con los eventos."""
+    def on_events(events):
+        # Sólo llegan las celdas cuyo estado se confirmó durante varios frames (ver ocupacion.py),
+        # así un parpadeo de un frame no toca la interfaz.
+        for event in events: status_matrix.set_cell(*event.cell, styles.get(event.new))
+
+    def on_reset(state):
+        # Primer frame o nueva geometría: el estado se fija sin eventos.
+        if state.ndim == 2: status_matrix.update_matrix(state, styles)
+
+    occupancy.subscribe(on_events)
+    occupancy.subscribe_reset(on_reset)
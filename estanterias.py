@@ -0,0 +1,143 @@
+# =================================================================================
+# === MONITOREO DE VARIAS ESTANTERÍAS EN PROCESOS SEPARADOS ===
+# =================================================================================
+#
+# Cada estantería tiene su propia cámara y su propia rejilla. Por cada una se
+# lanza un proceso que hace la captura, la detección ArUco (con seguimiento) y la
+# asignación de marcadores a celdas, y que sólo envía a la GUI el mapa
+# {(fila, col): ID} cuando cambia de verdad (con el antirrebote de ocupacion.py),
+# más un estado periódico con los FPS. Así la
+# detección no compite por el GIL ni por el bucle de Tkinter.
+#
+# Las estanterías se leen de estanterias.json, una lista como:
+#   [{"nombre": "E1", "camara": 0, "filas": 3, "columnas": 4,
+#     "x0": 40, "y0": 10, "ancho": 1200, "alto": 700, "margen_roi": 20, "hz_deteccion": 10, "escala": 0.5}]
+# ("margen_roi": null analiza el frame completo; "camara" puede ser una ruta de video;
+# "hz_deteccion" limita las detecciones por segundo, null para no limitarlas;
+# "escala" < 1 detecta en la imagen reducida y refina las esquinas a resolución completa;
+# "altos_filas"/"anchos_columnas", p. ej. [1, 2, 1], dan tamaños proporcionales distintos por fila o columna;
+# "esquinas": [[x, y] x 4] rectifica ese cuadrilátero y la rejilla se ubica sobre la imagen rectificada,
+# con la corrección del lente de "calibracion", un .npz de rectificacion.py, si se indica;
+# "registro": carpeta donde guardar la matriz de IDs de cada detección, ver registro_ocupacion.py).
+#
+# =================================================================================
+
+import json
+import os
+import queue
+import time
+from multiprocessing import Event, Process, Queue
+
+import cv2
+import cv2.aruco as aruco
+import numpy as np
+
+from captura import CameraCapture
+from detector_aruco import MarkerTracker, marker_cells
+from grilla import ROI_MARGEN, roi_bounds
+from ocupacion import OccupancyTracker
+from planificador import HZ_DETECCION
+from rectificacion import Rectifier
+from registro_ocupacion import OccupancyRecorder
+
+SHELVES_FILE = "estanterias.json"
+DEFAULT_SHELF = {"nombre": "E1", "camara": 0, "filas": 3, "columnas": 4, "x0": 40, "y0": 10, "ancho": 1200, "alto": 700, "margen_roi": ROI_MARGEN, "hz_deteccion": HZ_DETECCION, "escala": 1.0, "altos_filas": None, "anchos_columnas": None, "esquinas": None, "calibracion": None, "registro": None}
+# Cada cuántos segundos un proceso informa sus FPS aunque las celdas no cambien.
+INTERVALO_ESTADO = 1.0
+
+def load_shelves(path=SHELVES_FILE):
+    """Lista de estanterías del archivo, completando las claves que falten. Una por defecto si no existe."""
+    if not os.path.exists(path): return [dict(DEFAULT_SHELF)]
+    with open(path, 'r', encoding="utf-8") as f: shelves = json.load(f)
+    return [{**DEFAULT_SHELF, "nombre": f"E{i + 1}", **shelf} for i, shelf in enumerate(shelves)]
+
+# =================================================================================
+# === PROCESO DE CADA ESTANTERÍA ===
+# =================================================================================
+
+def shelf_worker(shelf, results, stop_event):
+    """Captura, detecta y asigna celdas para una estantería hasta que se active stop_event."""
+    cv2.setNumThreads(1) # El paralelismo lo dan los procesos; evita sobre-suscribir los núcleos.
+    name = shelf["nombre"]
+    cap = CameraCapture(shelf["camara"])
+    if not cap.start():
+        results.put(("error", name, f"No se pudo abrir la cámara {shelf['camara']}.")); return
+
+    aruco_dict = aruco.getPredefinedDictionary(aruco.DICT_5X5_100)
+    aruco_params = aruco.DetectorParameters()
+    aruco_params.cornerRefinementMethod = aruco.CORNER_REFINE_SUBPIX
+    tracker = MarkerTracker(aruco_dict, aruco_params, scale=shelf["escala"])
+    grid = (shelf["filas"], shelf["columnas"], shelf["x0"], shelf["y0"], shelf["ancho"], shelf["alto"])
+    occupancy = OccupancyTracker(empty=-1, piece_ids=True)
+    observed = np.empty(grid[:2], dtype=np.int32)
+    rectifier = Rectifier()
+    if shelf["calibracion"]: rectifier.load_calibration(shelf["calibracion"])
+    if shelf["esquinas"]: rectifier.set_quad(shelf["esquinas"])
+    recorder = OccupancyRecorder(shelf["registro"], prefix=name, empty=-1)
+    if shelf["registro"]: recorder.start()
+
+    # Tasa fija de detección, para que varias estanterías en el mismo equipo tengan un uso de CPU predecible.
+    period = 1.0 / shelf["hz_deteccion"] if shelf["hz_deteccion"] else 0.0
+    frames, last_status = 0, time.monotonic()
+    next_due = last_status
+    try:
+        while not stop_event.is_set():
+            wait = next_due - time.monotonic()
+            if wait > 0 and stop_event.wait(wait): break
+            next_due = max(next_due + period, time.monotonic()) # Si se atrasó, no acumula ciclos pendientes.
+            frame, _ = cap.read()
+            if frame is None: time.sleep(0.005); continue
+            if rectifier.ready: frame = rectifier.rectify(frame) # Tablas de remap calculadas una sola vez.
+            roi = None if shelf["margen_roi"] is None else roi_bounds(frame.shape, *grid[2:], shelf["margen_roi"])
+            corners, ids = tracker.detect(frame, roi)
+            observed[:] = -1
+            for (r, c), found_id in marker_cells(corners, ids, *grid, shelf["altos_filas"], shelf["anchos_columnas"]).items(): observed[r, c] = int(found_id)
+            recorder.record(observed)
+            if occupancy.update(observed): # Sólo cuando un cambio se confirmó en varios frames.
+                results.put(("celdas", name, {(r, c): str(occupancy.state[r, c]) for r, c in np.argwhere(occupancy.state != -1).tolist()}))
+            frames += 1
+            now = time.monotonic()
+            if now - last_status >= INTERVALO_ESTADO:
+                results.put(("estado", name, frames / (now - last_status))); frames, last_status = 0, now
+    finally:
+        cap.stop(); recorder.stop()
+
+# =================================================================================
+# === MONITOR (LADO DE LA GUI) ===
+# =================================================================================
+
+class ShelfMonitor:
+    """Lanza un proceso por estantería y recoge sus resultados sin bloquear a quien lo consulta."""
+
+    def __init__(self, shelves):
+        self.shelves = shelves
+        self.results = None
+        self._stop = None
+        self._processes = []
+
+    def start(self):
+        if self._processes: return
+        self.results, self._stop = Queue(), Event()
+        for shelf in self.shelves:
+            p = Process(target=shelf_worker, args=(shelf, self.results, self._stop), name=f"estanteria-{shelf['nombre']}", daemon=True)
+            p.start(); self._processes.append(p)
+
+    def stop(self):
+        if not self._processes: return
+        self._stop.set()
+        for p in self._processes:
+            p.join(timeout=2.0)
+            if p.is_alive(): p.terminate()
+        self._processes = []
+        self.results.close(); self.results = None
+
+    def is_running(self):
+        return bool(self._processes)
+
+    def poll(self, max_messages=100):
+        """Mensajes pendientes: ("celdas", nombre, {(fila, col): ID}), ("estado", nombre, fps) o ("error", nombre, texto)."""
+        messages = []
+        while self.results is not None and len(messages) < max_messages:
+            try: messages.append(self.results.get_nowait())
+            except queue.Empty: break
+        return messages
@@ -0,0 +1,206 @@
+# =================================================================================
+# === MÉTRICAS DE LA ESTACIÓN EN FORMATO PROMETHEUS ===
+# =================================================================================
+#
+# StationMetrics junta lo que hoy sólo se ve en la ventana de Tk: FPS, latencia
+# por etapa (histogramas), frames descartados, marcadores, manchas, celdas
+# ocupadas/vacías y trabajos pendientes del robot. El bucle de procesamiento sólo
+# asigna números (set/observe/tick, con un lock que se toma por microsegundos);
+# los contadores que ya llevan otros objetos (captura, planificador, despacho) se
+# leen al momento del scrape con colectores que no tocan widgets.
+#
+# MetricsServer atiende GET /metrics en localhost desde un hilo propio, así un
+# Prometheus central puede comparar todas las estaciones en un mismo tablero.
+#
+#   curl http://127.0.0.1:9108/metrics
+#
+# El nombre de la estación (etiqueta station) es el del equipo, o ESTACION si está definida.
+# http.server (y lo que arrastra) se importa recién al abrir el endpoint, no al arrancar.
+#
+# =================================================================================
+
+import bisect
+import functools
+import os
+import socket
+import threading
+import time
+from collections import deque
+
+# Puerto del endpoint; con varias estaciones en un mismo equipo se cambia con la variable de entorno.
+PUERTO_METRICAS = int(os.environ.get("PUERTO_METRICAS", 9108))
+# Límites superiores (ms) de los buckets de latencia por etapa.
+BUCKETS_MS = (1, 2, 5, 10, 20, 50, 100, 200, 500, 1000)
+
+# Nombre -> (tipo, ayuda) de las métricas que publica la estación.
+METRICAS = {
+    "vision_fps": ("gauge", "Frames procesados por segundo (ventana móvil)."),
+    "vision_frames_captured_total": ("counter", "Frames leídos de la cámara."),
+    "vision_frames_dropped_total": ("counter", "Frames descartados sin procesar, por origen."),
+    "vision_stage_latency_ms": ("histogram", "Duración de cada etapa del procesamiento en milisegundos."),
+    "vision_stage_timing_enabled": ("gauge", "1 si se están midiendo las etapas (vision_stage_latency_ms se actualiza)."),
+    "vision_markers": ("gauge", "Marcadores ArUco en la última detección."),
+    "vision_blobs": ("gauge", "Manchas en la última detección."),
+    "vision_cells": ("gauge", "Celdas de la grilla por estado estable."),
+    "vision_dispatch_queue_depth": ("gauge", "Trabajos de relleno pendientes en el despacho serie."),
+}
+
+
+class _Histogram:
+    __slots__ = ("counts", "sum", "count")
+
+    def __init__(self):
+        self.counts = [0] * (len(BUCKETS_MS) + 1) # El último es +Inf.
+        self.sum, self.count = 0.0, 0
+
+
+class StationMetrics:
+    """Valores de la estación que se actualizan desde el bucle y se leen desde el servidor HTTP."""
+
+    def __init__(self, station=None, window=120):
+        self.station = station or os.environ.get("ESTACION") or socket.gethostname()
+        self._lock = threading.Lock()
+        self._values = {}     # (nombre, etiquetas) -> valor
+        self._histograms = {} # etapa -> _Histogram
+        self._frames = deque(maxlen=window)
+        self._collectors = []
+
+    # --- Desde el bucle de procesamiento ---
+    def set(self, name, value, **labels):
+        key = (name, tuple(sorted(labels.items())))
+        with self._lock: self._values[key] = value
+
+    def observe(self, stage, ms):
+        """Agrega una duración (ms) al histograma de la etapa."""
+        i = bisect.bisect_left(BUCKETS_MS, ms)
+        with self._lock:
+            histogram = self._histograms.get(stage)
+            if histogram is None: histogram = self._histograms[stage] = _Histogram()
+            histogram.counts[i] += 1; histogram.sum += ms; histogram.count += 1
+
+    def tick(self):
+        """Marca el fin de un frame procesado (para vision_fps)."""
+        self._frames.append(time.monotonic()) # deque.append es atómico: no hace falta el lock.
+
+    def add_collector(self, collector):
+        """collector() -> {(nombre, ((etiqueta, valor), ...)): valor}, evaluado en cada scrape.
+
+        Corre en el hilo del servidor: sólo debe leer atributos, nunca widgets de Tk.
+        """
+        self._collectors.append(collector)
+
+    # --- Desde el servidor ---
+    def _fps(self):
+        frames = list(self._frames)
+        if len(frames) < 2 or time.monotonic() - frames[-1] > 2.0: return 0.0 # Detenido.
+        return (len(frames) - 1) / (frames[-1] - frames[0]) if frames[-1] > frames[0] else 0.0
+
+    def render(self):
+        """Texto en formato de exposición de Prometheus (versión 0.0.4)."""
+        with self._lock: # Sólo se copia bajo el lock; el formateo se hace afuera.
+            values = dict(self._values)
+            histograms = {stage: (list(h.counts), h.sum, h.count) for stage, h in self._histograms.items()}
+        values[("vision_fps", ())] = self._fps()
+        for collector in self._collectors:
+            try: values.update(collector())
+            except Exception: pass # Un colector roto no debe tumbar el scrape.
+
+        station = ("station", self.station)
+        lines = []
+        for name, (kind, help_text) in METRICAS.items():
+            samples = [(labels, value) for (metric, labels), value in values.items() if metric == name]
+            if kind == "histogram" and not histograms: continue
+            if kind != "histogram" and not samples: continue
+            lines += [f"# HELP {name} {help_text}", f"# TYPE {name} {kind}"]
+            if kind == "histogram":
+                for stage, (counts, total, count) in sorted(histograms.items()):
+                    cumulative = 0
+                    for bound, n in zip(BUCKETS_MS + ("+Inf",), counts):
+                        cumulative += n
+                        lines.append(f"{name}_bucket{_labels((station, ('stage', stage), ('le', str(bound))))} {cumulative}")
+                    lines.append(f"{name}_sum{_labels((station, ('stage', stage)))} {total:.3f}")
+                    lines.append(f"{name}_count{_labels((station, ('stage', stage)))} {count}")
+            else:
+                for labels, value in sorted(samples):
+                    lines.append(f"{name}{_labels((station,) + labels)} {float(value):g}")
+        return "\n".join(lines) + "\n"
+
+def _labels(pairs):
+    escape = lambda value: str(value).replace("\\", "\\\\").replace('"', '\\"').replace("\n", "\\n")
+    return "{" + ",".join(f'{key}="{escape(value)}"' for key, value in pairs) + "}"
+
+# =================================================================================
+# === COLECTORES DE OBJETOS EXISTENTES ===
+# =================================================================================
+
+def capture_collector(get_capture, scheduler=None):
+    """Frames leídos y descartados por la captura (get_capture() puede retornar None) y ciclos saltados."""
+    def collect():
+        capture = get_capture()
+        values = {}
+        if capture is not None:
+            values[("vision_frames_captured_total", ())] = getattr(capture, "frames_read", 0)
+            values[("vision_frames_dropped_total", (("origin", "capture"),))] = getattr(capture, "frames_dropped", 0)
+        if scheduler is not None: values[("vision_frames_dropped_total", (("origin", "scheduler"),))] = scheduler.skipped
+        return values
+    return collect
+
+def dispatch_collector(dispatcher):
+    return lambda: {("vision_dispatch_queue_depth", ()): dispatcher.pending_count()}
+
+def timing_collector(timer):
+    """Si el StageTimer está midiendo: los histogramas de latencia sólo avanzan mientras timer.enabled."""
+    return lambda: {("vision_stage_timing_enabled", ()): int(timer.enabled)}
+
+# =================================================================================
+# === SERVIDOR HTTP ===
+# =================================================================================
+
+@functools.lru_cache(maxsize=None)
+def _handler_class():
+    from http.server import BaseHTTPRequestHandler
+
+    class _Handler(BaseHTTPRequestHandler):
+        def do_GET(self):
+            if self.path.split("?")[0] not in ("/metrics", "/"):
+                self.send_error(404); return
+            body = self.server.metrics.render().encode("utf-8")
+            self.send_response(200)
+            self.send_header("Content-Type", "text/plain; version=0.0.4; charset=utf-8")
+            self.send_header("Content-Length", str(len(body)))
+            self.end_headers()
+            self.wfile.write(body)
+
+        def log_message(self, *args): pass # Sin una línea en la consola por cada scrape.
+
+    return _Handler
+
+
+class MetricsServer:
+    """Atiende GET /metrics desde un hilo en segundo plano."""
+
+    def __init__(self, metrics, port=PUERTO_METRICAS, host="127.0.0.1"):
+        self.metrics = metrics
+        self.port = port
+        self.host = host
+        self._server = None
+        self._thread = None
+
+    def start(self):
+        """Empieza a escuchar. Retorna False si el puerto está ocupado (p. ej. otra estación en el mismo equipo)."""
+        if self._server is not None: return True
+        from http.server import ThreadingHTTPServer
+        try: self._server = ThreadingHTTPServer((self.host, self.port), _handler_class())
+        except OSError as e:
+            print(f"ADVERTENCIA: No se pudo abrir el puerto de métricas {self.port}: {e}")
+            return False
+        self._server.daemon_threads = True
+        self._server.metrics = self.metrics
+        self._thread = threading.Thread(target=self._server.serve_forever, name="metricas-http", daemon=True)
+        self._thread.start()
+        return True
+
+    def stop(self):
+        if self._server is None: return
+        self._server.shutdown(); self._server.server_close()
+        self._thread.join(); self._server = self._thread = None
@@ -0,0 +1,153 @@
+# =================================================================================
+# === GEOMETRÍA DE LA GRILLA ===
+# =================================================================================
+#
+# Funciones compartidas por el contador de manchas (TEST.py) y el almacén ArUco
+# (Tarea5) para trabajar con el rectángulo de la grilla.
+#
+# GridGeometry precalcula todo lo que depende sólo de la geometría (bordes de
+# filas y columnas, mapa píxel -> celda, líneas ya dibujadas) y grid_geometry()
+# la reutiliza mientras no cambien offset, tamaño, filas o columnas. Así cada
+# frame sólo ubica los puntos con searchsorted y compone la capa de la grilla
+# con una sola copia enmascarada, en vez de un bucle de cv2.line/cv2.rectangle.
+# Las filas y columnas pueden tener tamaños distintos (row_sizes/col_sizes son
+# proporciones: (1, 2, 1) hace la fila del medio el doble de alta).
+#
+# =================================================================================
+
+import threading
+from functools import lru_cache
+
+import cv2
+import numpy as np
+
+# Margen por defecto (en píxeles) alrededor de la grilla al recortar la región de interés.
+ROI_MARGEN = 20
+
+def roi_bounds(frame_shape, x0, y0, grid_w, grid_h, margin=ROI_MARGEN):
+    """Rectángulo (x1, y1, x2, y2) de la grilla más el margen, recortado a los bordes del frame."""
+    h, w = frame_shape[:2]
+    x1, y1 = max(0, int(x0) - margin), max(0, int(y0) - margin)
+    x2, y2 = min(w, int(x0 + grid_w) + margin), min(h, int(y0 + grid_h) + margin)
+    if x2 <= x1 or y2 <= y1: return None # La grilla quedó fuera del frame.
+    return x1, y1, x2, y2
+
+def crop(frame, roi):
+    """Vista (sin copia) del frame dentro del rectángulo roi; el frame completo si roi es None."""
+    if roi is None: return frame
+    x1, y1, x2, y2 = roi
+    return frame[y1:y2, x1:x2]
+
+def _edges(start, length, n, sizes):
+    """n + 1 bordes desde start hasta start + length, uniformes o proporcionales a sizes."""
+    if sizes is None: return start + length * np.arange(n + 1) / n
+    cumulative = np.concatenate(([0.0], np.cumsum(np.asarray(sizes, dtype=np.float64))))
+    return start + length * cumulative / cumulative[-1]
+
+class GridGeometry:
+    """Geometría fija de una grilla: bordes, mapa píxel -> celda y capas dibujadas en caché."""
+
+    MAX_CAPAS = 16 # Capas de celdas coloreadas guardadas (una por combinación de colores).
+
+    def __init__(self, rows, cols, x0, y0, grid_w, grid_h, row_sizes=None, col_sizes=None):
+        if row_sizes is not None and len(row_sizes) != rows: raise ValueError("row_sizes debe tener una proporción por fila.")
+        if col_sizes is not None and len(col_sizes) != cols: raise ValueError("col_sizes debe tener una proporción por columna.")
+        self.rows, self.cols = rows, cols
+        self.x0, self.y0, self.grid_w, self.grid_h = x0, y0, grid_w, grid_h
+        self.x_edges = _edges(x0, grid_w, cols, col_sizes) # Bordes de las columnas (cols + 1), en píxeles.
+        self.y_edges = _edges(y0, grid_h, rows, row_sizes)
+        # int16 alcanza para las grillas habituales y cabe mejor en caché; con más de 32767 celdas
+        # los índices se desbordarían, así que esas grillas usan int32.
+        self.label_dtype = np.int16 if rows * cols <= np.iinfo(np.int16).max else np.int32
+        self._labels = None
+        self._layers = {}
+        # grid_geometry() comparte la instancia entre hilos (captura, visión, Tk): el lock protege el dict.
+        self._layers_lock = threading.Lock()
+
+    @property
+    def labels(self):
+        """Mapa (grid_h, grid_w) de label_dtype: índice fila * cols + col de la celda de cada píxel de la grilla."""
+        if self._labels is None:
+            c = np.searchsorted(self.x_edges, self.x0 + np.arange(self.grid_w), side="right") - 1
+            r = np.searchsorted(self.y_edges, self.y0 + np.arange(self.grid_h), side="right") - 1
+            self._labels = (r[:, None] * self.cols + c[None, :]).astype(self.label_dtype)
+        return self._labels
+
+    def locate(self, xs, ys):
+        """(filas, columnas, dentro) de los puntos: celda de cada uno y máscara de los que caen en la grilla."""
+        xs, ys = np.asarray(xs), np.asarray(ys)
+        c = np.searchsorted(self.x_edges, xs, side="right") - 1
+        r = np.searchsorted(self.y_edges, ys, side="right") - 1
+        inside = (xs >= self.x0) & (xs < self.x0 + self.grid_w) & (ys >= self.y0) & (ys < self.y0 + self.grid_h)
+        inside &= (r >= 0) & (r < self.rows) & (c >= 0) & (c < self.cols)
+        return r, c, inside
+
+    def cell_ids(self, xs, ys):
+        """Índice de celda (fila * cols + col) de cada punto entero según el mapa de etiquetas; -1 fuera de la grilla."""
+        xs, ys = np.asarray(xs, dtype=np.intp) - self.x0, np.asarray(ys, dtype=np.intp) - self.y0
+        inside = (xs >= 0) & (xs < self.grid_w) & (ys >= 0) & (ys < self.grid_h)
+        ids = np.full(xs.shape, -1, dtype=self.label_dtype)
+        ids[inside] = self.labels[ys[inside], xs[inside]]
+        return ids
+
+    # --- Capas dibujadas ---
+    def _render(self, shape, draw):
+        """Dibuja sobre una imagen vacía del tamaño del frame y guarda sólo el recuadro que contiene la grilla."""
+        h, w = shape[:2]
+        layer = np.zeros((h, w) + shape[2:], dtype=np.uint8)
+        draw(layer)
+        mask = layer.any(axis=2) if layer.ndim == 3 else layer > 0
+        x1, y1 = max(0, int(self.x0)), max(0, int(self.y0))
+        x2, y2 = min(w, int(self.x0 + self.grid_w) + 2), min(h, int(self.y0 + self.grid_h) + 2)
+        if x2 <= x1 or y2 <= y1: return None # La grilla quedó fuera del frame.
+        return (x1, y1, x2, y2), layer[y1:y2, x1:x2].copy(), mask[y1:y2, x1:x2].astype(np.uint8)
+
+    def _layer(self, key, shape, draw):
+        with self._layers_lock: layer = self._layers.get(key, self._layers)
+        if layer is not self._layers: return layer # None también se guarda: grilla fuera del frame.
+        layer = self._render(shape, draw) # Fuera del lock: dos hilos pueden dibujar la misma capa, no se pisan.
+        with self._layers_lock:
+            if len(self._layers) >= self.MAX_CAPAS: self._layers.clear()
+            return self._layers.setdefault(key, layer)
+
+    @staticmethod
+    def _composite(frame, layer):
+        """Copia la capa sobre el frame donde su máscara es distinta de cero (una sola operación)."""
+        if layer is None: return
+        (x1, y1, x2, y2), image, mask = layer
+        cv2.copyTo(image, mask, frame[y1:y2, x1:x2])
+
+    def draw_lines(self, frame, color=(0, 255, 255)):
+        """Compone las líneas de la grilla sobre el frame (dibujadas una vez por forma de frame y color)."""
+        def draw(layer):
+            x_end, y_end = int(self.x0 + self.grid_w), int(self.y0 + self.grid_h)
+            for y in self.y_edges.astype(int): cv2.line(layer, (int(self.x0), y), (x_end, y), color, 1)
+            for x in self.x_edges.astype(int): cv2.line(layer, (x, int(self.y0)), (x, y_end), color, 1)
+        self._composite(frame, self._layer(("lineas", frame.shape, color), frame.shape, draw))
+
+    def draw_cells(self, frame, cell_colors, default_color=(80, 80, 80)):
+        """Compone el borde de cada celda; la capa se vuelve a dibujar sólo cuando cambian los colores."""
+        def draw(layer):
+            xs, ys = self.x_edges.astype(int), self.y_edges.astype(int)
+            for r in range(self.rows):
+                for c in range(self.cols):
+                    cv2.rectangle(layer, (xs[c], ys[r]), (xs[c + 1], ys[r + 1]), cell_colors.get((r, c), default_color), 1)
+        key = ("celdas", frame.shape, tuple(sorted(cell_colors.items())), default_color)
+        self._composite(frame, self._layer(key, frame.shape, draw))
+
+@lru_cache(maxsize=8)
+def _cached_geometry(rows, cols, x0, y0, grid_w, grid_h, row_sizes, col_sizes):
+    return GridGeometry(rows, cols, x0, y0, grid_w, grid_h, row_sizes, col_sizes)
+
+def grid_geometry(rows, cols, x0, y0, grid_w, grid_h, row_sizes=None, col_sizes=None):
+    """GridGeometry para estos valores; se reutiliza la misma instancia mientras no cambien."""
+    return _cached_geometry(int(rows), int(cols), int(x0), int(y0), int(grid_w), int(grid_h),
+                            None if row_sizes is None else tuple(row_sizes), None if col_sizes is None else tuple(col_sizes))
+
+def draw_grid_lines(frame, rows, cols, x0, y0, grid_w, grid_h, color=(0, 255, 255), row_sizes=None, col_sizes=None):
+    """Dibuja las líneas de la grilla sobre el frame (cian por defecto)."""
+    grid_geometry(rows, cols, x0, y0, grid_w, grid_h, row_sizes, col_sizes).draw_lines(frame, color)
+
+def draw_cells(frame, rows, cols, x0, y0, grid_w, grid_h, cell_colors, default_color=(80, 80, 80), row_sizes=None, col_sizes=None):
+    """Dibuja el borde de cada celda; cell_colors asocia (fila, col) a un color distinto del por defecto."""
+    grid_geometry(rows, cols, x0, y0, grid_w, grid_h, row_sizes, col_sizes).draw_cells(frame, cell_colors, default_color)
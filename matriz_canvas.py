@@ -0,0 +1,108 @@
+# =================================================================================
+# === MATRIZ DE ESTADO SOBRE UN ÚNICO CANVAS ===
+# =================================================================================
+#
+# Reemplaza la grilla de un tk.Label por celda. Todas las celdas son un rectángulo
+# y un texto dentro del mismo Canvas; se crean una sola vez por geometría
+# (filas x columnas) y en cada frame sólo se reconfiguran las celdas cuyo
+# contenido cambió respecto del frame anterior.
+#
+# =================================================================================
+
+import tkinter as tk
+
+import numpy as np
+
+
+class StatusMatrix(tk.Canvas):
+    """Matriz de celdas (texto + color de fondo) con actualización sólo de celdas modificadas."""
+
+    def __init__(self, parent, empty_text="Vacío", empty_color="#212121", text_color="white",
+                 font=None, cell_gap=2, **kwargs):
+        kwargs.setdefault("highlightthickness", 0)
+        kwargs.setdefault("bg", empty_color)
+        super().__init__(parent, **kwargs)
+        self.empty = (empty_text, empty_color)
+        self.text_color, self.font, self.cell_gap = text_color, font, cell_gap
+        self.rows, self.cols = 0, 0
+        self._rects, self._texts, self._cells = [], [], []
+        self._last_matrix = None
+        self._non_empty = set()
+        self._size = (0, 0)
+        self.bind("<Configure>", self._on_configure)
+
+    # --- Geometría ---
+    def set_geometry(self, rows, cols):
+        """Crea las celdas para rows x cols. No hace nada si la geometría no cambió."""
+        if (rows, cols) == (self.rows, self.cols): return
+        self.delete("all")
+        self.rows, self.cols = rows, cols
+        self._last_matrix = None
+        self._non_empty = set()
+        text, color = self.empty
+        self._rects = [[self.create_rectangle(0, 0, 0, 0, fill=color, outline="#000000") for _ in range(cols)] for _ in range(rows)]
+        self._texts = [[self.create_text(0, 0, text=text, fill=self.text_color, font=self.font, justify="center") for _ in range(cols)] for _ in range(rows)]
+        self._cells = [[self.empty] * cols for _ in range(rows)]
+        self._layout()
+
+    def _on_configure(self, event):
+        if (event.width, event.height) != self._size:
+            self._size = (event.width, event.height)
+            self._layout()
+
+    def _layout(self):
+        # Sólo se ejecuta al cambiar la geometría o el tamaño del widget, nunca por frame.
+        if self.rows <= 0 or self.cols <= 0: return
+        width, height = self._size if self._size != (0, 0) else (self.winfo_reqwidth(), self.winfo_reqheight())
+        cell_w, cell_h, gap = width / self.cols, height / self.rows, self.cell_gap
+        # Con celdas muy chicas el texto no se alcanza a leer y sólo queda el color.
+        state = "normal" if cell_w >= 40 and cell_h >= 16 else "hidden"
+        for r in range(self.rows):
+            for c in range(self.cols):
+                x1, y1 = c * cell_w + gap, r * cell_h + gap
+                x2, y2 = (c + 1) * cell_w - gap, (r + 1) * cell_h - gap
+                self.coords(self._rects[r][c], x1, y1, x2, y2)
+                self.coords(self._texts[r][c], (x1 + x2) / 2, (y1 + y2) / 2)
+                self.itemconfigure(self._texts[r][c], width=max(1, x2 - x1 - 4), state=state)
+
+    # --- Actualización de celdas ---
+    def _apply(self, r, c, cell):
+        if self._cells[r][c] == cell: return
+        text, color = cell
+        old_text, old_color = self._cells[r][c]
+        if text != old_text: self.itemconfigure(self._texts[r][c], text=text)
+        if color != old_color: self.itemconfigure(self._rects[r][c], fill=color)
+        self._cells[r][c] = cell
+
+    def update_matrix(self, matrix, styles):
+        """Actualiza desde una matriz de estados; styles asocia cada valor a (texto, color)."""
+        matrix = np.asarray(matrix)
+        self.set_geometry(*matrix.shape)
+        if self._last_matrix is None:
+            changed = np.argwhere(np.ones(matrix.shape, dtype=bool))
+        else:
+            changed = np.argwhere(matrix != self._last_matrix)
+        for r, c in changed.tolist():
+            self._apply(r, c, styles.get(matrix[r, c], self.empty))
+        self._last_matrix = matrix.copy()
+
+    def set_cell(self, r, c, cell=None):
+        """Actualiza una sola celda con (texto, color); None la deja vacía. Para actualizar por eventos."""
+        if not (0 <= r < self.rows and 0 <= c < self.cols): return
+        if self._last_matrix is not None: # Viene de update_matrix: cualquier celda puede estar ocupada.
+            self._non_empty = {(r2, c2) for r2 in range(self.rows) for c2 in range(self.cols)}
+            self._last_matrix = None
+        self._apply(r, c, cell or self.empty)
+        if cell is None: self._non_empty.discard((r, c))
+        else: self._non_empty.add((r, c))
+
+    def update_cells(self, cells):
+        """Actualiza desde un dict {(fila, col): (texto, color)}; las celdas ausentes quedan vacías."""
+        if self._last_matrix is not None: # Viene de update_matrix: cualquier celda puede estar ocupada.
+            self._non_empty = {(r, c) for r in range(self.rows) for c in range(self.cols)}
+        self._last_matrix = None
+        for r, c in self._non_empty - cells.keys():
+            self._apply(r, c, self.empty)
+        for (r, c), cell in cells.items():
+            if 0 <= r < self.rows and 0 <= c < self.cols: self._apply(r, c, cell)
+        self._non_empty = set(cells.keys())
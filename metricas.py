@@ -0,0 +1,141 @@
+# =================================================================================
+# === TIEMPOS POR ETAPA CON PERCENTILES MÓVILES ===
+# =================================================================================
+#
+# Capa liviana de medición para los bucles de video. Cada etapa (captura,
+# desenfoque, umbral, detección, dibujo, visualización, matriz de estado...) se
+# envuelve con "with timer.stage(nombre):" y el temporizador guarda las últimas
+# mediciones en una ventana móvil, de la que calcula p50/p95/p99 y los FPS.
+# Opcionalmente dibuja un resumen sobre el frame y agrega una fila por etapa a
+# un CSV cada cierto intervalo.
+#
+# Desactivado, stage() retorna siempre el mismo contexto vacío, por lo que el
+# costo es una llamada a método por etapa. Con metrics (un StationMetrics de
+# exportador_metricas.py) cada medición alimenta también los histogramas que se
+# publican por HTTP, pero sólo mientras el temporizador está activado: el mismo
+# interruptor que el resumen en pantalla, que timing_collector publica como
+# vision_stage_timing_enabled para que un tablero sepa por qué no hay latencias.
+#
+# =================================================================================
+
+import csv
+import os
+import time
+from collections import deque
+from contextlib import nullcontext
+
+import cv2
+import numpy as np
+
+_NULL_STAGE = nullcontext()
+
+
+class _Stage:
+    """Contexto reutilizable que mide una etapa y la registra al salir."""
+    __slots__ = ("timer", "name", "t0")
+
+    def __init__(self, timer, name):
+        self.timer, self.name, self.t0 = timer, name, 0.0
+
+    def __enter__(self):
+        self.t0 = time.perf_counter()
+        return self
+
+    def __exit__(self, *exc):
+        self.timer.record(self.name, (time.perf_counter() - self.t0) * 1000.0)
+        return False
+
+
+class StageTimer:
+    """Registra la duración de cada etapa y calcula percentiles sobre una ventana móvil."""
+
+    def __init__(self, window=300, enabled=False, overlay=True, csv_path=None, csv_interval=10.0, metrics=None):
+        self.window = window
+        self.enabled = enabled
+        self.metrics = metrics
+        self.overlay = overlay
+        self.csv_path = csv_path
+        self.csv_interval = csv_interval
+        self._samples = {}
+        self._stages = {}
+        self._frames = deque(maxlen=window)
+        self._summary = None
+        self._summary_time = 0.0
+        self._last_dump = time.monotonic()
+
+    def set_enabled(self, enabled):
+        self.enabled = enabled
+        if not enabled: self.reset()
+
+    def reset(self):
+        self._samples.clear(); self._frames.clear(); self._summary = None
+
+    # --- Medición ---
+    def stage(self, name):
+        """Contexto que mide la etapa name. Sin costo de medición cuando está desactivado."""
+        if not self.enabled: return _NULL_STAGE
+        stage = self._stages.get(name)
+        if stage is None: stage = self._stages[name] = _Stage(self, name)
+        return stage
+
+    def record(self, name, ms):
+        """Agrega una medición (en milisegundos) a la etapa name, si está activado."""
+        if not self.enabled: return
+        if self.metrics is not None: self.metrics.observe(name, ms)
+        samples = self._samples.get(name)
+        if samples is None: samples = self._samples[name] = deque(maxlen=self.window)
+        samples.append(ms)
+
+    def tick(self):
+        """Marca el fin de un frame: alimenta el cálculo de FPS y el volcado periódico a CSV."""
+        if self.metrics is not None: self.metrics.tick()
+        if not self.enabled: return
+        now = time.monotonic()
+        self._frames.append(now)
+        if self.csv_path and now - self._last_dump >= self.csv_interval:
+            self._last_dump = now
+            self.dump_csv()
+
+    # --- Resultados ---
+    def fps(self):
+        if len(self._frames) < 2: return 0.0
+        elapsed = self._frames[-1] - self._frames[0]
+        return (len(self._frames) - 1) / elapsed if elapsed > 0 else 0.0
+
+    def summary(self, max_age=0.5):
+        """{etapa: (p50, p95, p99, n)} en ms. Se recalcula como mucho cada max_age segundos."""
+        now = time.monotonic()
+        if self._summary is None or now - self._summary_time >= max_age:
+            self._summary = {}
+            for name, samples in self._samples.items():
+                if not samples: continue
+                p50, p95, p99 = np.percentile(np.fromiter(samples, dtype=float), (50, 95, 99))
+                self._summary[name] = (p50, p95, p99, len(samples))
+            self._summary_time = now
+        return self._summary
+
+    def draw_overlay(self, frame, origin=(10, 20)):
+        """Escribe FPS y percentiles por etapa en la esquina del frame."""
+        if not (self.enabled and self.overlay): return
+        x, y = origin
+        lines = [f"FPS {self.fps():5.1f}"] + [f"{name:<14} p50 {p50:6.1f}  p95 {p95:6.1f}  p99 {p99:6.1f} ms"
+                                            for name, (p50, p95, p99, _) in self.summary().items()]
+        for i, line in enumerate(lines):
+            pos = (x, y + i * 18)
+            cv2.putText(frame, line, pos, cv2.FONT_HERSHEY_PLAIN, 1.1, (0, 0, 0), 3)
+            cv2.putText(frame, line, pos, cv2.FONT_HERSHEY_PLAIN, 1.1, (0, 255, 255), 1)
+
+    def dump_csv(self, path=None):
+        """Agrega al CSV una fila por etapa con la marca de tiempo, los percentiles y los FPS."""
+        path = path or self.csv_path
+        if not path: return
+        new_file = not os.path.exists(path)
+        fps, stamp = self.fps(), time.strftime("%Y-%m-%d %H:%M:%S")
+        with open(path, "a", newline="", encoding="utf-8") as f:
+            writer = csv.writer(f)
+            if new_file: writer.writerow(["fecha", "etapa", "p50_ms", "p95_ms", "p99_ms", "muestras", "fps"])
+            for name, (p50, p95, p99, n) in self.summary(max_age=0).items():
+                writer.writerow([stamp, name, f"{p50:.3f}", f"{p95:.3f}", f"{p99:.3f}", n, f"{fps:.2f}"])
+
+# Temporizador desactivado para usar por defecto donde no se configuró uno.
+NULL_TIMER = StageTimer(enabled=False)
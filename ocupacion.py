@@ -0,0 +1,93 @@
+# =================================================================================
+# === SEGUIMIENTO DE OCUPACIÓN CON HISTÉRESIS ===
+# =================================================================================
+#
+# La ocupación que se calcula en cada frame (matriz 0/1 del contador de manchas o
+# ID de marcador por celda en el almacén) parpadea cuando una mancha o un marcador
+# queda en el borde de la detección. OccupancyTracker mantiene un estado estable
+# por celda y sólo lo cambia cuando la nueva observación se repite durante varios
+# frames seguidos: frames_on para ocupar (o cambiar de pieza) y frames_off, más
+# exigente, para vaciar. Por cada cambio real emite un evento a los suscriptores,
+# así la interfaz y el despachador del robot no reaccionan a un frame aislado.
+# El primer frame (o el primero con otra geometría) fija el estado sin eventos:
+# quien muestra la grilla completa lo dibuja con subscribe_reset().
+# Una observación que no viene de un stream (imagen fija, parámetros cambiados a
+# mano) se aplica con immediate=True, sin esperar frames que no van a llegar.
+#
+# =================================================================================
+
+import time
+from collections import namedtuple
+
+import numpy as np
+
+# Frames consecutivos que debe repetirse una observación para aceptarla.
+FRAMES_OCUPAR = 3
+FRAMES_VACIAR = 5
+
+OccupancyEvent = namedtuple("OccupancyEvent", "cell old new piece_id timestamp")
+
+
+class OccupancyTracker:
+    """Estado estable por celda con antirrebote; avisa sólo los cambios confirmados."""
+
+    def __init__(self, empty=0, frames_on=FRAMES_OCUPAR, frames_off=FRAMES_VACIAR, piece_ids=False):
+        self.empty = empty  # Valor de celda vacía (0 en la matriz de manchas, -1 para IDs de marcador).
+        self.piece_ids = piece_ids # True si el estado de cada celda es el ID de la pieza.
+        self.frames_on = frames_on
+        self.frames_off = frames_off
+        self.state = None   # Matriz estable (la que deben usar la interfaz y el despachador).
+        self._candidate = None
+        self._count = None
+        self._listeners = []
+        self._reset_listeners = []
+
+    def subscribe(self, callback):
+        """callback(events) con la lista de OccupancyEvent de cada actualización que tuvo cambios."""
+        self._listeners.append(callback)
+
+    def unsubscribe(self, callback):
+        if callback in self._listeners: self._listeners.remove(callback)
+
+    def subscribe_reset(self, callback):
+        """callback(state) cada vez que el estado se fija sin eventos (primer frame o nueva geometría)."""
+        self._reset_listeners.append(callback)
+
+    def reset(self):
+        """Olvida el estado; la próxima observación se acepta tal cual (sin eventos)."""
+        self.state = None
+
+    def cells_in(self, value):
+        """Celdas (fila, col) cuyo estado estable es value."""
+        if self.state is None: return []
+        return [tuple(cell) for cell in np.argwhere(self.state == value).tolist()]
+
+    def update(self, observed, timestamp=None, immediate=False):
+        """Incorpora la observación de un frame (matriz de estados). Retorna los eventos emitidos.
+
+        Con immediate=True la observación se acepta sin antirrebote: cada celda distinta emite su evento.
+        El primer frame y cada cambio de geometría fijan el estado sin eventos (avisa subscribe_reset).
+        """
+        observed = np.asarray(observed)
+        timestamp = time.time() if timestamp is None else timestamp
+        if self.state is None or self.state.shape != observed.shape:
+            # No hay un estado anterior con qué comparar: no es un cambio, así que el relleno no reacciona.
+            self.state, self._candidate = observed.copy(), observed.copy()
+            self._count = np.zeros(observed.shape, dtype=np.int32)
+            for callback in list(self._reset_listeners): callback(self.state)
+            return []
+        self._count = np.where(observed == self._candidate, self._count + 1, 1)
+        self._candidate[...] = observed
+        needed = np.where(observed == self.empty, self.frames_off, self.frames_on)
+        flip = (observed != self.state) & ((self._count >= needed) | immediate)
+        if not flip.any(): return []
+        events = [self._event((r, c), self.state[r, c], observed[r, c], timestamp) for r, c in np.argwhere(flip).tolist()]
+        self.state[flip] = observed[flip]
+        for callback in list(self._listeners): callback(events)
+        return events
+
+    def _event(self, cell, old, new, timestamp):
+        # piece_id: la pieza que llegó o, si la celda se vació, la que se retiró.
+        old, new = old.item(), new.item()
+        piece = (new if new != self.empty else old) if self.piece_ids else None
+        return OccupancyEvent(cell, old, new, None if piece == self.empty else piece, timestamp)
@@ -0,0 +1,93 @@
+# =================================================================================
+# === PLANIFICADOR DE FRAMES ADAPTATIVO PARA TKINTER ===
+# =================================================================================
+#
+# Reemplaza los after(20/30/50, ...) fijos. FrameScheduler llama a su callback a
+# una tasa objetivo descontando lo que tardó el procesamiento: si una vuelta
+# tardó 25 ms a 30 FPS, la siguiente se agenda a los 8 ms y no a los 20. Si el
+# procesamiento no alcanza la tasa, los ciclos perdidos se descartan (no se
+# encadenan vueltas atrasadas) y la siguiente vuelta trabaja con el frame más
+# nuevo; la carga medida queda en load() para ajustar la tasa.
+#
+# RateGate permite que una etapa (p. ej. la detección) corra a una tasa menor que
+# la visualización: entre una detección y otra se reutiliza el último resultado.
+#
+# =================================================================================
+
+import time
+
+# Tasas por defecto: visualización y detección.
+FPS_VISUALIZACION = 30.0
+HZ_DETECCION = 10.0
+
+
+class FrameScheduler:
+    """Ejecuta callback() desde el bucle de Tkinter a fps vueltas por segundo, descontando su duración."""
+
+    def __init__(self, root, callback, fps=FPS_VISUALIZACION):
+        self.root = root
+        self.callback = callback
+        self.period = 1.0 / fps
+        self.skipped = 0     # Ciclos descartados por atraso.
+        self._busy = 0.0     # Duración media de una vuelta (s), suavizada.
+        self._next = 0.0
+        self._after_id = None
+        self._running = False
+
+    def set_fps(self, fps):
+        self.period = 1.0 / max(0.1, fps)
+
+    def start(self):
+        if self._running: return
+        self._running = True
+        self._next = time.monotonic()
+        self._after_id = self.root.after(0, self._run)
+
+    def stop(self):
+        self._running = False
+        if self._after_id is not None: self.root.after_cancel(self._after_id); self._after_id = None
+
+    def is_running(self):
+        return self._running
+
+    def load(self):
+        """Fracción del período que ocupa el procesamiento (>1 significa que no alcanza la tasa)."""
+        return self._busy / self.period
+
+    def _run(self):
+        self._after_id = None
+        if not self._running: return
+        start = time.monotonic()
+        try:
+            self.callback()
+        finally:
+            end = time.monotonic()
+            self._busy += 0.1 * ((end - start) - self._busy)
+            self._next += self.period
+            if self._next < end:
+                # Atrasado: se saltan los ciclos perdidos en vez de ejecutarlos seguidos.
+                missed = int((end - self._next) / self.period) + 1
+                self.skipped += missed; self._next += missed * self.period
+            if self._running: self._after_id = self.root.after(max(1, int((self._next - end) * 1000)), self._run)
+
+
+class RateGate:
+    """Indica si toca ejecutar una etapa para que no supere hz ejecuciones por segundo (None: siempre)."""
+
+    def __init__(self, hz=HZ_DETECCION):
+        self.set_rate(hz)
+        self._last = None
+
+    def set_rate(self, hz):
+        self.interval = 1.0 / hz if hz else 0.0
+
+    def reset(self):
+        """La próxima consulta a due() retorna True."""
+        self._last = None
+
+    def due(self):
+        now = time.monotonic()
+        # Se compara con un pequeño margen para no perder una ejecución por el redondeo de after().
+        if self._last is not None and now - self._last < self.interval - 0.002: return False
+        self._last = now
+        return True
@@ -0,0 +1,141 @@
+# =================================================================================
+# === RECTIFICACIÓN DE LA ESTANTERÍA (LENTE Y PERSPECTIVA) ===
+# =================================================================================
+#
+# Las cámaras están montadas en ángulo y con lentes gran angular: en la imagen
+# cruda la estantería es un cuadrilátero curvado, y una grilla rectangular en
+# píxeles de la cámara obliga a procesar mucho más de lo necesario. Rectifier
+# lleva sólo el cuadrilátero de la estantería a una imagen compacta vista de
+# frente, en un único cv2.remap.
+#
+# Las tablas de remap combinan la corrección del lente (matriz de cámara y
+# coeficientes de distorsión de cv2.calibrateCamera, en calibracion.npz) con la
+# homografía del cuadrilátero: se calculan una vez con initUndistortRectifyMap
+# y se reconstruyen sólo cuando cambia la calibración o el cuadrilátero. Sin
+# calibración sólo se corrige la perspectiva.
+#
+# El cuadrilátero se puede fijar con cuatro marcadores ArUco en las esquinas de
+# la estantería (MARCADORES_ESQUINA, en orden sup. izq., sup. der., inf. der.,
+# inf. izq.): se usa la esquina interior de cada uno, así los marcadores de
+# referencia quedan fuera de la imagen rectificada y no ocupan celdas.
+#
+# =================================================================================
+
+import os
+
+import cv2
+import numpy as np
+
+CALIBRACION_FILE = "calibracion.npz"
+# IDs de los marcadores de referencia (los más altos de DICT_5X5_100, para no chocar con las piezas).
+MARCADORES_ESQUINA = (96, 97, 98, 99)
+
+
+class Rectifier:
+    """Lleva el cuadrilátero de la estantería a una imagen de frente con tablas de remap en caché."""
+
+    def __init__(self, camera_matrix=None, dist_coeffs=None, scale=1.0):
+        self.camera_matrix = None
+        self.dist_coeffs = None
+        self.scale = scale # Píxeles de salida por píxel del cuadrilátero (sin distorsión) en la imagen cruda.
+        self.quad = None   # 4 esquinas (sup. izq., sup. der., inf. der., inf. izq.) en la imagen cruda.
+        self.size = None   # (ancho, alto) de la imagen rectificada.
+        self.homography = None # Imagen sin distorsión -> imagen rectificada.
+        self._maps = None
+        self._last = None  # (frame, imagen rectificada) de la última llamada a rectify().
+        if camera_matrix is not None: self.set_calibration(camera_matrix, dist_coeffs)
+
+    @property
+    def ready(self):
+        return self.homography is not None
+
+    # --- Configuración (cada cambio invalida las tablas) ---
+    def set_calibration(self, camera_matrix, dist_coeffs=None):
+        """Matriz de cámara 3x3 y coeficientes de distorsión; None para no corregir el lente."""
+        self.camera_matrix = None if camera_matrix is None else np.asarray(camera_matrix, dtype=np.float64).reshape(3, 3)
+        self.dist_coeffs = None if dist_coeffs is None else np.asarray(dist_coeffs, dtype=np.float64).ravel()
+        if self.quad is not None: self.set_quad(self.quad) # La homografía depende de la corrección del lente.
+
+    def load_calibration(self, path=CALIBRACION_FILE):
+        """Lee camera_matrix y dist_coeffs de un .npz. Retorna False si el archivo no existe."""
+        if not os.path.exists(path): return False
+        with np.load(path) as data: self.set_calibration(data["camera_matrix"], data["dist_coeffs"])
+        return True
+
+    def set_quad(self, points, size=None):
+        """Fija el cuadrilátero (4 puntos de la imagen cruda, en sentido horario desde arriba a la izquierda).
+
+        size=(ancho, alto) de la salida; por defecto el largo de los lados del cuadrilátero por scale.
+        """
+        self.quad = np.asarray(points, dtype=np.float32).reshape(4, 2)
+        src = self._undistort(self.quad)
+        if size is None:
+            width = max(np.linalg.norm(src[1] - src[0]), np.linalg.norm(src[2] - src[3]))
+            height = max(np.linalg.norm(src[3] - src[0]), np.linalg.norm(src[2] - src[1]))
+            size = (width * self.scale, height * self.scale)
+        self.size = (max(1, int(round(size[0]))), max(1, int(round(size[1]))))
+        w, h = self.size
+        dst = np.float32([[0, 0], [w - 1, 0], [w - 1, h - 1], [0, h - 1]])
+        self.homography = cv2.getPerspectiveTransform(src, dst)
+        self._maps = self._last = None
+
+    def set_quad_from_markers(self, corners, ids, marker_ids=MARCADORES_ESQUINA, size=None):
+        """Fija el cuadrilátero con la esquina interior de los cuatro marcadores de referencia.
+
+        corners/ids como los entrega detect_markers, en coordenadas de la imagen cruda.
+        Retorna False si falta alguno.
+        """
+        if ids is None: return False
+        found = dict(zip(ids.flatten().tolist(), corners))
+        if not all(marker_id in found for marker_id in marker_ids): return False
+        # Las esquinas de un marcador van en sentido horario desde la suya sup. izq.: la interior
+        # del marcador de la posición i es la opuesta, (i + 2) % 4.
+        self.set_quad([found[marker_id].reshape(4, 2)[(i + 2) % 4] for i, marker_id in enumerate(marker_ids)], size)
+        return True
+
+    def clear(self):
+        self.quad = self.size = self.homography = None
+        self._maps = self._last = None
+
+    # --- Tablas de remap ---
+    def maps(self):
+        """(map1, map2) en punto fijo para cv2.remap; se calculan sólo la primera vez tras cada cambio."""
+        if self._maps is None:
+            K = np.eye(3) if self.camera_matrix is None else self.camera_matrix
+            # initUndistortRectifyMap lleva cada píxel de salida p a K · distorsión((H · K)^-1 · p):
+            # con H · K como "nueva matriz de cámara" la homografía queda incluida en la misma tabla.
+            self._maps = cv2.initUndistortRectifyMap(K, self.dist_coeffs, None, self.homography @ K, self.size, cv2.CV_16SC2)
+        return self._maps
+
+    def rectify(self, frame):
+        """Imagen rectificada (size) del frame crudo. El mismo frame no se vuelve a rectificar."""
+        if self._last is not None and self._last[0] is frame: return self._last[1]
+        map1, map2 = self.maps()
+        rectified = cv2.remap(frame, map1, map2, cv2.INTER_LINEAR, borderMode=cv2.BORDER_CONSTANT)
+        self._last = (frame, rectified)
+        return rectified
+
+    # --- Conversión de coordenadas ---
+    def _undistort(self, points):
+        points = np.asarray(points, dtype=np.float32).reshape(-1, 1, 2)
+        if self.camera_matrix is None: return points.reshape(-1, 2)
+        return cv2.undistortPoints(points, self.camera_matrix, self.dist_coeffs, P=self.camera_matrix).reshape(-1, 2)
+
+    def to_frame(self, points):
+        """Puntos de la imagen rectificada llevados a la imagen cruda (p. ej. para dibujar sobre ella)."""
+        points = np.asarray(points, dtype=np.float64).reshape(-1, 1, 2)
+        undistorted = cv2.perspectiveTransform(points, np.linalg.inv(self.homography))
+        if self.camera_matrix is None: return undistorted.reshape(-1, 2)
+        normalized = cv2.undistortPoints(undistorted, self.camera_matrix, None) # Sólo divide por K.
+        object_points = cv2.convertPointsToHomogeneous(normalized).reshape(-1, 3)
+        projected, _ = cv2.projectPoints(object_points, np.zeros(3), np.zeros(3), self.camera_matrix, self.dist_coeffs)
+        return projected.reshape(-1, 2)
+
+    def to_rectified(self, points):
+        """Puntos de la imagen cruda llevados a la imagen rectificada."""
+        undistorted = self._undistort(points).reshape(-1, 1, 2).astype(np.float64)
+        return cv2.perspectiveTransform(undistorted, self.homography).reshape(-1, 2)
+
+    def draw_quad(self, frame, color=(255, 0, 255)):
+        """Dibuja el cuadrilátero fijado sobre la imagen cruda."""
+        if self.quad is not None: cv2.polylines(frame, [self.quad.astype(np.int32).reshape(-1, 1, 2)], True, color, 2)
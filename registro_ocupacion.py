@@ -0,0 +1,254 @@
+# =================================================================================
+# === REGISTRO BINARIO DE OCUPACIÓN (AUDITORÍA A TASA COMPLETA) ===
+# =================================================================================
+#
+# OccupancyRecorder guarda la matriz observada en cada frame (0/1 del contador de
+# manchas o ID de marcador por celda en el almacén) en archivos binarios de sólo
+# agregado. Cada archivo tiene un encabezado de 64 bytes y registros de ancho
+# fijo (marca de tiempo float64 + matriz int16 filas x columnas), y se escribe a
+# través de un np.memmap preasignado: record() sólo copia unos bytes en memoria.
+# Un hilo en segundo plano hace el flush a disco y recién entonces actualiza la
+# cantidad de registros del encabezado, así que un lector nunca ve un registro a
+# medio escribir. Al llenarse un archivo (o al cambiar la geometría) se abre el
+# siguiente; el anterior, igual que el último al detener el registro, lo cierra
+# el mismo hilo: flush final y recorte del archivo a encabezado + registros
+# escritos, sin frenar el bucle de captura ni la interfaz.
+#
+# Como los registros tienen ancho fijo, la columna de tiempos se lee como una
+# vista y se busca con searchsorted, sin recorrer los datos.
+#
+# Consultas:
+#   python registro_ocupacion.py celda registro/ --fila 1 --columna 2 --desde "2025-06-02 08:00" --hasta "2025-06-02 09:00"
+#   python registro_ocupacion.py salida registro/ --id 17
+#
+# =================================================================================
+
+import argparse
+import glob
+import os
+import sys
+import threading
+import time
+from datetime import datetime
+
+import numpy as np
+
+from ocupacion import FRAMES_VACIAR
+
+REGISTRO_DIR = "registro"
+MAGIC = b"OCUPLOG1"
+HEADER_DTYPE = np.dtype([("magic", "S8"), ("version", "<u2"), ("rows", "<u2"), ("cols", "<u2"), ("empty", "<i2"),
+                         ("capacity", "<u4"), ("count", "<u4"), ("t0", "<f8"), ("reservado", "V32")])
+HEADER_SIZE = HEADER_DTYPE.itemsize # 64 bytes
+# Tamaño de cada archivo antes de pasar al siguiente, y período del flush en segundo plano.
+TAMANO_ARCHIVO = 64 * 1024 * 1024
+INTERVALO_FLUSH = 1.0
+
+def record_dtype(rows, cols):
+    return np.dtype([("t", "<f8"), ("cells", "<i2", (rows, cols))])
+
+def open_log(path):
+    """(encabezado, registros) de un archivo, en sólo lectura; sólo los registros ya confirmados."""
+    data = np.memmap(path, dtype=np.uint8, mode="r")
+    header = data[:HEADER_SIZE].view(HEADER_DTYPE)[0]
+    if header["magic"] != MAGIC: raise ValueError(f"{path} no es un registro de ocupación.")
+    dtype = record_dtype(int(header["rows"]), int(header["cols"]))
+    records = data[HEADER_SIZE:HEADER_SIZE + int(header["capacity"]) * dtype.itemsize].view(dtype)
+    return header, records[:int(header["count"])]
+
+
+class OccupancyRecorder:
+    """Escritor de sólo agregado de matrices por frame, con memmap, rotación por tamaño y flush en segundo plano."""
+
+    def __init__(self, directory=REGISTRO_DIR, prefix="ocupacion", empty=0, file_size=TAMANO_ARCHIVO, flush_interval=INTERVALO_FLUSH):
+        self.directory = directory
+        self.prefix = prefix
+        self.empty = empty # Valor de celda vacía que se guarda en el encabezado (para las consultas).
+        self.file_size = file_size
+        self.flush_interval = flush_interval
+        self.path = None
+        self.records_written = 0
+        self._data = None     # memmap del archivo actual
+        self._header = None
+        self._records = None
+        self._count = 0
+        self._closing = []  # Archivos a cerrar en el hilo de flush: [(ruta, memmap, encabezado, cantidad, tamaño de registro)]
+        self._lock = threading.Lock()       # Estado del archivo actual y _closing (record / hilo de flush).
+        self._flush_lock = threading.Lock() # Actualización de la cantidad en el encabezado.
+        self._stop = None
+        self._thread = None
+
+    def start(self):
+        if self._thread is not None: return
+        os.makedirs(self.directory, exist_ok=True)
+        # Cada hilo tiene su evento: uno detenido termina de cerrar sus archivos aunque ya haya arrancado otro.
+        self._stop = threading.Event()
+        self._thread = threading.Thread(target=self._run, args=(self._stop,), name="registro-ocupacion", daemon=True)
+        self._thread.start()
+
+    def stop(self, wait=False):
+        """Deja de registrar. El archivo actual lo cierra el hilo de flush al terminar, sin frenar a quien
+        llama; wait=True espera a que quede cerrado (al salir del programa, antes de que muera el hilo)."""
+        if self._thread is None: return
+        thread, self._thread = self._thread, None
+        with self._lock: self._detach()
+        self._stop.set()
+        if wait: thread.join()
+
+    def is_running(self):
+        return self._thread is not None
+
+    def record(self, matrix, timestamp=None):
+        """Agrega la matriz de un frame. No hace E/S: la escritura a disco la hace el hilo de flush."""
+        if self._thread is None: return
+        matrix = np.asarray(matrix)
+        timestamp = time.time() if timestamp is None else timestamp
+        with self._lock:
+            if self._records is None or self._records.dtype["cells"].shape != matrix.shape or self._count >= len(self._records):
+                self._open(matrix.shape, timestamp) # Primer registro, nueva geometría o archivo lleno.
+            slot = self._records[self._count]
+            slot["t"], slot["cells"] = timestamp, matrix
+            self._count += 1
+        self.records_written += 1
+
+    # --- Archivos ---
+    def _open(self, shape, timestamp):
+        self._detach()
+        rows, cols = shape
+        dtype = record_dtype(rows, cols)
+        capacity = max(1, (self.file_size - HEADER_SIZE) // dtype.itemsize)
+        stamp, sequence = datetime.fromtimestamp(timestamp).strftime("%Y%m%d-%H%M%S"), 0
+        while os.path.exists(path := os.path.join(self.directory, f"{self.prefix}_{stamp}_{sequence:03d}.ocup")): sequence += 1
+        self.path = path
+        self._data = np.memmap(self.path, dtype=np.uint8, mode="w+", shape=(HEADER_SIZE + capacity * dtype.itemsize,))
+        self._header = self._data[:HEADER_SIZE].view(HEADER_DTYPE)
+        self._header[0] = (MAGIC, 1, rows, cols, self.empty, capacity, 0, timestamp, b"")
+        self._data.flush()
+        self._records = self._data[HEADER_SIZE:].view(dtype)
+        self._count = 0
+
+    def _flush(self, data, header, count):
+        # Primero los datos, después la cantidad: el encabezado nunca cuenta registros que no están en disco.
+        with self._flush_lock:
+            if count <= header[0]["count"]: return
+            data.flush()
+            header[0]["count"] = count
+            data.flush()
+
+    def _detach(self):
+        # Con self._lock tomado: deja el archivo actual para que lo cierre el hilo de flush.
+        if self._data is None: return
+        self._closing.append((self.path, self._data, self._header, self._count, self._records.dtype.itemsize))
+        self._data = self._header = self._records = None
+
+    def _close_pending(self):
+        with self._lock: closing, self._closing = self._closing, []
+        while closing:
+            path, data, header, count, itemsize = closing.pop(0)
+            self._flush(data, header, count)
+            header[0]["capacity"] = count; data.flush() # El archivo queda del tamaño justo para open_log.
+            del data, header # Sin referencias el memmap se libera y el archivo se puede recortar.
+            try: os.truncate(path, HEADER_SIZE + count * itemsize)
+            except OSError as e: print(f"ADVERTENCIA: No se pudo recortar {path}: {e}")
+
+    def _flush_current(self):
+        # Sólo se toma el lock para leer el estado: el flush a disco no frena a record().
+        with self._lock: data, header, count = self._data, self._header, self._count
+        if data is not None: self._flush(data, header, count)
+
+    def _run(self, stop):
+        while not stop.wait(self.flush_interval):
+            self._flush_current()
+            self._close_pending()
+        self._close_pending()
+
+# =================================================================================
+# === CONSULTAS ===
+# =================================================================================
+
+def log_files(directory=REGISTRO_DIR, prefix="*"):
+    """Archivos del registro ordenados por el instante de su primer registro."""
+    paths = glob.glob(os.path.join(directory, f"{prefix}_*.ocup"))
+    return sorted(paths, key=lambda path: float(open_log(path)[0]["t0"]))
+
+def _segments(directory, prefix, t1, t2):
+    """(encabezado, registros) de cada archivo recortados a [t1, t2], en orden cronológico."""
+    for path in log_files(directory, prefix):
+        header, records = open_log(path)
+        times = records["t"] # Vista de la columna de tiempos (paso fijo), sin copiar los registros.
+        first = 0 if t1 is None else int(np.searchsorted(times, t1, side="left"))
+        last = len(records) if t2 is None else int(np.searchsorted(times, t2, side="right"))
+        if first < last: yield header, records[first:last]
+
+def cell_history(directory, row, col, t1=None, t2=None, prefix="*"):
+    """Estado de la celda (row, col) entre t1 y t2 como tramos [(desde, hasta, valor)]."""
+    runs = []
+    for header, records in _segments(directory, prefix, t1, t2):
+        if row >= header["rows"] or col >= header["cols"]: continue # Archivo con otra geometría.
+        times, values = records["t"], records["cells"][:, row, col]
+        starts = np.flatnonzero(np.diff(values, prepend=values[0] - 1)) # Índices donde cambia el valor.
+        for i, start in enumerate(starts.tolist()):
+            end = starts[i + 1] - 1 if i + 1 < len(starts) else len(values) - 1
+            value = int(values[start])
+            if runs and runs[-1][2] == value: runs[-1] = (runs[-1][0], float(times[end]), value) # Continúa del archivo anterior.
+            else: runs.append((float(times[start]), float(times[end]), value))
+    return runs
+
+def departures(directory, marker_id, t1=None, t2=None, prefix="*", frames=FRAMES_VACIAR):
+    """Instantes en que marker_id dejó una celda: [(t, (fila, col))].
+
+    Como el registro guarda la observación cruda de cada frame, una salida cuenta sólo
+    si el ID sigue ausente de esa celda durante frames frames (el mismo antirrebote que
+    OccupancyTracker); así un parpadeo de la detección no aparece como salida.
+    """
+    chunks = [] # Tramos consecutivos con la misma geometría: [(tiempos, presencia)].
+    for _, records in _segments(directory, prefix, t1, t2):
+        present = records["cells"] == marker_id
+        if chunks and chunks[-1][1][0].shape[1:] == present.shape[1:]: chunks[-1][0].append(records["t"]); chunks[-1][1].append(present)
+        else: chunks.append(([records["t"]], [present]))
+    found = []
+    for times, present in chunks:
+        times, present = np.concatenate(times), np.concatenate(present)
+        # seen[i] = frames con el ID hasta i inclusive; ausente en (i, i + frames] si no aumenta.
+        seen = np.cumsum(present, axis=0)
+        ahead = seen[np.minimum(np.arange(len(seen)) + frames, len(seen) - 1)]
+        left = present[:-1] & ~present[1:] & (ahead[:-1] == seen[:-1])
+        for i, r, c in np.argwhere(left).tolist(): found.append((float(times[i + 1]), (r, c)))
+    return sorted(found)
+
+def parse_time(text):
+    """Segundos desde epoch o fecha ISO ('2025-06-02 08:00:00')."""
+    try: return float(text)
+    except ValueError: return datetime.fromisoformat(text).timestamp()
+
+def format_time(t):
+    return datetime.fromtimestamp(t).isoformat(sep=" ", timespec="milliseconds")
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Consultas sobre el registro binario de ocupación.")
+    commands = parser.add_subparsers(dest="consulta", required=True)
+    celda = commands.add_parser("celda", help="Estado de una celda entre dos instantes.")
+    celda.add_argument("--fila", type=int, required=True)
+    celda.add_argument("--columna", type=int, required=True)
+    salida = commands.add_parser("salida", help="Cuándo un ID dejó su celda.")
+    salida.add_argument("--id", type=int, required=True)
+    for command in (celda, salida):
+        command.add_argument("directorio", nargs="?", default=REGISTRO_DIR)
+        command.add_argument("--prefijo", default="*", help="Prefijo de los archivos (p. ej. almacen, conteo).")
+        command.add_argument("--desde", type=parse_time, help="Segundos desde epoch o fecha ISO.")
+        command.add_argument("--hasta", type=parse_time, help="Segundos desde epoch o fecha ISO.")
+    salida.add_argument("--frames", type=int, default=FRAMES_VACIAR, help="Frames que el ID debe seguir ausente para contar como salida.")
+    args = parser.parse_args(argv)
+
+    if args.consulta == "celda":
+        runs = cell_history(args.directorio, args.fila, args.columna, args.desde, args.hasta, args.prefijo)
+        for start, end, value in runs: print(f"{format_time(start)}  {format_time(end)}  {value}")
+        if not runs: print("Sin registros en ese intervalo.", file=sys.stderr)
+    else:
+        found = departures(args.directorio, args.id, args.desde, args.hasta, args.prefijo, args.frames)
+        for t, (r, c) in found: print(f"{format_time(t)}  celda ({r},{c})")
+        if not found: print(f"El ID {args.id} no salió de ninguna celda en ese intervalo.", file=sys.stderr)
+    return 0
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,268 @@
+# =================================================================================
+# === REPRODUCCIÓN DE VIDEOS GRABADOS (ANÁLISIS FUERA DE LÍNEA) ===
+# =================================================================================
+#
+# VideoReplay lee un archivo de video como fuente de frames, a velocidad máxima o
+# a una velocidad elegida (1.0 = tiempo real). Los frames que no se procesan
+# (paso > 1, o atraso respecto de la velocidad pedida) se saltan con grab(), que
+# no decodifica la imagen; sólo los que se procesan pasan por retrieve(). Tiene
+# la misma interfaz que CameraCapture (start/stop/is_running/read), así que las
+# GUI pueden usarlo en lugar de la cámara.
+#
+# Como script, reprocesa grabaciones completas con la lógica del contador de
+# manchas (TEST.py) o del almacén ArUco (Tarea5) y escribe un resultado por
+# frame. Cada video se divide en segmentos que se reparten en un pool de procesos.
+# En modo aruco, --hilos N detecta además los frames de cada segmento en un pool de
+# hilos (BatchDetector, sin seguimiento): un solo proceso puede usar todos los núcleos.
+#
+# Ejemplos:
+#   python reproduccion.py turno.mp4 --modo conteo --grilla 40 10 400 300 --filas 3 --columnas 2 --salida turno.csv
+#   python reproduccion.py turno.mp4 --modo aruco --grilla 40 10 1200 700 --filas 3 --columnas 4 --paso 5 --desde 01:30:00
+#   python reproduccion.py turno.mp4 --modo aruco --procesos 1 --hilos 8
+#
+# =================================================================================
+
+import argparse
+import os
+import sys
+import time
+from collections import deque
+from multiprocessing import Pool
+
+import cv2
+import cv2.aruco as aruco
+
+from conteo import MIN_AREA_MANCHA, UMBRAL_ALTO, UMBRAL_BAJO, find_blobs, grid_occupancy
+from conteo_lotes import ResultWriter
+from detector_aruco import BatchDetector, MarkerTracker, marker_cells
+from grilla import roi_bounds
+
+
+class VideoReplay:
+    """Fuente de frames desde un archivo de video, con salto de frames y búsqueda por tiempo."""
+
+    def __init__(self, path, speed=None, step=1, start=0.0, end=None):
+        self.path = path
+        self.speed = speed  # None: lo más rápido posible; 1.0: tiempo real; 4.0: cuatro veces más rápido.
+        self.step = max(1, step) # Procesa uno de cada step frames.
+        self.start_time = start
+        self.end_time = end
+        self.cap = None
+        self.fps = 0.0
+        self.frame_count = 0
+        self.position = 0   # Índice del próximo frame del archivo.
+        self._skip = 0      # Frames a saltar antes del próximo (step - 1 tras cada frame entregado).
+        self._clock = None  # (instante real, índice) desde el que se mide la velocidad.
+        self._running = False
+
+    def open(self):
+        """Abre el archivo. Retorna False si no se pudo abrir."""
+        self.cap = cv2.VideoCapture(self.path)
+        if not self.cap.isOpened():
+            self.cap.release(); self.cap = None
+            return False
+        self.fps = self.cap.get(cv2.CAP_PROP_FPS) or 30.0
+        self.frame_count = int(self.cap.get(cv2.CAP_PROP_FRAME_COUNT))
+        if self.start_time: self.seek(self.start_time)
+        return True
+
+    def close(self):
+        if self.cap is not None: self.cap.release(); self.cap = None
+
+    def seek(self, seconds):
+        """Posiciona la lectura en el frame correspondiente a seconds desde el inicio del video."""
+        self.seek_frame(int(round(seconds * self.fps)))
+
+    def seek_frame(self, index):
+        self.cap.set(cv2.CAP_PROP_POS_FRAMES, index)
+        self.position = int(self.cap.get(cv2.CAP_PROP_POS_FRAMES))
+        self._clock, self._skip = None, 0
+
+    def next(self, wait=True):
+        """(índice, segundo del video, frame) del próximo frame a procesar; None al terminar.
+
+        Con speed definido y wait=False retorna False si todavía no corresponde mostrar
+        el siguiente frame (para usarlo desde un bucle que no debe bloquearse).
+        """
+        skip = self._skip
+        if self.speed:
+            now = time.monotonic()
+            if self._clock is None: self._clock = (now, self.position)
+            due = self._clock[1] + int((now - self._clock[0]) * self.speed * self.fps)
+            if due < self.position + skip:
+                if not wait: return False
+                time.sleep((self.position + skip - due) / (self.speed * self.fps))
+            else: skip = due - self.position # Atrasado: se saltan los frames que ya debieron mostrarse.
+        for _ in range(skip):
+            if not self.cap.grab(): return None
+            self.position += 1
+        if not self.cap.grab(): return None
+        index = self.position; self.position += 1; self._skip = self.step - 1
+        seconds = index / self.fps
+        if self.end_time is not None and seconds > self.end_time: return None
+        ok, frame = self.cap.retrieve()
+        return (index, seconds, frame) if ok else None
+
+    def __iter__(self):
+        while (item := self.next()) is not None: yield item
+
+    # --- Interfaz de CameraCapture ---
+    def start(self):
+        if self._running: return True
+        self._running = self.cap is not None or self.open()
+        return self._running
+
+    def stop(self):
+        self._running = False
+        self.close()
+
+    def is_running(self):
+        return self._running
+
+    def read(self):
+        """Próximo frame y su marca de tiempo, como CameraCapture.read(). (None, None) si no hay uno nuevo."""
+        if not self._running: return None, None
+        item = self.next(wait=False)
+        if item is False: return None, None
+        if item is None: self._running = False; return None, None # Fin del video.
+        return item[2], time.time()
+
+# =================================================================================
+# === ANÁLISIS POR SEGMENTOS (UN PROCESO POR SEGMENTO) ===
+# =================================================================================
+
+_params = {}
+
+def _init_worker(params):
+    global _params
+    _params = params
+    cv2.setNumThreads(1) # El paralelismo lo da el pool; evita sobre-suscribir los núcleos.
+
+def analyze_segment(task):
+    """Procesa los frames [first, last) de un video. Retorna la lista de resultados por frame."""
+    path, first, last = task
+    p = _params
+    replay = VideoReplay(path, step=p["step"])
+    if not replay.open(): return [{"archivo": path, "error": "no se pudo abrir el video"}]
+    if first: replay.seek_frame(first)
+    batch = None
+    if p["mode"] == "aruco":
+        aruco_dict = aruco.getPredefinedDictionary(aruco.DICT_5X5_100)
+        aruco_params = aruco.DetectorParameters()
+        aruco_params.cornerRefinementMethod = aruco.CORNER_REFINE_SUBPIX
+        tracker = MarkerTracker(aruco_dict, aruco_params, scale=p["scale"])
+        batch = BatchDetector(aruco_dict, aruco_params, p["threads"], scale=p["scale"]) if p["threads"] > 1 else None
+
+    def frames():
+        for index, seconds, frame in replay:
+            if last is not None and index >= last: break
+            roi = None
+            if p["grid"] and p["roi_margin"] is not None: roi = roi_bounds(frame.shape, *p["grid"], p["roi_margin"])
+            yield {"archivo": path, "frame": index, "tiempo_s": round(seconds, 3)}, frame, roi
+
+    results = []
+    try:
+        if p["mode"] == "conteo":
+            for result, frame, roi in frames():
+                _, _, manchas = find_blobs(frame, p["lower"], p["upper"], p["min_area"], roi)
+                result["manchas"] = len(manchas)
+                if p["grid"]:
+                    matriz = grid_occupancy(manchas, p["rows"], p["cols"], *p["grid"])
+                    result["ocupadas"], result["ocupacion"] = int(matriz.sum()), matriz.tolist()
+                results.append(result)
+        else:
+            if batch is None: detections = ((result, tracker.detect(frame, roi)) for result, frame, roi in frames())
+            else:
+                # Los resultados salen en orden; pending guarda los datos de cada frame hasta entonces
+                # (la roi se pide justo después de leer el frame, que es el último encolado).
+                pending = deque()
+                def queued():
+                    for result, frame, roi in frames(): pending.append((result, roi)); yield frame
+                detections = ((pending.popleft()[0], found) for found in batch.map(queued(), lambda _: pending[-1][1]))
+            for result, (corners, ids) in detections:
+                result["marcadores"] = 0 if ids is None else len(ids)
+                if p["grid"]:
+                    cells = marker_cells(corners, ids, p["rows"], p["cols"], *p["grid"])
+                    result["celdas"] = ";".join(f"{r},{c}={marker_id}" for (r, c), marker_id in sorted(cells.items()))
+                results.append(result)
+    finally:
+        replay.close()
+        if batch is not None: batch.close()
+    return results
+
+def split_tasks(path, segment_s, start_s, end_s, step=1):
+    """Divide un video en tramos de segment_s segundos: [(ruta, primer frame, frame siguiente al último)]."""
+    replay = VideoReplay(path)
+    if not replay.open(): return [(path, 0, None)] # El error se informa al procesarlo.
+    fps, total = replay.fps, replay.frame_count
+    replay.close()
+    first = int(round(start_s * fps))
+    stop = None if end_s is None else int(round(end_s * fps)) + 1
+    if total <= 0 or not segment_s: return [(path, first, stop)] # Sin cantidad de frames conocida: un solo tramo.
+    size = max(1, int(segment_s * fps)); size += -size % max(1, step) # Múltiplo del paso: el muestreo no depende del tramo.
+    tasks = [(path, a, a + size) for a in range(first, total if stop is None else min(stop, total), size)]
+    if not tasks: return []
+    # El último tramo llega hasta stop o, sin --hasta, hasta el final real (CAP_PROP_FRAME_COUNT es aproximado).
+    tasks[-1] = (path, tasks[-1][1], stop)
+    return tasks
+
+def parse_time(text):
+    """'90', '01:30' o '00:01:30' a segundos."""
+    seconds = 0.0
+    for part in text.split(":"): seconds = seconds * 60 + float(part)
+    return seconds
+
+def parse_args(argv=None):
+    parser = argparse.ArgumentParser(description="Reprocesa videos grabados con el contador de manchas o el almacén ArUco.")
+    parser.add_argument("videos", nargs="+", help="Archivos de video.")
+    parser.add_argument("--modo", choices=("conteo", "aruco"), default="conteo")
+    parser.add_argument("--salida", default="-", help="Archivo de salida (.csv o .jsonl). '-' para la salida estándar.")
+    parser.add_argument("--formato", choices=("csv", "jsonl"), help="Formato de salida; por defecto se deduce de la extensión.")
+    parser.add_argument("--paso", type=int, default=1, help="Procesar uno de cada N frames (el resto se salta con grab()).")
+    parser.add_argument("--desde", type=parse_time, default=0.0, help="Inicio (segundos o HH:MM:SS).")
+    parser.add_argument("--hasta", type=parse_time, help="Fin (segundos o HH:MM:SS).")
+    parser.add_argument("--segmento", type=float, default=120.0, help="Segundos de video por tarea del pool.")
+    parser.add_argument("--escala", type=float, default=1.0, help="Modo aruco: escala de detección (< 1 detecta en la imagen reducida).")
+    parser.add_argument("--umbral-bajo", type=int, default=UMBRAL_BAJO)
+    parser.add_argument("--umbral-alto", type=int, default=UMBRAL_ALTO)
+    parser.add_argument("--area-min", type=int, default=MIN_AREA_MANCHA)
+    parser.add_argument("--grilla", type=int, nargs=4, metavar=("X0", "Y0", "ANCHO", "ALTO"), help="Rectángulo de la grilla.")
+    parser.add_argument("--filas", type=int, default=3)
+    parser.add_argument("--columnas", type=int, default=2)
+    parser.add_argument("--roi-margen", type=int, help="Procesar sólo la grilla más este margen en píxeles (requiere --grilla).")
+    parser.add_argument("--procesos", type=int, default=os.cpu_count(), help="Cantidad de procesos del pool.")
+    parser.add_argument("--hilos", type=int, default=1, help="Modo aruco: hilos de detección por proceso (> 1 desactiva el seguimiento).")
+    args = parser.parse_args(argv)
+    if args.formato is None:
+        args.formato = "jsonl" if args.salida.lower().endswith((".jsonl", ".json")) else "csv"
+    if args.grilla and (args.filas <= 0 or args.columnas <= 0):
+        parser.error("Filas y columnas deben ser mayores a cero.")
+    return args
+
+def main(argv=None):
+    args = parse_args(argv)
+    params = {"mode": args.modo, "step": args.paso, "scale": args.escala, "threads": args.hilos, "lower": args.umbral_bajo, "upper": args.umbral_alto, "min_area": args.area_min,
+              "grid": args.grilla, "rows": args.filas, "cols": args.columnas, "roi_margin": args.roi_margen}
+    tasks = [task for path in args.videos for task in split_tasks(path, args.segmento, args.desde, args.hasta, args.paso)]
+    if args.modo == "conteo":
+        fields = ["archivo", "frame", "tiempo_s", "manchas"] + (["ocupadas", "ocupacion"] if args.grilla else []) + ["error"]
+    else:
+        fields = ["archivo", "frame", "tiempo_s", "marcadores"] + (["celdas"] if args.grilla else []) + ["error"]
+
+    stream = sys.stdout if args.salida == "-" else open(args.salida, "w", newline="", encoding="utf-8")
+    t0, frames = time.monotonic(), 0
+    try:
+        writer = ResultWriter(stream, args.formato, fields=fields)
+        with Pool(processes=args.procesos, initializer=_init_worker, initargs=(params,)) as pool:
+            # imap conserva el orden de los segmentos: la salida queda en orden cronológico.
+            for results in pool.imap(analyze_segment, tasks):
+                for result in results: writer.write(result)
+                frames += len(results)
+    finally:
+        if stream is not sys.stdout: stream.close()
+    elapsed = time.monotonic() - t0
+    print(f"{frames} frames en {elapsed:.1f} s ({frames / elapsed if elapsed else 0:.0f} frames/s).", file=sys.stderr)
+    return 0
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,122 @@
+# =================================================================================
+# === SERVICIO DE CÁMARA Y DETECCIÓN COMPARTIDO ===
+# =================================================================================
+#
+# Una sola instancia por aplicación: abre la cámara una vez, la mantiene
+# transmitiendo mientras la aplicación esté abierta y comparte un único detector
+# ArUco (diccionario, parámetros y seguimiento) entre las pantallas. Cada
+# pantalla se suscribe al mostrarse y se desuscribe al ocultarse, así que
+# cambiar de vista no cierra ni reabre el dispositivo.
+#
+# Los frames se entregan desde el bucle de Tkinter (un FrameScheduler), por lo que
+# los callbacks pueden tocar widgets directamente. La visualización corre a fps y la
+# detección a detect_hz: entre detecciones se entregan los frames nuevos con el
+# último resultado y detected=False. Todos los suscriptores reciben el mismo
+# frame: quien quiera dibujar sin afectar a los demás debe copiarlo.
+#
+# Con un rectifier listo (ver rectificacion.py) los frames se rectifican antes de
+# detectar: los suscriptores reciben la imagen rectificada y las esquinas en sus
+# coordenadas.
+#
+# =================================================================================
+
+import time
+
+import cv2.aruco as aruco
+
+from captura import CameraCapture
+from detector_aruco import MarkerTracker
+from metricas import NULL_TIMER
+from planificador import FPS_VISUALIZACION, HZ_DETECCION, FrameScheduler, RateGate
+from reproduccion import VideoReplay
+
+
+class VisionService:
+    """Cámara y detector ArUco compartidos; entrega (frame, corners, ids, roi, detected) a los suscriptores."""
+
+    def __init__(self, root, index=0, flip=False, fps=FPS_VISUALIZACION, detect_hz=HZ_DETECCION, timer=NULL_TIMER, metrics=None):
+        self.root = root
+        self.index = index # Índice de cámara, o ruta de un video grabado (ver set_source).
+        self.flip = flip
+        self.replay_speed = 1.0
+        self.timer = timer
+        self.metrics = metrics # StationMetrics para publicar la cantidad de marcadores, o None.
+        self.cap = None
+        self.scheduler = FrameScheduler(root, self._poll, fps)
+        self.detection = RateGate(detect_hz)
+        self._subscribers = {} # callback -> función frame -> roi (o None para el frame completo)
+        self._last = None # ((forma del frame, roi), corners, ids) de la última detección
+        self.rectifier = None # Rectifier que se aplica a cada frame, o None para la imagen cruda.
+
+        # --- Configuración del detector ArUco (única para toda la aplicación) ---
+        self.aruco_dict = aruco.getPredefinedDictionary(aruco.DICT_5X5_100)
+        self.aruco_params = aruco.DetectorParameters()
+        self.aruco_params.cornerRefinementMethod = aruco.CORNER_REFINE_SUBPIX
+        self.tracker = MarkerTracker(self.aruco_dict, self.aruco_params)
+
+    # --- Cámara ---
+    def start(self):
+        """Abre la cámara si aún no está abierta. Retorna False si no se pudo abrir."""
+        if self.is_running(): return True
+        if isinstance(self.index, str): self.cap = VideoReplay(self.index, speed=self.replay_speed)
+        else: self.cap = CameraCapture(self.index, flip=self.flip)
+        if not self.cap.start(): self.cap = None; return False
+        self.tracker.reset(); self._last = None
+        return True
+
+    def stop(self):
+        """Detiene la entrega de frames y libera la cámara (al cerrar la aplicación)."""
+        self.scheduler.stop()
+        if self.cap: self.cap.stop(); self.cap = None
+
+    def is_running(self):
+        return self.cap is not None and self.cap.is_running()
+
+    def set_source(self, source, speed=1.0):
+        """Cambia a otra cámara (índice) o a un video grabado (ruta) a la velocidad dada (None: máxima).
+
+        Los suscriptores siguen recibiendo frames de la nueva fuente. Retorna False si no se pudo abrir.
+        """
+        self.stop()
+        self.index, self.replay_speed = source, speed
+        if not self._subscribers: return True
+        if not self.start(): return False
+        self.detection.reset(); self.scheduler.start()
+        return True
+
+    # --- Suscripciones ---
+    def subscribe(self, callback, roi=None):
+        """Registra callback(frame, corners, ids, roi, detected). roi: función frame -> (x1, y1, x2, y2) o None.
+
+        detected es False cuando corners/ids son de una detección anterior. Retorna
+        False si la cámara no se pudo abrir.
+        """
+        self._subscribers[callback] = roi
+        if not self.start(): return False
+        self.detection.reset(); self.scheduler.start()
+        return True
+
+    def unsubscribe(self, callback):
+        """Quita el suscriptor. La cámara sigue abierta; sin suscriptores sólo se deja de detectar."""
+        self._subscribers.pop(callback, None)
+        if not self._subscribers: self.scheduler.stop()
+
+    def _poll(self):
+        if not self._subscribers or not self.is_running(): self.scheduler.stop(); return
+        frame, timestamp = self.cap.read() # Sólo el frame más reciente; None si no llegó uno nuevo.
+        if frame is None: return
+        self.timer.record("captura", (time.time() - timestamp) * 1000.0)
+        if self.rectifier is not None and self.rectifier.ready:
+            with self.timer.stage("rectificacion"): frame = self.rectifier.rectify(frame)
+        # Con varios suscriptores que piden regiones distintas se analiza el frame completo.
+        rois = {roi_fn(frame) if roi_fn else None for roi_fn in self._subscribers.values()}
+        roi = rois.pop() if len(rois) == 1 else None
+        # Se vuelve a detectar de inmediato si cambió la región o la forma del frame (p. ej. al rectificar).
+        detected = self._last is None or self._last[0] != (frame.shape, roi) or self.detection.due()
+        if detected:
+            with self.timer.stage("deteccion"):
+                corners, ids = self.tracker.detect(frame, roi) # Esquinas en coordenadas del frame completo.
+            self._last = ((frame.shape, roi), corners, ids)
+            if self.metrics is not None: self.metrics.set("vision_markers", 0 if ids is None else len(ids))
+        _, corners, ids = self._last
+        for callback in list(self._subscribers): callback(frame, corners, ids, roi, detected)
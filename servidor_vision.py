@@ -0,0 +1,504 @@
+# =================================================================================
+# === SERVIDOR DE VISIÓN SIN INTERFAZ Y CLIENTES LIVIANOS ===
+# =================================================================================
+#
+# VisionServer corre la captura y la detección (ArUco o manchas) en un proceso
+# sin Tk, con los parámetros de la grilla en un diccionario de configuración (el
+# mismo formato que una estantería de estanterias.json, más "modo"), y publica
+# por un socket TCP o Unix local el resultado de cada frame a cualquier cantidad
+# de suscriptores. El bucle de visión nunca espera a un cliente: cada uno tiene
+# una cola de dos mensajes y, si no alcanza a leerlos, se descartan los más
+# viejos. Las vistas previas JPEG (con la grilla y las detecciones dibujadas) se
+# codifican sólo si algún cliente las pidió, a lo sumo HZ_PREVIEW veces por segundo.
+#
+# Protocolo (una línea JSON por mensaje):
+#   servidor -> cliente: {"tipo": "config", "config": {...}} al conectarse y en cada cambio;
+#                        {"tipo": "resultado", "n", "t", "fps", "forma", "ids", "esquinas",
+#                         "manchas", "celdas", "jpeg": N, "escala"} seguido de N bytes JPEG si N > 0;
+#                        {"tipo": "error", "errores": {clave: motivo}} si se rechaza un cambio.
+#   cliente -> servidor: {"preview": true, "ancho_preview": 640} y/o {"config": {"x0": 50, ...}}.
+# Cada cambio se valida contra VALIDADORES (tipo y rango) y se aplica entre frames.
+# "camara" (un índice o una ruta de video del servidor) sólo lo pueden cambiar los
+# clientes locales, por socket Unix o desde 127.0.0.1/::1: con --host 0.0.0.0 un
+# cliente remoto ajusta la grilla y el modo, pero no elige qué archivo abre el servidor.
+#
+# VisionClient lee el stream en un hilo y guarda sólo el último mensaje;
+# RemoteVisionService tiene la interfaz de VisionService (subscribe/unsubscribe),
+# así las pantallas de Tarea5 funcionan igual conectadas a un servidor remoto.
+# TEST.py y TEST_modificado.py no tienen modo cliente: rectifican el frame, ajustan
+# la ROI y despachan rellenos al robot por el puerto serie con la matriz de cada
+# frame, así que siguen corriendo la visión en su propio proceso.
+#
+#   python servidor_vision.py --camara 0 --modo aruco --puerto 8765
+#   python servidor_vision.py --config estanteria.json --unix /tmp/vision.sock
+#   python Tarea5_Parra.py --servidor 192.168.1.20:8765
+#
+# =================================================================================
+
+import argparse
+import asyncio
+import ipaddress
+import json
+import socket
+import sys
+import threading
+import time
+from collections import deque
+from types import SimpleNamespace
+
+import cv2
+import cv2.aruco as aruco
+import numpy as np
+
+from captura import CameraCapture
+from conteo import MIN_AREA_MANCHA, UMBRAL_ALTO, UMBRAL_BAJO, find_blobs, grid_occupancy
+from detector_aruco import MarkerTracker, marker_cells
+from estanterias import DEFAULT_SHELF
+from grilla import draw_cells, draw_grid_lines, roi_bounds
+from metricas import NULL_TIMER
+from ocupacion import OccupancyTracker
+from planificador import FPS_VISUALIZACION, FrameScheduler
+from reproduccion import VideoReplay
+
+PUERTO_VISION = 8765
+HZ_PREVIEW = 10.0
+CALIDAD_JPEG = 80
+# Configuración por defecto: una estantería más el modo y los umbrales del contador de manchas.
+DEFAULT_CONFIG = {**DEFAULT_SHELF, "modo": "aruco", "hz_deteccion": None,
+                  "umbral_bajo": UMBRAL_BAJO, "umbral_alto": UMBRAL_ALTO, "area_min": MIN_AREA_MANCHA}
+# Claves que, al cambiar, obligan a reabrir la cámara o a reiniciar el estado de la grilla.
+CLAVES_CAMARA = ("camara",)
+CLAVES_GRILLA = ("modo", "filas", "columnas", "x0", "y0", "ancho", "alto", "altos_filas", "anchos_columnas")
+
+
+def _number(kind, low=None, high=None, optional=False):
+    """Validador: convierte a kind (int/float) y exige low <= valor <= high; None sólo si optional."""
+    def check(value):
+        if value is None and optional: return None
+        if isinstance(value, bool) or isinstance(value, (list, dict)): raise ValueError(f"se esperaba un número, no {value!r}")
+        number = kind(value)
+        if (low is not None and number < low) or (high is not None and number > high):
+            raise ValueError(f"{number} fuera de [{low}, {high}]")
+        return number
+    return check
+
+def _sizes(value):
+    if value is None: return None
+    if not isinstance(value, (list, tuple)) or not value: raise ValueError("se esperaba una lista de tamaños")
+    return [_number(float, 1e-6)(size) for size in value]
+
+def _source(value):
+    if isinstance(value, str) and not value.isdigit(): return value # Ruta de un video.
+    return _number(int, 0)(value)
+
+def _mode(value):
+    if value not in ("aruco", "conteo"): raise ValueError(f"modo desconocido {value!r}")
+    return value
+
+# Clave -> validador (convierte el valor o lanza ValueError). Sólo estas claves se pueden cambiar.
+VALIDADORES = {"camara": _source, "modo": _mode,
+               "filas": _number(int, 1), "columnas": _number(int, 1),
+               "x0": _number(int, 0), "y0": _number(int, 0), "ancho": _number(int, 1), "alto": _number(int, 1),
+               "margen_roi": _number(int, 0, optional=True), "hz_deteccion": _number(float, 1e-3, optional=True),
+               "escala": _number(float, 0.05, 1.0), "altos_filas": _sizes, "anchos_columnas": _sizes,
+               "umbral_bajo": _number(int, 0, 255), "umbral_alto": _number(int, 0, 255), "area_min": _number(float, 0)}
+
+def validate_config(config, changes):
+    """(cambios válidos y convertidos, {clave: error}) de aplicar changes sobre config."""
+    valid, errors = {}, {}
+    for key, value in changes.items():
+        if key not in VALIDADORES: errors[key] = "clave desconocida o no configurable"; continue
+        try: valid[key] = VALIDADORES[key](value)
+        except (TypeError, ValueError) as e: errors[key] = str(e)
+    # Los tamaños por fila o columna deben coincidir con la geometría que quedaría.
+    merged = {**config, **valid}
+    for sizes, count in (("altos_filas", "filas"), ("anchos_columnas", "columnas")):
+        if merged[sizes] is not None and len(merged[sizes]) != merged[count]:
+            for key in (sizes, count):
+                if key in valid: errors[key] = f"{sizes} debe tener {merged[count]} valores"; del valid[key]
+    return valid, errors
+
+
+def _is_local(writer):
+    """True si el cliente llegó por un socket Unix o desde la misma máquina (loopback)."""
+    sock = writer.get_extra_info("socket")
+    if sock is not None and sock.family == getattr(socket, "AF_UNIX", None): return True
+    peer = writer.get_extra_info("peername")
+    try: return ipaddress.ip_address(peer[0].split("%")[0]).is_loopback
+    except (TypeError, IndexError, ValueError): return False
+
+def parse_address(address):
+    """'host:puerto', ':puerto' o 'unix:/ruta' -> ("tcp", host, puerto) o ("unix", ruta, None)."""
+    if address.startswith("unix:"): return "unix", address[5:], None
+    host, _, port = address.rpartition(":")
+    return "tcp", host or "127.0.0.1", int(port)
+
+# =================================================================================
+# === SERVIDOR ===
+# =================================================================================
+
+class _Subscriber:
+    __slots__ = ("queue", "preview", "width")
+
+    def __init__(self):
+        self.queue = asyncio.Queue(maxsize=2)
+        self.preview = False
+        self.width = None # Ancho de la vista previa; None para el tamaño del frame.
+
+
+class VisionServer:
+    """Captura y detección sin interfaz que publica cada resultado a los clientes conectados."""
+
+    def __init__(self, config=None, preview_hz=HZ_PREVIEW):
+        self.config = dict(DEFAULT_CONFIG)
+        valid, errors = validate_config(self.config, {k: v for k, v in (config or {}).items() if k in VALIDADORES})
+        if errors: raise ValueError("Configuración inválida: " + ", ".join(f"{k}: {e}" for k, e in errors.items()))
+        self.config.update(valid)
+        self.preview_interval = 1.0 / preview_hz if preview_hz else 0.0
+        self.frames = 0
+        self._subscribers = {}
+        self._cap = None
+        self._tracker = None
+        self._occupancy = None
+        self._frame_times = deque(maxlen=60)
+        self._last_preview = 0.0
+        self._reopen = True
+
+    # --- Configuración ---
+    def update_config(self, changes, local=True):
+        """Aplica los cambios válidos de configuración y los anuncia a todos los clientes.
+
+        Corre en el hilo del event loop, entre frames: el frame en curso usa su propia copia
+        de la configuración. Con local=False (cliente remoto) se rechazan las CLAVES_CAMARA.
+        Retorna {clave: error} de los cambios rechazados.
+        """
+        remote = {} if local else {key: "sólo se puede cambiar desde un cliente local" for key in CLAVES_CAMARA if key in changes}
+        valid, errors = validate_config(self.config, {k: v for k, v in changes.items() if k not in remote})
+        errors.update(remote)
+        if errors: print(f"ADVERTENCIA: Cambios de configuración rechazados: {errors}", file=sys.stderr)
+        changes = {key: value for key, value in valid.items() if self.config[key] != value}
+        if not changes: return errors
+        self.config = {**self.config, **changes} # Un dict nuevo: nunca se modifica uno que se esté leyendo.
+        if any(key in changes for key in CLAVES_CAMARA): self._reopen = True
+        if any(key in changes for key in CLAVES_GRILLA): self._occupancy = None # Se rehace antes del próximo frame.
+        self._broadcast({"tipo": "config", "config": self.config})
+        return errors
+
+    # --- Visión (en un hilo del executor: cv2 libera el GIL) ---
+    def _open_capture(self, source):
+        if self._cap is not None: self._cap.stop()
+        self._cap = VideoReplay(source, speed=1.0) if isinstance(source, str) else CameraCapture(source)
+        if not self._cap.start():
+            print(f"ADVERTENCIA: No se pudo abrir la cámara {source}.", file=sys.stderr); self._cap = None
+
+    def _process(self, frame, timestamp, widths, cfg, tracker, occupancy):
+        # cfg, tracker y occupancy los prepara el event loop antes de cada frame: aquí sólo se usan.
+        grid = (cfg["filas"], cfg["columnas"], cfg["x0"], cfg["y0"], cfg["ancho"], cfg["alto"])
+        sizes = (cfg["altos_filas"], cfg["anchos_columnas"])
+        roi = None if cfg["margen_roi"] is None else roi_bounds(frame.shape, *grid[2:], cfg["margen_roi"])
+        result = {"tipo": "resultado", "n": self.frames, "t": timestamp, "forma": list(frame.shape[:2])}
+        corners, ids, blobs = (), None, None
+        if cfg["modo"] == "aruco":
+            corners, ids = tracker.detect(frame, roi)
+            observed = np.full(grid[:2], -1, dtype=np.int32)
+            for (r, c), found_id in marker_cells(corners, ids, *grid, *sizes).items(): observed[r, c] = int(found_id)
+            result["ids"] = [] if ids is None else ids.flatten().tolist()
+            result["esquinas"] = [np.round(c.reshape(-1), 1).tolist() for c in corners]
+        else:
+            _, _, blobs = find_blobs(frame, cfg["umbral_bajo"], cfg["umbral_alto"], cfg["area_min"], roi)
+            observed = grid_occupancy(blobs, *grid, *sizes)
+            result["manchas"] = np.stack([blobs[k] for k in ("x", "y", "w", "h")], axis=1).astype(int).tolist()
+        occupancy.update(observed)
+        result["celdas"] = occupancy.state.tolist()
+
+        previews = {}
+        if widths:
+            # Vista previa dibujada: la grilla y las detecciones ya van en la imagen.
+            annotated = frame.copy()
+            if cfg["modo"] == "aruco":
+                if ids is not None: aruco.drawDetectedMarkers(annotated, corners, ids, borderColor=(0, 0, 255))
+                draw_cells(annotated, *grid, {}, row_sizes=sizes[0], col_sizes=sizes[1])
+            else:
+                for x, y, w, h in result["manchas"]: cv2.rectangle(annotated, (x, y), (x + w, y + h), (0, 255, 0), 2)
+                draw_grid_lines(annotated, *grid, row_sizes=sizes[0], col_sizes=sizes[1])
+            for width in widths:
+                scale = 1.0 if not width or width >= frame.shape[1] else width / frame.shape[1]
+                image = annotated if scale == 1.0 else cv2.resize(annotated, None, fx=scale, fy=scale, interpolation=cv2.INTER_AREA)
+                ok, jpeg = cv2.imencode(".jpg", image, (cv2.IMWRITE_JPEG_QUALITY, CALIDAD_JPEG))
+                if ok: previews[width] = (scale, jpeg.tobytes())
+        return result, previews
+
+    async def _vision_loop(self):
+        loop = asyncio.get_running_loop()
+        next_due = time.monotonic()
+        while True:
+            if self._reopen:
+                self._reopen = False # Si la cámara cambia mientras se abre, se vuelve a abrir.
+                await loop.run_in_executor(None, self._open_capture, self.config["camara"])
+            if self._cap is None or not self._cap.is_running(): await asyncio.sleep(0.5); continue
+            hz = self.config["hz_deteccion"]
+            if hz:
+                wait = next_due - time.monotonic()
+                if wait > 0: await asyncio.sleep(wait)
+                next_due = max(next_due + 1.0 / hz, time.monotonic())
+            frame, timestamp = self._cap.read()
+            if frame is None: await asyncio.sleep(0.002); continue
+            now = time.monotonic()
+            widths = set()
+            if now - self._last_preview >= self.preview_interval:
+                widths = {s.width for s in self._subscribers.values() if s.preview}
+                if widths: self._last_preview = now
+            # Configuración, detector y estado de la grilla se fijan aquí, entre frames y en el hilo
+            # del event loop (el mismo de update_config): el executor nunca los ve a medio cambiar.
+            cfg = self.config
+            if self._tracker is None:
+                params = aruco.DetectorParameters(); params.cornerRefinementMethod = aruco.CORNER_REFINE_SUBPIX
+                self._tracker = MarkerTracker(aruco.getPredefinedDictionary(aruco.DICT_5X5_100), params)
+            self._tracker.scale = cfg["escala"]
+            if self._occupancy is None: self._occupancy = OccupancyTracker(empty=-1 if cfg["modo"] == "aruco" else 0)
+            try:
+                result, previews = await loop.run_in_executor(None, self._process, frame, timestamp, widths,
+                                                              cfg, self._tracker, self._occupancy)
+            except Exception as e: # Un frame que falla no debe detener el servidor.
+                print(f"ADVERTENCIA: Error al procesar el frame {self.frames}: {e!r}", file=sys.stderr)
+                self._occupancy = None; continue
+            self.frames += 1; self._frame_times.append(now)
+            times = self._frame_times
+            result["fps"] = round((len(times) - 1) / (times[-1] - times[0]), 1) if len(times) > 1 and times[-1] > times[0] else 0.0
+            self._publish(result, previews)
+
+    # --- Publicación ---
+    @staticmethod
+    def _encode(message, payload=b""):
+        return json.dumps(message, separators=(",", ":")).encode("utf-8") + b"\n" + payload
+
+    def _offer(self, subscriber, data):
+        # Sin esperar: si el cliente está atrasado se descarta su mensaje más viejo.
+        if subscriber.queue.full(): subscriber.queue.get_nowait()
+        subscriber.queue.put_nowait(data)
+
+    def _publish(self, result, previews):
+        plain = None
+        for subscriber in self._subscribers.values():
+            preview = previews.get(subscriber.width) if subscriber.preview else None
+            if preview is None:
+                if plain is None: plain = self._encode({**result, "jpeg": 0})
+                self._offer(subscriber, plain)
+            else:
+                scale, jpeg = preview
+                self._offer(subscriber, self._encode({**result, "jpeg": len(jpeg), "escala": scale}, jpeg))
+
+    def _broadcast(self, message):
+        data = self._encode(message)
+        for subscriber in self._subscribers.values(): self._offer(subscriber, data)
+
+    async def _handle(self, reader, writer):
+        subscriber = self._subscribers[writer] = _Subscriber()
+        local = _is_local(writer)
+        self._offer(subscriber, self._encode({"tipo": "config", "config": self.config}))
+        sender = asyncio.create_task(self._send(subscriber, writer))
+        try:
+            while line := await reader.readline():
+                try: request = json.loads(line)
+                except ValueError: continue
+                if "preview" in request: subscriber.preview = bool(request["preview"])
+                if "ancho_preview" in request:
+                    try: subscriber.width = _number(int, 16, optional=True)(request["ancho_preview"] or None)
+                    except (TypeError, ValueError) as e: self._offer(subscriber, self._encode({"tipo": "error", "errores": {"ancho_preview": str(e)}}))
+                if isinstance(request.get("config"), dict):
+                    errors = self.update_config(request["config"], local)
+                    if errors: self._offer(subscriber, self._encode({"tipo": "error", "errores": errors}))
+        except ConnectionError: pass
+        finally:
+            del self._subscribers[writer]
+            sender.cancel(); writer.close()
+
+    async def _send(self, subscriber, writer):
+        try:
+            while True:
+                writer.write(await subscriber.queue.get())
+                await writer.drain()
+        except (ConnectionError, asyncio.CancelledError): pass
+
+    async def serve(self, host="127.0.0.1", port=PUERTO_VISION, path=None):
+        """Atiende clientes en host:port (o en el socket Unix path) hasta que se cancele."""
+        if path: server = await asyncio.start_unix_server(self._handle, path)
+        else: server = await asyncio.start_server(self._handle, host, port)
+        vision = asyncio.create_task(self._vision_loop())
+        try:
+            async with server: await server.serve_forever()
+        finally:
+            vision.cancel()
+            if self._cap is not None: self._cap.stop()
+
+# =================================================================================
+# === CLIENTES ===
+# =================================================================================
+
+class VisionClient:
+    """Lee el stream de un VisionServer en un hilo y conserva sólo el último resultado."""
+
+    def __init__(self, address, preview=True, preview_width=None):
+        self.address = address
+        self.preview = preview
+        self.preview_width = preview_width
+        self.config = None
+        self.errors = {} # Último rechazo del servidor: {clave: motivo}.
+        self.messages = 0
+        self._sock = None
+        self._latest = None  # Encabezado del último resultado no leído.
+        self._preview = None # (encabezado, bytes JPEG) de la última vista previa no leída.
+        self._lock = threading.Lock()
+        self._thread = None
+
+    def connect(self):
+        """Conecta con el servidor. Retorna False si no responde."""
+        if self._sock is not None: return True
+        kind, host, port = parse_address(self.address)
+        try:
+            if kind == "unix": sock = socket.socket(socket.AF_UNIX); sock.connect(host)
+            else: sock = socket.create_connection((host, port), timeout=5.0); sock.settimeout(None)
+        except OSError as e:
+            print(f"ADVERTENCIA: No se pudo conectar con el servidor de visión {self.address}: {e}"); return False
+        self._sock = sock
+        self.send({"preview": self.preview, "ancho_preview": self.preview_width})
+        self._thread = threading.Thread(target=self._run, name="cliente-vision", daemon=True)
+        self._thread.start()
+        return True
+
+    def close(self):
+        if self._sock is None: return
+        try: self._sock.shutdown(socket.SHUT_RDWR)
+        except OSError: pass
+        self._sock.close(); self._sock = None
+        self._thread.join(timeout=2.0); self._thread = None
+
+    def is_connected(self):
+        return self._sock is not None and self._thread is not None and self._thread.is_alive()
+
+    def send(self, request):
+        if self._sock is None: return
+        try: self._sock.sendall(json.dumps(request).encode("utf-8") + b"\n")
+        except OSError: pass
+
+    def send_config(self, **changes):
+        """Cambia parámetros en el servidor (afecta a todos los clientes)."""
+        self.send({"config": changes})
+
+    def read(self):
+        """(encabezado, vista previa decodificada) si llegó una vista previa nueva; si no (encabezado, None)
+        del último resultado, o (None, None) si no hay nada nuevo.
+
+        Con vista previa el encabezado es el del mismo frame, así las esquinas corresponden a la imagen.
+        """
+        with self._lock:
+            latest, preview = self._latest, self._preview
+            self._latest = self._preview = None
+        if preview is None: return latest, None
+        header, jpeg = preview
+        return header, cv2.imdecode(np.frombuffer(jpeg, dtype=np.uint8), cv2.IMREAD_COLOR)
+
+    def _run(self):
+        stream = self._sock.makefile("rb")
+        try:
+            while line := stream.readline():
+                header = json.loads(line)
+                jpeg = stream.read(header["jpeg"]) if header.get("jpeg") else None
+                if header["tipo"] == "config": self.config = header["config"]; continue
+                if header["tipo"] == "error":
+                    self.errors = header["errores"]
+                    print(f"ADVERTENCIA: El servidor de visión rechazó: {self.errors}"); continue
+                with self._lock: # Lo anterior, si nadie lo leyó, se descarta.
+                    self._latest = header
+                    if jpeg: self._preview = (header, jpeg)
+                self.messages += 1
+        except (OSError, ValueError): pass
+
+
+class RemoteVisionService:
+    """Misma interfaz que VisionService, pero los frames y las detecciones llegan de un VisionServer.
+
+    Los frames son las vistas previas del servidor (ya dibujadas) y las esquinas se
+    escalan a su tamaño. La escala de detección se reenvía al servidor; el seguimiento,
+    la ROI y la rectificación se configuran allá.
+    """
+
+    def __init__(self, root, address, fps=FPS_VISUALIZACION, timer=NULL_TIMER, metrics=None, preview_width=None):
+        self.root = root
+        self.index = address
+        self.timer = timer
+        self.metrics = metrics
+        self.client = VisionClient(address, preview=True, preview_width=preview_width)
+        self.cap = None # Sin captura local (los colectores de métricas lo leen).
+        self.scheduler = FrameScheduler(root, self._poll, fps)
+        self.tracker = SimpleNamespace(enabled=True, full_scan_every=0, scale=None)
+        self.rectifier = None
+        self._subscribers = {}
+
+    def start(self):
+        return self.client.connect()
+
+    def stop(self):
+        self.scheduler.stop(); self.client.close()
+
+    def is_running(self):
+        return self.client.is_connected()
+
+    def set_source(self, source, speed=1.0):
+        """Cambia la cámara (índice) o el video (ruta, visto desde el servidor) del servidor."""
+        self.client.send_config(camara=source)
+        return True
+
+    def subscribe(self, callback, roi=None):
+        self._subscribers[callback] = roi
+        if not self.start(): return False
+        self.scheduler.start()
+        return True
+
+    def unsubscribe(self, callback):
+        self._subscribers.pop(callback, None)
+        if not self._subscribers: self.scheduler.stop()
+
+    def _poll(self):
+        if not self._subscribers or not self.is_running(): self.scheduler.stop(); return
+        if self.tracker.scale is not None and self.client.config and self.client.config.get("escala") != self.tracker.scale:
+            self.client.send_config(escala=self.tracker.scale); self.client.config["escala"] = self.tracker.scale
+        header, frame = self.client.read()
+        if frame is None: return
+        scale = header.get("escala", 1.0)
+        corners = tuple(np.array(c, dtype=np.float32).reshape(1, 4, 2) * scale for c in header.get("esquinas", ()))
+        ids = np.array(header["ids"], dtype=np.int32).reshape(-1, 1) if header.get("ids") else None
+        if self.metrics is not None: self.metrics.set("vision_markers", 0 if ids is None else len(ids))
+        for callback in list(self._subscribers): callback(frame, corners, ids, None, True)
+
+# =================================================================================
+# === LÍNEA DE COMANDOS ===
+# =================================================================================
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Servidor de visión sin interfaz: captura, detección y publicación por socket.")
+    parser.add_argument("--config", help="JSON con la configuración (formato de una estantería de estanterias.json, más \"modo\").")
+    parser.add_argument("--camara", help="Índice de cámara o ruta de un video.")
+    parser.add_argument("--modo", choices=("aruco", "conteo"))
+    parser.add_argument("--host", default="127.0.0.1", help="Interfaz donde escuchar (0.0.0.0 para aceptar clientes remotos; "
+                        "ésos no pueden cambiar la cámara, sólo los locales).")
+    parser.add_argument("--puerto", type=int, default=PUERTO_VISION)
+    parser.add_argument("--unix", help="Ruta de un socket Unix en lugar de TCP.")
+    parser.add_argument("--hz-preview", type=float, default=HZ_PREVIEW, help="Vistas previas JPEG por segundo (como máximo).")
+    args = parser.parse_args(argv)
+
+    config = {}
+    if args.config:
+        with open(args.config, "r", encoding="utf-8") as f: config = json.load(f)
+    if args.camara is not None: config["camara"] = int(args.camara) if args.camara.isdigit() else args.camara
+    if args.modo: config["modo"] = args.modo
+    try: server = VisionServer(config, args.hz_preview)
+    except ValueError as e: print(f"ERROR: {e}", file=sys.stderr); return 1
+    where = args.unix or f"{args.host}:{args.puerto}"
+    print(f"Servidor de visión en {where} (modo {server.config['modo']}, cámara {server.config['camara']}).", file=sys.stderr)
+    try: asyncio.run(server.serve(args.host, args.puerto, args.unix))
+    except KeyboardInterrupt: pass
+    return 0
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,154 @@
+# Pruebas de FillDispatcher contra el puerto virtual loop:// de pyserial, con un
+# hilo que hace de controlador: escribe su respuesta en el mismo puerto (el eco de
+# loop:// hace que el despachador la lea) un momento después de cada comando.
+
+import threading
+import time
+
+import pytest
+
+serial = pytest.importorskip("serial")
+
+from despacho import CANCELADO, COMPLETADO, EJECUTANDO, ERROR, HISTORIAL, PENDIENTE, SIN_RESPUESTA, FillDispatcher
+
+
+class FakeController:
+    """Responde reply (o nada, si es None) delay segundos después de cada comando "run"."""
+
+    def __init__(self, reply=b"Done.\r\n", delay=0.05):
+        self.port = serial.serial_for_url("loop://", timeout=0.05)
+        self.reply, self.delay = reply, delay
+        self.commands = []
+        self._lock = threading.Lock()
+        self._write = self.port.write
+        self.port.write = self.write
+
+    def write(self, data):
+        with self._lock: self._write(data)
+        if data.startswith(b"run"):
+            self.commands.append(data)
+            if self.reply is not None: threading.Timer(self.delay, lambda: self.write(self.reply)).start()
+        return len(data)
+
+
+def wait_idle(dispatcher, limit=5.0):
+    deadline = time.monotonic() + limit
+    while dispatcher.is_busy():
+        assert time.monotonic() < deadline, dispatcher.jobs()
+        time.sleep(0.01)
+
+def wait_state(job, state, limit=5.0):
+    deadline = time.monotonic() + limit
+    while job.state != state:
+        assert time.monotonic() < deadline, job
+        time.sleep(0.01)
+
+@pytest.fixture
+def make_dispatcher():
+    dispatchers = []
+    def make(controller, **kwargs):
+        dispatcher = FillDispatcher(controller.port, ready_token=b"Done", **kwargs)
+        dispatcher.start(); dispatchers.append(dispatcher)
+        return dispatcher
+    yield make
+    for dispatcher in dispatchers: dispatcher.stop()
+
+
+def test_ack_completes_jobs_in_order(make_dispatcher):
+    controller = FakeController()
+    dispatcher = make_dispatcher(controller, timeout=2)
+    jobs = [dispatcher.submit(cell) for cell in [(0, 0), (1, 1), (2, 0)]]
+    wait_idle(dispatcher)
+    assert [job.state for job in jobs] == [COMPLETADO] * 3
+    assert controller.commands == [b"run cob05\r", b"run cob04\r", b"run cob01\r"]
+
+def test_submit_returns_active_job_for_same_cell(make_dispatcher):
+    controller = FakeController(delay=0.3)
+    dispatcher = make_dispatcher(controller, timeout=2)
+    assert dispatcher.submit((0, 0)) is dispatcher.submit((0, 0))
+    wait_idle(dispatcher)
+    assert len(controller.commands) == 1
+
+def test_timeout_is_unknown_not_error(make_dispatcher):
+    controller = FakeController(reply=None)
+    dispatcher = make_dispatcher(controller, timeout=0.3)
+    job = dispatcher.submit((0, 0))
+    wait_idle(dispatcher)
+    assert job.state == SIN_RESPUESTA
+
+def test_unknown_reply_times_out(make_dispatcher):
+    controller = FakeController(reply=b"OK\r\n")
+    dispatcher = make_dispatcher(controller, timeout=0.3)
+    job = dispatcher.submit((0, 0))
+    wait_idle(dispatcher)
+    assert job.state == SIN_RESPUESTA
+
+def test_error_token_is_confirmed_failure(make_dispatcher):
+    controller = FakeController(reply=b"Error 12\r\n")
+    dispatcher = make_dispatcher(controller, timeout=2, error_token=b"Error")
+    job = dispatcher.submit((0, 0))
+    wait_idle(dispatcher)
+    assert job.state == ERROR
+
+def test_port_that_fails_to_open_is_error_and_retried():
+    controller = FakeController()
+    attempts = []
+    def open_port():
+        attempts.append(1)
+        if len(attempts) == 1: raise OSError("no existe el puerto")
+        return controller.port
+    dispatcher = FillDispatcher(ready_token=b"Done", timeout=2, open_port=open_port)
+    dispatcher.start()
+    try:
+        first = dispatcher.submit((0, 0)); wait_idle(dispatcher)
+        second = dispatcher.submit((0, 0)); wait_idle(dispatcher)
+    finally: dispatcher.stop()
+    assert (first.state, second.state) == (ERROR, COMPLETADO)
+    assert controller.commands == [b"run cob05\r"]
+
+def test_cancel_pending_job_is_never_sent(make_dispatcher):
+    controller = FakeController(delay=0.3)
+    dispatcher = make_dispatcher(controller, timeout=2)
+    running = dispatcher.submit((0, 0))
+    pending = dispatcher.submit((1, 1))
+    wait_state(running, EJECUTANDO)
+    assert pending.state == PENDIENTE and dispatcher.cancel(pending.id)
+    wait_idle(dispatcher)
+    assert (running.state, pending.state) == (COMPLETADO, CANCELADO)
+    assert controller.commands == [b"run cob05\r"]
+
+def test_cancel_running_without_abort_is_refused(make_dispatcher):
+    controller = FakeController(delay=0.3)
+    dispatcher = make_dispatcher(controller, timeout=2)
+    job = dispatcher.submit((0, 0))
+    wait_state(job, EJECUTANDO)
+    assert not dispatcher.cancel(job.id)
+    dispatcher.cancel_all()
+    wait_idle(dispatcher)
+    assert job.state == COMPLETADO # Se esperó el acuse del robot.
+
+def test_cancel_running_with_abort_sends_abort(make_dispatcher):
+    controller = FakeController(delay=1.0)
+    dispatcher = make_dispatcher(controller, timeout=2, abort_command=b"abort\r")
+    job = dispatcher.submit((0, 0))
+    wait_state(job, EJECUTANDO)
+    assert dispatcher.cancel(job.id)
+    wait_idle(dispatcher)
+    assert job.state == CANCELADO
+
+def test_history_keeps_each_job_once():
+    dispatcher = FillDispatcher(ready_token=b"Done") # Sin hilo: los trabajos quedan como se marcan.
+    jobs = []
+    for i in range(3 * HISTORIAL):
+        jobs.append(dispatcher.submit((i, 0), command=b"run x\r"))
+        if i % 3: jobs[-1].state = COMPLETADO # Uno de cada tres queda activo.
+    listed = dispatcher.jobs()
+    ids = [job.id for job in listed]
+    assert len(ids) == len(set(ids))
+    active = [job for job in jobs if job.state == PENDIENTE]
+    assert all(job in listed for job in active)
+    assert dispatcher.pending_count() == len(active)
+    assert ids == sorted(ids)
+    # Se recorta a los últimos HISTORIAL terminados al pasar de 2 * HISTORIAL trabajos.
+    assert sum(job.state == COMPLETADO for job in listed) <= 2 * HISTORIAL
+    assert listed[-1] is jobs[-1]
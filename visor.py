@@ -0,0 +1,78 @@
+# =================================================================================
+# === VISOR DE FRAMES SIN REASIGNACIONES PARA TKINTER ===
+# =================================================================================
+#
+# Cada visor mantiene un único ImageTk.PhotoImage de tamaño fijo y lo actualiza en
+# su lugar con paste(). Los buffers de redimensionado y de color se reservan una
+# sola vez por tamaño, y la imagen PIL comparte memoria con el buffer RGBA de
+# NumPy, así que por frame no se crea ningún objeto de imagen nuevo. Varios
+# paneles (p. ej. imagen real y umbralizada) se componen lado a lado en el mismo
+# buffer y se muestran con un único paste.
+#
+# =================================================================================
+
+import cv2
+import numpy as np
+from PIL import Image, ImageTk
+
+
+class FrameViewer:
+    """Muestra uno o más frames de OpenCV en un Label reutilizando el mismo PhotoImage."""
+
+    def __init__(self, label, panel_width=None, panels=1, gap=0, bg=(0, 0, 0)):
+        # panel_width fijo: cada panel se escala a ese ancho (como display_image).
+        # Sin panel_width: la imagen se ajusta al tamaño del Label, que se toma de los
+        # eventos <Configure> en vez de consultar winfo_width() en cada frame.
+        self.label = label
+        self.panel_width = panel_width
+        self.panels = panels
+        self.gap = gap
+        self.bg = bg
+        self._box = None
+        self._key = None
+        self._rgba = None
+        self._resized = []
+        self._pil = None
+        self._photo = None
+        if panel_width is None:
+            label.bind("<Configure>", self._on_configure, add="+")
+
+    def _on_configure(self, event):
+        self._box = (event.width, event.height)
+
+    def _panel_size(self, h, w):
+        if self.panel_width is not None:
+            return self.panel_width, max(1, int(h * self.panel_width / float(w)))
+        if self._box is None or self._box[0] <= 1: return None # El Label aún no se dibuja.
+        box_w = self._box[0] - self.gap * (self.panels - 1)
+        ratio = min(box_w / (w * self.panels), self._box[1] / h)
+        return max(1, int(w * ratio)), max(1, int(h * ratio))
+
+    def _allocate(self, key, pw, ph, frames):
+        # Sólo ocurre al cambiar el tamaño del visor o la forma de los frames de entrada.
+        width = pw * self.panels + self.gap * (self.panels - 1)
+        self._rgba = np.empty((ph, width, 4), dtype=np.uint8)
+        self._rgba[:] = (*self.bg, 255)
+        self._resized = [np.empty((ph, pw) + f.shape[2:], dtype=np.uint8) for f in frames]
+        self._pil = Image.frombuffer("RGBA", (width, ph), self._rgba, "raw", "RGBA", 0, 1)
+        self._photo = ImageTk.PhotoImage(image=self._pil)
+        self.label.configure(image=self._photo)
+        self.label.image = self._photo # Guarda una referencia para evitar que el recolector de basura la elimine.
+        self._key = key
+
+    def show(self, *frames):
+        """Dibuja los frames (BGR o escala de grises) en el visor. Retorna False si aún no tiene tamaño."""
+        h, w = frames[0].shape[:2]
+        size = self._panel_size(h, w)
+        if size is None: return False
+        pw, ph = size
+        key = (pw, ph, tuple(f.shape for f in frames))
+        if key != self._key: self._allocate(key, pw, ph, frames)
+
+        for i, frame in enumerate(frames):
+            x = i * (pw + self.gap)
+            cv2.resize(frame, (pw, ph), dst=self._resized[i], interpolation=cv2.INTER_AREA)
+            code = cv2.COLOR_BGR2RGBA if frame.ndim == 3 else cv2.COLOR_GRAY2RGBA
+            cv2.cvtColor(self._resized[i], code, dst=self._rgba[:, x:x + pw])
+        self._photo.paste(self._pil)
+        return True